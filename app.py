@@ -1,33 +1,1158 @@
 # app.py - Complete Single-File Flask Backend with Embedded Frontend
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
+import asyncio
+import bisect
+import contextvars
+import csv
+import functools
+import gzip
+import hmac
+import io
 import json
+import logging
 import os
-from datetime import datetime, timedelta
-from collections import defaultdict
+import random
+import sys
+import hashlib
+import heapq
+import math
+import struct
+import re
+import secrets
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone, date as date_cls
+from collections import defaultdict, deque
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
 import statistics
+import string
 import sqlite3
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait as futures_wait
 from contextlib import contextmanager
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import Headers, MultiDict
+import numpy as np
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend communication
 
 # Database setup
 DATABASE = 'finance_tracker.db'
+# Stored in PRAGMA user_version; bump it with every change to init_db() so existing
+# databases run the DDL and backfills once more, and skip them again afterwards
+SCHEMA_VERSION = 7
+
+# Duplicate detection: rows with the same content hash within this many days
+# of each other are duplicates. Policy is 'reject', 'flag' or 'allow'.
+DUPLICATE_WINDOW_DAYS = 1
+DUPLICATE_POLICY = 'flag'
+DUPLICATE_POLICIES = ('reject', 'flag', 'allow')
+
+# Request and SQL instrumentation
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_log = logging.getLogger('finance_tracker.slow_sql')
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """Collapse whitespace so each SQL statement gets one stable metric label"""
+    return ' '.join(sql.split())[:200]
+
+class Metrics:
+    """In-process counters for routes and SQL statements, rendered as Prometheus text
+
+    Each worker process keeps its own counters; scrape every worker (or sum
+    them) in a multi-process deployment.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sql = contextvars.ContextVar('request_sql', default=None)
+        self.in_flight = 0    # requests currently running in this process
+        self.routes = {}      # (method, route) -> [bucket counts..., sum, count]
+        self.statuses = defaultdict(int)  # (method, route, status) -> count
+        self.route_sql = defaultdict(lambda: [0, 0, 0.0])  # (method, route) -> [queries, rows, seconds]
+        self.statements = defaultdict(lambda: [0, 0, 0.0, 0])  # label -> [calls, rows, seconds, slow]
+        self.gauges = {}      # name -> (help text, callable returning {labels tuple: value})
+
+    # Per-request SQL totals live in a context variable: a WSGI thread and an
+    # ASGI task each get their own, and AsyncAPI.run_db carries it to the executor
+    def begin_request(self):
+        self._sql.set([0, 0, 0.0])
+        with self._lock:
+            self.in_flight += 1
+
+    def end_request(self, method, route, status, elapsed):
+        sql = self._sql.get()
+        self._sql.set(None)
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+        key = (method, route)
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            histogram = self.routes.get(key)
+            if histogram is None:
+                histogram = self.routes[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+            histogram[bucket] += 1
+            histogram[-2] += elapsed
+            histogram[-1] += 1
+            self.statuses[(method, route, status)] += 1
+            if sql is not None:
+                totals = self.route_sql[key]
+                totals[0] += sql[0]
+                totals[1] += sql[1]
+                totals[2] += sql[2]
+
+    def record_query(self, label, elapsed):
+        with self._lock:
+            stats = self.statements[label]
+            stats[0] += 1
+            stats[2] += elapsed
+        sql = self._sql.get()
+        if sql is not None:
+            sql[0] += 1
+            sql[2] += elapsed
+
+    def record_rows(self, label, rows, elapsed):
+        with self._lock:
+            stats = self.statements[label]
+            stats[1] += rows
+            stats[2] += elapsed
+        sql = self._sql.get()
+        if sql is not None:
+            sql[1] += rows
+            sql[2] += elapsed
+
+    def record_slow_query(self, conn, label, sql, parameters, elapsed):
+        with self._lock:
+            self.statements[label][3] += 1
+        try:
+            plan = [
+                row[3] for row in
+                sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+            ]
+        except sqlite3.Error as error:
+            plan = [f"unavailable: {error}"]
+        slow_query_log.warning("slow query %.1f ms: %s | plan: %s", elapsed * 1000, label, '; '.join(plan))
+
+    def register_gauge(self, name, help_text, collect):
+        """Expose a value computed at scrape time; `collect` returns {labels tuple: value}"""
+        self.gauges[name] = (help_text, collect)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        def labels(**values):
+            return ','.join(
+                f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+                for name, value in values.items()
+            )
+
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP http_request_duration_seconds Request latency by route',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (method, route), histogram in sorted(self.routes.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), histogram):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels(method=method, route=route, le=le)}}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels(method=method, route=route)}}} {histogram[-2]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels(method=method, route=route)}}} {histogram[-1]}')
+
+            lines += ['# HELP http_requests_total Requests by route and status', '# TYPE http_requests_total counter']
+            for (method, route, status), count in sorted(self.statuses.items()):
+                lines.append(f'http_requests_total{{{labels(method=method, route=route, status=status)}}} {count}')
+
+            for index, (name, help_text) in enumerate((
+                ('http_request_sql_queries_total', 'SQL statements executed while serving the route'),
+                ('http_request_sql_rows_total', 'Rows fetched while serving the route'),
+                ('http_request_sql_seconds_total', 'Time spent in SQLite while serving the route'),
+            )):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (method, route), totals in sorted(self.route_sql.items()):
+                    value = f'{totals[index]:.6f}' if index == 2 else totals[index]
+                    lines.append(f'{name}{{{labels(method=method, route=route)}}} {value}')
+
+            for index, (name, help_text) in enumerate((
+                ('sql_statement_calls_total', 'Executions per SQL statement'),
+                ('sql_statement_rows_total', 'Rows fetched per SQL statement'),
+                ('sql_statement_seconds_total', 'Execute and fetch time per SQL statement'),
+                ('sql_statement_slow_total', f'Executions slower than {SLOW_QUERY_MS:g} ms'),
+            )):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for label, stats in sorted(self.statements.items()):
+                    value = f'{stats[index]:.6f}' if index == 2 else stats[index]
+                    lines.append(f'{name}{{{labels(statement=label)}}} {value}')
+            gauges = list(self.gauges.items())
+
+        for name, (help_text, collect) in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            for label_values, value in sorted(collect().items()):
+                label_text = labels(**dict(label_values))
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports execute/fetch time and row counts to `metrics`"""
+
+    _label = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._label = label = statement_label(sql)
+            metrics.record_query(label, elapsed)
+            if elapsed * 1000 > SLOW_QUERY_MS:
+                metrics.record_slow_query(self.connection, label, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._label = statement_label(sql)
+            metrics.record_query(self._label, time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        metrics.record_rows(self._label, 0 if row is None else 1, time.perf_counter() - started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        metrics.record_rows(self._label, len(rows), time.perf_counter() - started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        metrics.record_rows(self._label, len(rows), time.perf_counter() - started)
+        return rows
+
+    def __iter__(self):
+        return self._iterate()
+
+    def _iterate(self):
+        count = 0
+        try:
+            for row in iter(super().fetchone, None):
+                count += 1
+                yield row
+        finally:
+            # Iteration time is interleaved with the caller's work, so only rows are counted
+            metrics.record_rows(self._label, count, 0.0)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors are instrumented; used by get_db()"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            metrics.record_query('<script>', time.perf_counter() - started)
+
+# On-demand sampling profiler
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 2))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+
+class StackSampler:
+    """Background thread that samples a request's Python stacks at a fixed interval
+
+    Samples are kept as collapsed stacks ("outer;inner;leaf" -> count), the
+    input format of flamegraph.pl and speedscope. Time inside SQLite shows up
+    as a synthetic [sqlite] frame under the instrumented cursor call. An ASGI
+    request starts with no thread and attaches each executor thread while
+    that thread runs its database work.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_ids = {thread_id} if thread_id is not None else set()
+        self.interval = interval
+        self.samples = defaultdict(int)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    # Copy-on-write so the sampling loop can iterate without holding the lock
+    def attach(self, thread_id):
+        with self._lock:
+            self.thread_ids = self.thread_ids | {thread_id}
+
+    def detach(self, thread_id):
+        with self._lock:
+            self.thread_ids = self.thread_ids - {thread_id}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._sample(frame)
+
+    def _sample(self, frame):
+        stack = []
+        in_sqlite = frame.f_code.co_filename == __file__ and frame.f_code.co_name in (
+            'execute', 'executemany', 'executescript', 'fetchone', 'fetchmany', 'fetchall', '_iterate'
+        )
+        while frame is not None:
+            code = frame.f_code
+            name = getattr(code, 'co_qualname', code.co_name)
+            location = os.path.join(*code.co_filename.split(os.sep)[-2:])
+            stack.append(f"{name} ({location}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        if in_sqlite:
+            stack.append('[sqlite]')
+        self.samples[';'.join(stack)] += 1
+
+class RequestProfiler:
+    """Decides which requests to profile and stores their collapsed-stack artifacts
+
+    Off by default: the per-request check is a float comparison plus a query
+    argument lookup. A request is profiled when an admin passes ?profile=1
+    with the X-Profile-Token header, or when it falls inside the runtime
+    sample rate (optionally limited to some routes).
+    """
+
+    def __init__(self, sample_rate=0.0, routes=None, keep=100):
+        self.sample_rate = sample_rate
+        self.routes = set(routes or ())
+        self.recent = deque(maxlen=keep)
+
+    def is_admin(self, req):
+        token = req.headers.get('X-Profile-Token', '')
+        return bool(PROFILE_TOKEN) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+    def should_profile(self, req, route):
+        if self.sample_rate and random.random() < self.sample_rate:
+            if not self.routes or route in self.routes:
+                return True
+        return req.args.get('profile') == '1' and self.is_admin(req)
+
+    def start(self, thread_id=None):
+        return StackSampler(thread_id, PROFILE_INTERVAL_MS / 1000).start()
+
+    def finish(self, sampler, method, route, elapsed):
+        """Stop sampling and write the profile; returns its id"""
+        samples = sampler.stop()
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(4)}"
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, profile_id + '.collapsed'), 'w') as handle:
+            for stack, count in sorted(samples.items()):
+                handle.write(f"{stack} {count}\n")
+        self.recent.append({
+            "id": profile_id,
+            "method": method,
+            "route": route,
+            "duration_ms": round(elapsed * 1000, 2),
+            "samples": sum(samples.values()),
+            "interval_ms": PROFILE_INTERVAL_MS,
+        })
+        return profile_id
+
+profiler = RequestProfiler(sample_rate=PROFILE_SAMPLE_RATE)
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+    if profiler.should_profile(request, request.url_rule.rule if request.url_rule else None):
+        g.sampler = profiler.start(threading.get_ident())
+
+@app.after_request
+def _record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        elapsed = time.perf_counter() - started
+        metrics.end_request(request.method, route, response.status_code, elapsed)
+        sampler = g.pop('sampler', None)
+        if sampler is not None:
+            response.headers['X-Profile-Id'] = profiler.finish(sampler, request.method, route, elapsed)
+    return response
+
+# Admission control for expensive read routes
+ADMISSION_SLOTS = int(os.environ.get('ADMISSION_SLOTS', 4))
+ADMISSION_MAX_WAIT_MS = float(os.environ.get('ADMISSION_MAX_WAIT_MS', 2000))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 16))
+ADMISSION_STALE_SECONDS = float(os.environ.get('ADMISSION_STALE_SECONDS', 300))
+# route -> (concurrency cap, priority); lower priority values are admitted first.
+# Routes not listed (writes, health checks, cheap reads) are never queued.
+ADMISSION_ROUTES = {
+    '/api/analytics': (2, 1),
+    '/api/ai-advice': (2, 2),
+    '/api/balance-series': (2, 2),
+    '/api/distribution': (2, 2),
+    '/api/duplicates': (1, 3),
+    '/api/simulate': (1, 3),
+    '/api/query': (2, 2),
+}
+
+class _Waiter:
+    __slots__ = ('route', 'wake', 'granted', 'cancelled')
+
+    def __init__(self, route, wake):
+        self.route = route
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+class AdmissionController:
+    """Shared pool of slots for expensive routes with per-route caps and a priority queue
+
+    A request for a listed route takes one of ADMISSION_SLOTS slots, within
+    its route's cap. Otherwise it waits in a priority queue for at most
+    ADMISSION_MAX_WAIT_MS, and is shed at once if ADMISSION_MAX_QUEUE
+    requests are already waiting. Shed GET requests get the route's last good
+    response if it is younger than ADMISSION_STALE_SECONDS, otherwise a 503
+    with Retry-After. Unlisted routes bypass the controller entirely, so
+    writes never queue behind analytics.
+    """
+
+    def __init__(self, routes=None, slots=None, max_wait_ms=None, max_queue=None, stale_seconds=None, cache_size=256):
+        self.routes = dict(ADMISSION_ROUTES if routes is None else routes)
+        self.slots = ADMISSION_SLOTS if slots is None else slots
+        self.max_wait = (ADMISSION_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.max_queue = ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.stale_seconds = ADMISSION_STALE_SECONDS if stale_seconds is None else stale_seconds
+        self._lock = threading.Lock()
+        self._queue = []          # heap of (priority, sequence, waiter)
+        self._sequence = 0
+        self._running = 0
+        self.in_flight = defaultdict(int)
+        self.queued = defaultdict(int)
+        self.shed = defaultdict(int)   # (route, 'stale' | 'rejected') -> count
+        self._cache = {}          # (method, path?query) -> (stored at, status, body, mimetype)
+        self._cache_size = cache_size
+
+    def limited(self, route):
+        return route in self.routes
+
+    def _can_run(self, route):
+        return self._running < self.slots and self.in_flight[route] < self.routes[route][0]
+
+    def _take(self, route):
+        self._running += 1
+        self.in_flight[route] += 1
+
+    def _enqueue(self, route, wake):
+        """Take a slot now (returns None) or queue a waiter; raises OverflowError when the queue is full"""
+        with self._lock:
+            if sum(self.queued.values()) >= self.max_queue and not self._can_run(route):
+                raise OverflowError(route)
+            waiter = _Waiter(route, wake)
+            self._sequence += 1
+            heapq.heappush(self._queue, (self.routes[route][1], self._sequence, waiter))
+            self.queued[route] += 1
+            # Admits the newcomer directly unless higher-priority requests are waiting
+            self._grant()
+            return None if waiter.granted else waiter
+
+    def _abandon(self, waiter):
+        """Timed-out waiter: True if it was granted a slot just before giving up"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.queued[waiter.route] -= 1
+            return False
+
+    def release(self, route):
+        with self._lock:
+            self._running -= 1
+            self.in_flight[route] -= 1
+            self._grant()
+
+    def _grant(self):
+        # Highest priority first; a waiter whose route is at its cap lets later ones through
+        skipped = []
+        while self._queue and self._running < self.slots:
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if waiter.cancelled:
+                continue
+            if not self._can_run(waiter.route):
+                skipped.append(entry)
+                continue
+            self._take(waiter.route)
+            self.queued[waiter.route] -= 1
+            waiter.granted = True
+            waiter.wake()
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def acquire(self, route):
+        """Block for a slot; False when the request should be shed"""
+        event = threading.Event()
+        try:
+            waiter = self._enqueue(route, event.set)
+        except OverflowError:
+            return False
+        if waiter is None or event.wait(self.max_wait):
+            return True
+        return self._abandon(waiter)
+
+    async def acquire_async(self, route):
+        """Event-loop version of acquire"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            waiter = self._enqueue(route, lambda: loop.call_soon_threadsafe(
+                lambda: future.done() or future.set_result(True)))
+        except OverflowError:
+            return False
+        if waiter is None:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            return self._abandon(waiter)
+
+    def count_shed(self, route, outcome):
+        with self._lock:
+            self.shed[(route, outcome)] += 1
+
+    def remember(self, method, path, status, body, mimetype):
+        """Keep the last good GET response per URL for stale fallbacks"""
+        if method != 'GET' or status != 200:
+            return
+        with self._lock:
+            self._cache.pop((method, path), None)
+            self._cache[(method, path)] = (time.monotonic(), status, body, mimetype)
+            if len(self._cache) > self._cache_size:
+                self._cache.pop(next(iter(self._cache)))
+
+    def stale(self, method, path):
+        """(age seconds, status, body, mimetype) of a usable cached response, or None"""
+        entry = self._cache.get((method, path))
+        if entry is None or time.monotonic() - entry[0] > self.stale_seconds:
+            return None
+        return (time.monotonic() - entry[0],) + entry[1:]
+
+    def retry_after(self, method, route):
+        """Seconds a shed client should wait: mean latency times the queue ahead per slot"""
+        histogram = metrics.routes.get((method, route))
+        mean = histogram[-2] / histogram[-1] if histogram and histogram[-1] else 1.0
+        waiting = sum(self.queued.values()) + 1
+        return max(1, math.ceil(mean * waiting / max(1, self.routes[route][0])))
+
+admission = AdmissionController()
+
+metrics.register_gauge(
+    'admission_in_flight', 'Requests running on an admission-controlled route',
+    lambda: {(('route', route),): count for route, count in admission.in_flight.items()}
+)
+metrics.register_gauge(
+    'admission_queue_depth', 'Requests waiting for an admission slot',
+    lambda: {(('route', route),): count for route, count in admission.queued.items()}
+)
+metrics.register_gauge(
+    'admission_shed_total', 'Requests shed by admission control (stale: served the cached result)',
+    lambda: {(('route', route), ('outcome', outcome)): count for (route, outcome), count in admission.shed.items()}
+)
+
+def _shed_response(method, route, path):
+    """Stale cached result if there is one, else 503 with Retry-After"""
+    cached = admission.stale(method, path)
+    if cached is not None:
+        admission.count_shed(route, 'stale')
+        age, status, body, mimetype = cached
+        response = app.response_class(body, status=status, mimetype=mimetype)
+        response.headers['X-Cache'] = 'stale'
+        response.headers['Age'] = str(int(age))
+        return response
+    admission.count_shed(route, 'rejected')
+    response = jsonify({"success": False, "message": "Server busy, please retry"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(admission.retry_after(method, route))
+    return response
+
+@app.before_request
+def _admit_request():
+    route = request.url_rule.rule if request.url_rule else None
+    if route is None or not admission.limited(route):
+        return None
+    if not admission.acquire(route):
+        return _shed_response(request.method, route, request.full_path)
+    g.admission_route = route
+    return None
+
+@app.after_request
+def _cache_admitted_response(response):
+    if g.get('admission_route') and not response.direct_passthrough:
+        admission.remember(request.method, request.full_path, response.status_code,
+                           response.get_data(), response.mimetype)
+    return response
+
+@app.teardown_request
+def _release_admission(error=None):
+    route = g.pop('admission_route', None)
+    if route is not None:
+        admission.release(route)
 
 @contextmanager
-def get_db():
-    """Database context manager"""
-    conn = sqlite3.connect(DATABASE)
+def get_db(read_only=False):
+    """Database context manager; read_only connections may be served by the replica"""
+    conn = replica.connect() if read_only else None
+    if conn is None:
+        conn = sqlite3.connect(DATABASE, factory=InstrumentedConnection)
     conn.row_factory = sqlite3.Row  # This enables column access by name
     try:
         yield conn
     finally:
+        if not read_only and conn.total_changes:
+            replica.note_write()
         conn.close()
 
-def init_db():
-    """Initialize the database with required tables"""
-    with get_db() as conn:
+# Read replica
+READ_REPLICA = os.environ.get('READ_REPLICA', '0') == '1'
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_REFRESH_SECONDS = float(os.environ.get('REPLICA_REFRESH_SECONDS', 1))
+
+class ReadReplica:
+    """In-memory snapshot of the database for read-only queries
+
+    A background thread copies the primary file into a fresh shared-cache
+    in-memory database with the online backup API, then swaps it in. Readers
+    that still hold the previous snapshot keep it alive until they close, so
+    a refresh never blocks a reader and the primary's writers are only ever
+    held up by the backup's read transaction (none at all in WAL mode).
+
+    Reads fall back to the primary when the snapshot is older than
+    REPLICA_MAX_LAG_SECONDS or when this process has written since the
+    snapshot was taken (read-your-writes).
+    """
+
+    def __init__(self, max_lag=None, interval=None):
+        self.max_lag = REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+        self.interval = REPLICA_REFRESH_SECONDS if interval is None else interval
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snapshot = None      # (uri, anchor connection, taken_at monotonic)
+        self._last_write = 0.0
+        self._source_state = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.last_refresh_seconds = 0.0
+        self.primary_reads = 0
+        self.replica_reads = 0
+
+    def start(self):
+        """Take the first snapshot and keep refreshing it in the background"""
+        if self._thread is not None:
+            return
+        self.enabled = True
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name='read-replica', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.enabled = False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except sqlite3.Error as error:
+                logging.getLogger('finance_tracker.replica').warning("replica refresh failed: %s", error)
+
+    def _primary_state(self):
+        """Cheap change detector: size and mtime of the database and its WAL"""
+        state = []
+        for path in (DATABASE, DATABASE + '-wal'):
+            try:
+                info = os.stat(path)
+                state.append((info.st_size, info.st_mtime_ns))
+            except OSError:
+                state.append(None)
+        return tuple(state)
+
+    def refresh(self):
+        """Copy the primary into a new in-memory snapshot unless nothing changed"""
+        started = time.monotonic()
+        state = self._primary_state()
+        with self._lock:
+            current = self._snapshot
+        if current is not None and state == self._source_state and current[2] >= self._last_write:
+            # Unchanged primary: the existing snapshot is still exact
+            with self._lock:
+                self._snapshot = (current[0], current[1], started)
+            return
+
+        self._generation += 1
+        uri = f"file:finance_replica_{os.getpid()}_{self._generation}?mode=memory&cache=shared"
+        anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        source = sqlite3.connect(DATABASE)
+        try:
+            source.backup(anchor)
+        finally:
+            source.close()
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = (uri, anchor, started)
+            self._source_state = state
+            # Under the lock: a reader is either already connected to the previous
+            # snapshot (keeping it alive) or will open the new one, never a freed one
+            if previous is not None:
+                previous[1].close()
+        self.refreshes += 1
+        self.last_refresh_seconds = time.monotonic() - started
+
+    def note_write(self):
+        """Called after a local write so this process reads its own writes"""
+        self._last_write = time.monotonic()
+
+    def lag(self):
+        with self._lock:
+            snapshot = self._snapshot
+        return time.monotonic() - snapshot[2] if snapshot else None
+
+    def connect(self):
+        """Connection to a fresh enough snapshot, or None to use the primary"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or now - snapshot[2] > self.max_lag or snapshot[2] < self._last_write:
+                self.primary_reads += 1
+                return None
+            self.replica_reads += 1
+            # Opened while the anchor is guaranteed open; refresh() closes anchors under this lock
+            return sqlite3.connect(snapshot[0], uri=True, factory=InstrumentedConnection)
+
+replica = ReadReplica()
+
+metrics.register_gauge(
+    'replica_lag_seconds', 'Age of the read replica snapshot',
+    lambda: {(): round(replica.lag(), 3)} if replica.enabled and replica.lag() is not None else {}
+)
+metrics.register_gauge(
+    'replica_last_refresh_seconds', 'Duration of the last replica backup',
+    lambda: {(): round(replica.last_refresh_seconds, 6)} if replica.enabled else {}
+)
+metrics.register_gauge(
+    'replica_refreshes', 'Snapshots taken since start',
+    lambda: {(): replica.refreshes} if replica.enabled else {}
+)
+metrics.register_gauge(
+    'replica_reads', 'Read-only connections by target',
+    lambda: {(('target', 'replica'),): replica.replica_reads, (('target', 'primary'),): replica.primary_reads}
+    if replica.enabled else {}
+)
+
+
+# Background maintenance: backups, compaction, checkpoints and retention
+MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get('MAINTENANCE_INTERVAL_SECONDS', 300))
+MAINTENANCE_PAUSE_MS = float(os.environ.get('MAINTENANCE_PAUSE_MS', 20))
+MAINTENANCE_MAX_DEFER_MS = float(os.environ.get('MAINTENANCE_MAX_DEFER_MS', 1000))
+MAINTENANCE_PAGES_PER_STEP = int(os.environ.get('MAINTENANCE_PAGES_PER_STEP', 256))
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_SECONDS = float(os.environ.get('BACKUP_INTERVAL_SECONDS', 0))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 7))
+VACUUM_MIN_FREE_PAGES = int(os.environ.get('VACUUM_MIN_FREE_PAGES', 1024))
+# Raw rows older than RETENTION_DAYS move to ARCHIVE_DATABASE (0 keeps everything);
+# monthly per-category totals stay behind in transaction_rollups for offline reporting.
+# Reports that read raw rows lose archived history (see Maintenance.retention).
+RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', 0))
+RETENTION_BATCH = int(os.environ.get('RETENTION_BATCH', 500))
+ARCHIVE_DATABASE = os.environ.get('ARCHIVE_DATABASE', 'finance_archive.db')
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 72))
+CHANGE_LOG_TTL_HOURS = int(os.environ.get('CHANGE_LOG_TTL_HOURS', 168))
+# Advice digests for every account are rebuilt every ADVICE_DIGEST_INTERVAL_SECONDS (0 disables)
+ADVICE_DIGEST_INTERVAL_SECONDS = float(os.environ.get('ADVICE_DIGEST_INTERVAL_SECONDS', 0))
+ADVICE_DIGEST_CHUNK_USERS = int(os.environ.get('ADVICE_DIGEST_CHUNK_USERS', 5000))
+
+maintenance_log = logging.getLogger('finance_tracker.maintenance')
+
+class _MaintenanceAborted(Exception):
+    pass
+
+class Maintenance:
+    """Online housekeeping that works in small slices with a pause between each
+
+    Every step (a run of backup pages, an incremental_vacuum slice, a retention
+    batch) is short, and between steps the task sleeps MAINTENANCE_PAUSE_MS and
+    then waits for this worker to have no requests in flight, for at most
+    MAINTENANCE_MAX_DEFER_MS. Under sustained load the work still finishes,
+    just spread thinner.
+    """
+
+    TASKS = ('checkpoint', 'vacuum', 'backup', 'retention', 'digest', 'postings')
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self.last_run = {}        # task -> (finished unix time, seconds, result)
+        self._last_backup = 0.0
+        self._last_digest = 0.0
+
+    # Scheduling
+    def start(self, interval=None):
+        """Run the schedule in a daemon thread, in at most one worker per host"""
+        interval = MAINTENANCE_INTERVAL_SECONDS if interval is None else interval
+        if self._thread is not None or interval <= 0 or not self._acquire_host_lock():
+            return False
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='maintenance', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def _acquire_host_lock(self):
+        try:
+            import fcntl
+        except ImportError:
+            return True
+        lock_file = open(DATABASE + '.maintenance.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.run_once()
+            except (sqlite3.Error, OSError) as error:
+                maintenance_log.warning("maintenance cycle failed: %s", error)
+
+    def run_once(self, tasks=None):
+        """One maintenance cycle; backups and digests run only when their interval has elapsed"""
+        scheduled = tasks is None
+        results = {}
+        for task in tasks or self.TASKS:
+            if task == 'backup' and scheduled and (
+                    BACKUP_INTERVAL_SECONDS <= 0 or time.time() - self._last_backup < BACKUP_INTERVAL_SECONDS):
+                continue
+            if task == 'digest' and scheduled and (
+                    ADVICE_DIGEST_INTERVAL_SECONDS <= 0
+                    or time.time() - self._last_digest < ADVICE_DIGEST_INTERVAL_SECONDS):
+                continue
+            if task == 'retention' and scheduled and RETENTION_DAYS <= 0 and IDEMPOTENCY_TTL_HOURS <= 0 \
+                    and CHANGE_LOG_TTL_HOURS <= 0 and EXPORT_TTL_HOURS <= 0:
+                continue
+            started = time.perf_counter()
+            results[task] = getattr(self, task)()
+            self.last_run[task] = (time.time(), time.perf_counter() - started, results[task])
+        return results
+
+    def pause(self):
+        """Bounded yield between steps: fixed pause, then wait for in-flight requests to drain"""
+        time.sleep(MAINTENANCE_PAUSE_MS / 1000)
+        deadline = time.monotonic() + MAINTENANCE_MAX_DEFER_MS / 1000
+        while metrics.in_flight > 0 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        if self._stop.is_set():
+            raise _MaintenanceAborted()
+
+    @staticmethod
+    def _connect():
+        # Short busy timeout: maintenance gives way to requests rather than waiting on them
+        return sqlite3.connect(DATABASE, timeout=0.25)
+
+    # Tasks
+    def checkpoint(self):
+        """Copy WAL frames into the database; truncate the WAL when no request is running"""
+        conn = self._connect()
+        try:
+            mode = 'TRUNCATE' if metrics.in_flight == 0 else 'PASSIVE'
+            busy, log_frames, checkpointed = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+            return {'mode': mode, 'busy': bool(busy), 'wal_frames': log_frames, 'checkpointed': checkpointed}
+        finally:
+            conn.close()
+
+    def vacuum(self, pages_per_step=None, min_free_pages=None):
+        """Return free pages to the filesystem a slice at a time (needs auto_vacuum=INCREMENTAL)"""
+        pages_per_step = MAINTENANCE_PAGES_PER_STEP if pages_per_step is None else pages_per_step
+        min_free_pages = VACUUM_MIN_FREE_PAGES if min_free_pages is None else min_free_pages
+        conn = self._connect()
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return {'skipped': 'auto_vacuum is not INCREMENTAL; run `python app.py maintain --enable-incremental-vacuum` once'}
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            released = 0
+            if free < min_free_pages:
+                return {'free_pages': free, 'released': 0}
+            while free > 0:
+                try:
+                    conn.execute(f'PRAGMA incremental_vacuum({pages_per_step})').fetchall()
+                except sqlite3.OperationalError as error:
+                    # A writer holds the lock; try again after the pause
+                    maintenance_log.debug("incremental_vacuum deferred: %s", error)
+                remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                released += free - remaining
+                free = remaining
+                if free:
+                    self.pause()
+            return {'free_pages': free, 'released': released}
+        except _MaintenanceAborted:
+            return {'aborted': True}
+        finally:
+            conn.close()
+
+    def backup(self, directory=None, pages_per_step=None, keep=None, max_restarts=3):
+        """Online copy of the database, pages_per_step pages at a time
+
+        A write from another connection restarts an in-progress backup. After
+        max_restarts the copy is taken in a single step instead, which in WAL
+        mode only holds a read snapshot and never blocks writers.
+        """
+        directory = BACKUP_DIR if directory is None else directory
+        pages_per_step = MAINTENANCE_PAGES_PER_STEP if pages_per_step is None else pages_per_step
+        keep = BACKUP_KEEP if keep is None else keep
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+        target = os.path.join(directory, f"{os.path.splitext(os.path.basename(DATABASE))[0]}-{stamp}.db")
+        partial = target + '.partial'
+        state = {'remaining': None, 'restarts': 0, 'steps': 0}
+
+        def progress(status, remaining, total):
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > max_restarts:
+                    raise _MaintenanceAborted()
+            state['remaining'] = remaining
+            state['steps'] += 1
+            if remaining:
+                self.pause()
+
+        source = self._connect()
+        try:
+            for pages in (pages_per_step, -1):
+                if os.path.exists(partial):
+                    os.remove(partial)
+                destination = sqlite3.connect(partial)
+                try:
+                    source.backup(destination, pages=pages, progress=progress if pages > 0 else None)
+                    break
+                except _MaintenanceAborted:
+                    if self._stop.is_set():
+                        raise
+                finally:
+                    destination.close()
+        except _MaintenanceAborted:
+            if os.path.exists(partial):
+                os.remove(partial)
+            return {'aborted': True}
+        finally:
+            source.close()
+        os.replace(partial, target)
+        self._last_backup = time.time()
+
+        backups = sorted(
+            name for name in os.listdir(directory)
+            if name.endswith('.db') and name.startswith(os.path.splitext(os.path.basename(DATABASE))[0] + '-')
+        )
+        for name in (backups[:-keep] if keep > 0 else []):
+            os.remove(os.path.join(directory, name))
+        return {'path': target, 'steps': state['steps'], 'restarts': state['restarts'], 'bytes': os.path.getsize(target)}
+
+    def retention(self, days=None, batch=None, archive=None):
+        """Move raw rows older than `days` into the archive database, a batch at a time
+
+        Each batch is copied into the archive first (idempotent by id) and then
+        removed from the primary in the same transaction that folds it into
+        transaction_rollups, so an interrupted run never loses or double-counts
+        a row. The app does not read transaction_rollups; it is a record of the
+        archived months for offline reporting.
+
+        Kept per day or month, and so still covering archived rows: the balance
+        series, spending distribution sketches, currency_daily (converted totals
+        while the ledger holds more than one currency) and savings goal progress.
+        Read from raw rows, and so losing them: single-currency summary and
+        analytics totals, transaction lists, exports and delta sync,
+        /api/query, simulator history, recurring detection in a new worker
+        and digests. Archived rows' fingerprints and tags are deleted with them,
+        so duplicate checks and tag filters no longer match them. Keep
+        RETENTION_DAYS beyond the longest window those reports use (365 days
+        of simulator history). Expired idempotency keys, change-log entries
+        and export files are removed first.
+        """
+        days = RETENTION_DAYS if days is None else days
+        batch = RETENTION_BATCH if batch is None else batch
+        archive = ARCHIVE_DATABASE if archive is None else archive
+        moved = 0
+        expired_keys = expired_changes = expired_exports = 0
+        conn = self._connect()
+        try:
+            if IDEMPOTENCY_TTL_HOURS > 0:
+                expired_keys = conn.execute(
+                    "DELETE FROM idempotency_keys WHERE created_date < datetime('now', ?)",
+                    (f'-{IDEMPOTENCY_TTL_HOURS} hours',)
+                ).rowcount
+                conn.commit()
+            if CHANGE_LOG_TTL_HOURS > 0:
+                # Clients older than this re-snapshot instead of syncing a delta
+                expired_changes = conn.execute(
+                    "DELETE FROM change_log WHERE created_date < datetime('now', ?)",
+                    (f'-{CHANGE_LOG_TTL_HOURS} hours',)
+                ).rowcount
+                conn.commit()
+            if EXPORT_TTL_HOURS > 0:
+                expired_exports = ExportJobs.expire(conn, EXPORT_TTL_HOURS)
+            if days <= 0:
+                return {'archived': 0, 'expired_idempotency_keys': expired_keys, 'expired_changes': expired_changes,
+                        'expired_exports': expired_exports}
+
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d')
+            archive_conn = sqlite3.connect(archive)
+            try:
+                archive_conn.execute('''
+                    CREATE TABLE IF NOT EXISTS transactions (
+                        id INTEGER PRIMARY KEY,
+                        amount REAL NOT NULL,
+                        category TEXT NOT NULL,
+                        description TEXT NOT NULL,
+                        type TEXT NOT NULL,
+                        date TIMESTAMP,
+                        user_id INTEGER NOT NULL DEFAULT 1
+                    )
+                ''')
+                add_column(archive_conn, 'transactions', 'user_id', 'INTEGER NOT NULL DEFAULT 1')
+                add_column(archive_conn, 'transactions', 'currency', f"TEXT NOT NULL DEFAULT '{BASE_CURRENCY}'")
+                while True:
+                    rows = conn.execute(
+                        'SELECT id, amount, category, description, type, date, user_id, currency FROM transactions '
+                        'WHERE date < ? ORDER BY id LIMIT ?',
+                        (cutoff, batch)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    archive_conn.executemany(
+                        'INSERT OR IGNORE INTO transactions (id, amount, category, description, type, date, user_id, currency) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        rows
+                    )
+                    archive_conn.commit()
+
+                    ids = [(row[0],) for row in rows]
+                    rollups = defaultdict(lambda: [0.0, 0])
+                    for _, amount, category, _, txn_type, txn_date, _, _ in rows:
+                        totals = rollups[(txn_date[:7], category, txn_type)]
+                        totals[0] += amount
+                        totals[1] += 1
+                    conn.executemany('''
+                        INSERT INTO transaction_rollups (month, category, type, amount, count) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (month, category, type)
+                        DO UPDATE SET amount = amount + excluded.amount, count = count + excluded.count
+                    ''', [(*key, totals[0], totals[1]) for key, totals in rollups.items()])
+                    conn.executemany('DELETE FROM transaction_fingerprints WHERE transaction_id = ?', ids)
+                    conn.executemany('DELETE FROM transaction_tags WHERE transaction_id = ?', ids)
+                    conn.executemany('DELETE FROM transactions WHERE id = ?', ids)
+                    conn.commit()
+                    moved += len(rows)
+                    self.pause()
+            finally:
+                archive_conn.close()
+        except _MaintenanceAborted:
+            pass
+        finally:
+            conn.close()
+        return {'archived': moved, 'cutoff': cutoff, 'expired_idempotency_keys': expired_keys, 'expired_changes': expired_changes,
+                'expired_exports': expired_exports}
+
+    def digest(self, chunk=None):
+        """Rebuild advice_cache for every account, pausing between chunks of users"""
+        chunk = ADVICE_DIGEST_CHUNK_USERS if chunk is None else chunk
+        conn = self._connect()
+        try:
+            result = AdviceDigest.run(conn, chunk, pause=self.pause)
+        except _MaintenanceAborted:
+            return {'aborted': True}
+        finally:
+            conn.close()
+        self._last_digest = time.time()
+        return result
+
+    def postings(self):
+        """Save the tag and merchant id lists so new workers load them instead of rebuilding"""
+        conn = self._connect()
+        try:
+            return dimension_index.save(conn)
+        finally:
+            conn.close()
+
+maintenance = Maintenance()
+
+def _maintenance_gauge(field):
+    return lambda: {(('task', task),): run[field] for task, run in maintenance.last_run.items()}
+
+metrics.register_gauge(
+    'maintenance_last_run_timestamp', 'Unix time the task last finished', _maintenance_gauge(0)
+)
+metrics.register_gauge(
+    'maintenance_last_duration_seconds', 'Wall time of the task\'s last run, pauses included', _maintenance_gauge(1)
+)
+
+def add_column(conn, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN unless the table already has the column"""
+    if column not in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+_schema_lock = threading.Lock()
+_schema_checked = set()  # DATABASE paths this process has seen at SCHEMA_VERSION
+
+def init_db(force=False):
+    """Initialize the database with required tables; returns whether the DDL ran
+
+    A database already at SCHEMA_VERSION costs one PRAGMA read. `force` runs
+    the DDL and backfills anyway, e.g. after rows were bulk-loaded directly.
+    """
+    with _schema_lock, get_db() as conn:
+        stored_version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if not force and stored_version >= SCHEMA_VERSION:
+            _schema_checked.add(DATABASE)
+            return False
+        # Only takes effect on a new database; existing files need one full VACUUM
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        # WAL lets readers in other worker processes proceed while one writes
+        conn.execute('PRAGMA journal_mode=WAL')
         conn.executescript('''
             CREATE TABLE IF NOT EXISTS transactions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,7 +1160,8 @@ def init_db():
                 category TEXT NOT NULL,
                 description TEXT NOT NULL,
                 type TEXT NOT NULL CHECK(type IN ('income', 'expense')),
-                date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                user_id INTEGER NOT NULL DEFAULT 1
             );
             
             CREATE TABLE IF NOT EXISTS budgets (
@@ -50,254 +1176,3921 @@ def init_db():
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT UNIQUE NOT NULL
             );
+            
+            CREATE TABLE IF NOT EXISTS transaction_fingerprints (
+                transaction_id INTEGER PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                duplicate_of INTEGER
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_fingerprints_lookup
+                ON transaction_fingerprints (fingerprint, day);
+            
+            CREATE TABLE IF NOT EXISTS balance_daily (
+                day TEXT PRIMARY KEY,
+                net REAL NOT NULL,
+                closing_balance REAL NOT NULL,
+                transaction_count INTEGER NOT NULL DEFAULT 0
+            );
+            
+            CREATE TABLE IF NOT EXISTS spending_sketches (
+                category TEXT NOT NULL,
+                period TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                sketch BLOB NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (category, period, currency)
+            );
+            
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            
+            CREATE TABLE IF NOT EXISTS change_log (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL CHECK(kind IN ('transaction', 'budget', 'goal', 'category')),
+                ref TEXT NOT NULL,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            
+            CREATE TABLE IF NOT EXISTS transaction_rollups (
+                month TEXT NOT NULL,
+                category TEXT NOT NULL,
+                type TEXT NOT NULL,
+                amount REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (month, category, type)
+            );
+            
+            CREATE TABLE IF NOT EXISTS advice_cache (
+                user_id INTEGER PRIMARY KEY,
+                advice TEXT NOT NULL,
+                generated_date TIMESTAMP NOT NULL
+            );
+            
+            CREATE TABLE IF NOT EXISTS currency_daily (
+                day TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                category TEXT NOT NULL,
+                type TEXT NOT NULL,
+                amount REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (day, currency, category, type)
+            );
+            
+            CREATE TABLE IF NOT EXISTS category_closure (
+                ancestor INTEGER NOT NULL,
+                descendant INTEGER NOT NULL,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (ancestor, descendant)
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_category_closure_descendant
+                ON category_closure (descendant, ancestor);
+            
+            CREATE TABLE IF NOT EXISTS merchants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL
+            );
+            
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL
+            );
+            
+            CREATE TABLE IF NOT EXISTS transaction_tags (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transaction_id INTEGER NOT NULL,
+                tag_id INTEGER NOT NULL,
+                UNIQUE (tag_id, transaction_id)
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_transaction_tags_transaction
+                ON transaction_tags (transaction_id);
+            
+            CREATE TABLE IF NOT EXISTS goals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                target REAL NOT NULL,
+                deadline TEXT,
+                income_share REAL NOT NULL DEFAULT 0,
+                saved REAL NOT NULL DEFAULT 0,
+                start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            
+            CREATE TABLE IF NOT EXISTS goal_categories (
+                goal_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                PRIMARY KEY (goal_id, category)
+            );
+            
+            CREATE TABLE IF NOT EXISTS goal_contributions (
+                goal_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                amount REAL NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (goal_id, day)
+            );
+            
+            CREATE TABLE IF NOT EXISTS dimension_postings (
+                dimension TEXT NOT NULL,
+                key INTEGER NOT NULL,
+                ids BLOB NOT NULL,
+                PRIMARY KEY (dimension, key)
+            );
+            
+            CREATE TABLE IF NOT EXISTS dimension_watermarks (
+                dimension TEXT PRIMARY KEY,
+                through INTEGER NOT NULL
+            );
+            
+            CREATE TABLE IF NOT EXISTS export_jobs (
+                id TEXT PRIMARY KEY,
+                format TEXT NOT NULL,
+                since TEXT,
+                until TEXT,
+                status TEXT NOT NULL CHECK(status IN ('queued', 'running', 'done', 'failed')),
+                rows INTEGER NOT NULL DEFAULT 0,
+                total_rows INTEGER,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                file TEXT,
+                error TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_date TIMESTAMP
+            );
         ''')
+        # Databases created before accounts existed: every row belongs to account 1
+        add_column(conn, 'transactions', 'user_id', 'INTEGER NOT NULL DEFAULT 1')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date)')
+        # Every row without an explicit currency (including those from before currencies) is in BASE_CURRENCY
+        add_column(conn, 'transactions', 'currency', f"TEXT NOT NULL DEFAULT '{BASE_CURRENCY}'")
+        # Partial-day edges of converted range totals
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)')
+        # Category hierarchy: parent_id mirrors the depth-1 rows of category_closure
+        add_column(conn, 'categories', 'parent_id', 'INTEGER REFERENCES categories (id)')
+        # Normalized merchant; rows from before the column get theirs from the description
+        add_column(conn, 'transactions', 'merchant_id', 'INTEGER REFERENCES merchants (id)')
+        # Logs from before goals and category moves allow fewer kinds; SQLite cannot alter
+        # a CHECK, so the table is rebuilt once with the same versions and sequence
+        change_log = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'change_log'").fetchone()[0]
+        if "'category'" not in change_log:
+            version = SQLiteStorage._version(conn)
+            conn.execute('ALTER TABLE change_log RENAME TO change_log_before_categories')
+            conn.execute(re.sub(r"kind IN \([^)]*\)", "kind IN ('transaction', 'budget', 'goal', 'category')", change_log))
+            conn.execute('INSERT INTO change_log SELECT * FROM change_log_before_categories')
+            conn.execute('DROP TABLE change_log_before_categories')
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'change_log'")
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (version,))
+        # Sketches from before currencies mixed every currency's amounts; they are kept per
+        # currency now. Existing ones are all BASE_CURRENCY unless the ledger holds others,
+        # in which case they are rebuilt from the rows still in the ledger
+        sketches = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'spending_sketches'").fetchone()[0]
+        if 'currency' not in sketches:
+            conn.execute('ALTER TABLE spending_sketches RENAME TO spending_sketches_before_currencies')
+            conn.execute(sketches.replace('sketch BLOB', 'currency TEXT NOT NULL,\n                sketch BLOB')
+                         .replace('(category, period)', '(category, period, currency)'))
+            conn.execute(
+                'INSERT INTO spending_sketches (category, period, currency, sketch, count) '
+                'SELECT category, period, ?, sketch, count FROM spending_sketches_before_currencies',
+                (BASE_CURRENCY,)
+            )
+            conn.execute('DROP TABLE spending_sketches_before_currencies')
+            if conn.execute('SELECT 1 FROM transactions WHERE currency != ? LIMIT 1', (BASE_CURRENCY,)).fetchone():
+                SpendingDistribution.backfill(conn, force=True)
         
         # Insert default categories
         default_categories = ['Food', 'Transportation', 'Entertainment', 'Utilities', 'Healthcare', 'Shopping', 'Other']
         for category in default_categories:
             conn.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (category,))
+        CategoryTree.backfill(conn)
         
+        # Fingerprints before version 5 left out the currency
+        DuplicateIndex.backfill(conn, rehash=stored_version < 5)
+        BalanceSeries.backfill(conn)
+        SpendingDistribution.backfill(conn)
+        ConvertedRollups.backfill(conn)
+        DimensionIndex.backfill(conn)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
+    _schema_checked.add(DATABASE)
+    return True
+
+def normalize_timestamp(value):
+    """Convert a client-supplied date into the 'YYYY-MM-DD HH:MM:SS' form SQLite stores"""
+    if not value:
+        # Same clock as the column's CURRENT_TIMESTAMP default
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+_DESCRIPTION_NOISE = re.compile(r'[^a-z ]+')
+
+@lru_cache(maxsize=65536)
+def normalize_description(description):
+    """Collapse a description to a grouping key (case, digits, punctuation and reference numbers removed)"""
+    return ' '.join(_DESCRIPTION_NOISE.sub(' ', description.lower()).split())
+
+# Response encoding for large row lists
+_VALUE_ENCODERS = {str: encode_basestring_ascii, int: int.__repr__, float: float.__repr__}
+
+def _encode_column(values):
+    """JSON text for each value of one column, via one C-level map when the column is uniform"""
+    kinds = set(map(type, values))
+    if len(kinds) == 1:
+        kind = kinds.pop()
+        if kind in _VALUE_ENCODERS and (kind is not float or all(map(math.isfinite, values))):
+            return map(_VALUE_ENCODERS[kind], values)
+    return map(functools.partial(json.dumps, separators=(',', ':')), values)
+
+class RowEncoder:
+    """JSON encoder precompiled for one column layout
+
+    `objects` produces exactly what jsonify gives for the equivalent list of
+    dicts (sorted keys, compact separators) without building the dicts: each
+    column is encoded in one pass and the rows are stitched into a %-template
+    with the keys already in place. `columnar` emits
+    {"columns": [...], "rows": [[...], ...]}, which skips repeating the keys,
+    and `lines` the same objects as JSON Lines.
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self._order = sorted(range(len(self.columns)), key=self.columns.__getitem__)
+        self._template = '{' + ','.join(
+            encode_basestring_ascii(self.columns[index]).replace('%', '%%') + ':%s' for index in self._order
+        ) + '}'
+        self._columns_json = json.dumps(list(self.columns), separators=(',', ':'))
+
+    def _encoded(self, rows):
+        columns = list(zip(*rows))
+        encoded = [_encode_column(columns[index]) for index in self._order]
+        return map(self._template.__mod__, zip(*encoded))
+
+    def objects(self, rows):
+        if not rows:
+            return '[]'
+        return '[' + ','.join(self._encoded(rows)) + ']'
+
+    def lines(self, rows):
+        """One object per line, each newline-terminated"""
+        if not rows:
+            return ''
+        return '\n'.join(self._encoded(rows)) + '\n'
+
+    def columnar(self, rows):
+        return '{"columns":' + self._columns_json + ',"rows":' + json.dumps(rows, separators=(',', ':')) + '}'
+
+    def encode(self, rows, shape='objects'):
+        return self.columnar(rows) if shape == 'columnar' else self.objects(rows)
+
+@lru_cache(maxsize=64)
+def row_encoder(columns):
+    return RowEncoder(columns)
+
+RESPONSE_SHAPES = ('objects', 'columnar')
+
+def rows_response(columns, rows, shape='objects'):
+    """Flask response for a row list in the requested shape"""
+    return app.response_class(row_encoder(tuple(columns)).encode(rows, shape) + '\n', mimetype='application/json')
+
+# Currencies: every transaction keeps the currency it was entered in, and totals
+# are converted into DISPLAY_CURRENCY (or ?currency=) at each day's rate
+BASE_CURRENCY = os.environ.get('BASE_CURRENCY', 'USD')
+DISPLAY_CURRENCY = os.environ.get('DISPLAY_CURRENCY', BASE_CURRENCY)
+# CSV of date,currency,rate rows; rate is the value of one unit in BASE_CURRENCY
+FX_RATES_FILE = os.environ.get('FX_RATES_FILE', 'fx_rates.csv')
+FX_RELOAD_SECONDS = float(os.environ.get('FX_RELOAD_SECONDS', 60))
+
+_EPOCH_DAY = date_cls(1970, 1, 1).toordinal()
+
+def day_numbers(timestamps):
+    """Date ordinals of 'YYYY-MM-DD[ HH:MM:SS]' strings as one numpy array"""
+    return np.array([timestamp[:10] for timestamp in timestamps], dtype='datetime64[D]').astype(np.int64) + _EPOCH_DAY
+
+class FXRates:
+    """Daily exchange rates from FX_RATES_FILE as one dense numpy row per currency
+
+    Row i of the table holds currency i's value in BASE_CURRENCY for every
+    day from the first quote to the last, each quote carried forward over
+    gaps (weekends, holidays) and the earliest one back over the days before
+    it; dates outside the table use its first or last column. Converting any
+    number of (currency, day) pairs is then one fancy-indexing lookup.
+
+    The file is re-read when its size or mtime changes, checked at most every
+    FX_RELOAD_SECONDS, and `version` moves on each reload so caches of
+    converted totals know to rebuild. A missing file leaves only BASE_CURRENCY.
+    """
+
+    def __init__(self, path=FX_RATES_FILE, base=BASE_CURRENCY):
+        self.path = path
+        self.base = base
+        self.version = 0
+        self._file_state = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            info = os.stat(self.path)
+            file_state = (info.st_size, info.st_mtime_ns)
+        except OSError:
+            file_state = None
+        if self.version and file_state == self._file_state:
+            return False
+        
+        quotes = defaultdict(dict)   # currency -> {day ordinal: rate}
+        if file_state is not None:
+            with open(self.path, newline='') as handle:
+                for row in csv.DictReader(handle):
+                    day = date_cls.fromisoformat(row['date'].strip()[:10]).toordinal()
+                    quotes[row['currency'].strip().upper()][day] = float(row['rate'])
+        quotes.pop(self.base, None)
+        quoted_days = [day for series in quotes.values() for day in series]
+        first = min(quoted_days, default=date_cls.today().toordinal())
+        span = max(quoted_days, default=first) - first + 1
+        currencies = (self.base,) + tuple(sorted(quotes))
+        table = np.ones((len(currencies), span))
+        for row, currency in enumerate(currencies[1:], 1):
+            days = np.array(sorted(quotes[currency]))
+            rates = np.array([quotes[currency][day] for day in days.tolist()])
+            # Latest quote on or before each day; days before the first quote take the first
+            latest = np.searchsorted(days - first, np.arange(span), side='right') - 1
+            table[row] = rates[np.maximum(latest, 0)]
+        # Swapped in as one tuple so a concurrent lookup never mixes two loads
+        self._state = ({currency: code for code, currency in enumerate(currencies)}, first, table)
+        self._file_state = file_state
+        self.version += 1
+        return True
+
+    def refresh(self):
+        """Reload the rates file if it changed; checks at most every FX_RELOAD_SECONDS"""
+        now = time.monotonic()
+        if now - self._checked < FX_RELOAD_SECONDS:
+            return False
+        with self._lock:
+            self._checked = now
+            return self._load()
+
+    @property
+    def currencies(self):
+        return tuple(self._state[0])
+
+    def code(self, currency):
+        """Table row of a currency; ValueError when the rates file does not cover it"""
+        try:
+            return self._state[0][currency]
+        except KeyError:
+            raise ValueError(f"No exchange rates for currency '{currency}'") from None
+
+    def codes(self, currencies):
+        """Table rows for a sequence of currency codes, as a numpy array"""
+        return np.fromiter(map(self.code, currencies), dtype=np.intp, count=len(currencies))
+
+    def factors(self, codes, days, display):
+        """Multipliers taking amounts in currency rows `codes` on day ordinals `days` into `display`"""
+        lookup, first, table = self._state
+        if display not in lookup:
+            raise ValueError(f"No exchange rates for currency '{display}'")
+        columns = np.clip(np.asarray(days) - first, 0, table.shape[1] - 1)
+        return table[np.asarray(codes), columns] / table[lookup[display], columns]
+
+fx_rates = FXRates()
+
+metrics.register_gauge(
+    'fx_rates_version', 'Times the FX rates file has been loaded', lambda: {(): fx_rates.version}
+)
+
+class ConvertedRollups:
+    """Per-day totals in one display currency, cached in-process
+
+    currency_daily holds native-currency sums per (day, currency, category,
+    type), kept by the write path like balance_daily. This cache holds them
+    converted as a dense [day, category, type] cube with running sums over
+    days, so any run of whole days is one subtraction; the partial days at
+    either end of a range are summed from raw rows. Rows written since the
+    cube was built (by any process) are read through the change log,
+    converted and added in place. The cube is rebuilt only when the FX rates
+    reload, or when the log can no longer account for the new rows.
+    """
+
+    TYPES = ('expense', 'income')
+    HEADROOM_DAYS = 31   # room past today so new rows land inside the cube
+
+    def __init__(self, display):
+        self.display = display
+        self.currencies = frozenset()   # currencies present in the ledger
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._fx_version = None
+        self._ledger_version = None
+        self._cube = None
+        self._state = None   # (first day, category codes, running sums, running counts)
+
+    @staticmethod
+    def backfill(conn, force=False):
+        """Build currency_daily from the full history if it has not been built yet"""
+        if not force and conn.execute('SELECT 1 FROM currency_daily LIMIT 1').fetchone():
+            return
+        conn.execute('DELETE FROM currency_daily')
+        conn.execute('''
+            INSERT INTO currency_daily (day, currency, category, type, amount, count)
+            SELECT substr(date, 1, 10), currency, category, type, SUM(amount), COUNT(*)
+            FROM transactions
+            GROUP BY 1, 2, 3, 4
+        ''')
+
+    @staticmethod
+    def apply(conn, timestamp, currency, category, transaction_type, amount):
+        """Fold one inserted transaction into currency_daily"""
+        conn.execute('''
+            INSERT INTO currency_daily (day, currency, category, type, amount, count) VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (day, currency, category, type)
+            DO UPDATE SET amount = amount + excluded.amount, count = count + 1
+        ''', (timestamp[:10], currency, category, transaction_type, float(amount)))
+
+    def sync(self, conn):
+        """Bring the cube up to the ledger version `conn` sees; call inside one read transaction"""
+        fx_rates.refresh()
+        with self._lock:
+            version = SQLiteStorage._version(conn)
+            if self._cube is None or self._fx_version != fx_rates.version:
+                self._build(conn, version)
+            elif version > self._ledger_version:
+                oldest = conn.execute('SELECT MIN(version) FROM change_log').fetchone()[0] or version + 1
+                rows = conn.execute('''
+                    SELECT t.date, t.currency, t.category, t.type, t.amount, 1
+                    FROM change_log c JOIN transactions t ON t.id = CAST(c.ref AS INTEGER)
+                    WHERE c.kind = 'transaction' AND c.version > ? AND c.version <= ?
+                ''', (self._ledger_version, version)).fetchall()
+                if self._ledger_version + 1 < oldest or not self._add(rows):
+                    self._build(conn, version)
+                self._ledger_version = version
+
+    @property
+    def ledger_version(self):
+        """Change-log version the cube was last synced to (None before the first sync)"""
+        return self._ledger_version
+
+    def _build(self, conn, version):
+        rows = conn.execute('SELECT day, currency, category, type, amount, count FROM currency_daily').fetchall()
+        today = date_cls.today().toordinal()
+        days = day_numbers([row[0] for row in rows]) if rows else np.zeros(0, dtype=np.int64)
+        first = int(min(days.min(), today)) if rows else today
+        last = int(max(days.max(), today)) if rows else today
+        categories = sorted({row[2] for row in rows})
+        self._cube = (
+            np.zeros((last - first + 1 + self.HEADROOM_DAYS, len(categories), 2)),
+            np.zeros((last - first + 1 + self.HEADROOM_DAYS, len(categories), 2), dtype=np.int64),
+        )
+        self._state = (first, {category: code for code, category in enumerate(categories)}, None, None)
+        self.currencies = frozenset()
+        self._add(rows)
+        self._fx_version = fx_rates.version
+        self._ledger_version = version
+        self.rebuilds += 1
+
+    def _add(self, rows):
+        """Convert (date, currency, category, type, amount, count) rows into the cube; False if they do not fit"""
+        first, categories, _, _ = self._state
+        sums, counts = self._cube
+        if rows:
+            stamps, currencies, row_categories, types, amounts, row_counts = zip(*rows)
+            if not set(row_categories) <= categories.keys():
+                return False
+            days = day_numbers(stamps)
+            index = days - first
+            if index.min() < 0 or index.max() >= len(sums):
+                return False
+            position = (
+                index,
+                np.fromiter(map(categories.__getitem__, row_categories), dtype=np.intp, count=len(rows)),
+                (np.array(types) == 'income').astype(np.intp),
+            )
+            values = np.array(amounts, dtype=float) * fx_rates.factors(fx_rates.codes(currencies), days, self.display)
+            np.add.at(sums, position, values)
+            np.add.at(counts, position, np.array(row_counts, dtype=np.int64))
+            self.currencies |= frozenset(currencies)
+        zero = np.zeros((1,) + sums.shape[1:])
+        self._state = (first, categories, np.concatenate([zero, sums.cumsum(axis=0)]),
+                       np.concatenate([zero.astype(np.int64), counts.cumsum(axis=0)]))
+        return True
+
+    def daily(self):
+        """(first day ordinal, net change per day, row count per day) over the cube; call after sync"""
+        first, _, running_sums, running_counts = self._state
+        sums = np.diff(running_sums, axis=0)
+        net = sums[:, :, self.TYPES.index('income')].sum(axis=1) - sums[:, :, self.TYPES.index('expense')].sum(axis=1)
+        return first, net, np.diff(running_counts, axis=0).sum(axis=(1, 2))
+
+    def totals(self, conn, group_by, since, until, transaction_type):
+        """Converted equivalent of SQLiteStorage.aggregate over the same range; call after sync"""
+        first, categories, running_sums, running_counts = self._state
+        since = normalize_timestamp(since) if since is not None else None
+        until = normalize_timestamp(until) if until is not None else None
+        # Whole days [start, end) come from the cube, partial days at either end from raw rows
+        start = first if since is None else date_cls.fromisoformat(since[:10]).toordinal() + (since[11:] != '00:00:00')
+        end = first + len(running_sums) - 1 if until is None else date_cls.fromisoformat(until[:10]).toordinal()
+        if start >= end:
+            edges = [(since, until)]
+            start = end = first
+        else:
+            edges = []
+            if since is not None and since[11:] != '00:00:00':
+                edges.append((since, date_cls.fromordinal(start).isoformat() + ' 00:00:00'))
+            if until is not None and until[11:] != '00:00:00':
+                edges.append((until[:10] + ' 00:00:00', until))
+        low, high = (min(max(day - first, 0), len(running_sums) - 1) for day in (start, end))
+        sums = running_sums[high] - running_sums[low]
+        counts = running_counts[high] - running_counts[low]
+        if transaction_type is not None:
+            kind = self.TYPES.index(transaction_type)
+            sums, counts = sums[:, kind:kind + 1], counts[:, kind:kind + 1]
+            types = (transaction_type,)
+        else:
+            types = self.TYPES
+        
+        totals = defaultdict(float)
+        for category, code in categories.items():
+            for column, kind in enumerate(types):
+                if counts[code, column]:
+                    totals[(category, kind)] += sums[code, column]
+        for edge_since, edge_until in edges:
+            where, params = SQLiteStorage._where(edge_since, edge_until, transaction_type)
+            rows = conn.execute(
+                f'SELECT category, type, currency, substr(date, 1, 10), SUM(amount) FROM transactions{where} '
+                'GROUP BY 1, 2, 3, 4', params
+            ).fetchall()
+            if rows:
+                row_categories, row_types, currencies, days, amounts = zip(*rows)
+                values = np.array(amounts, dtype=float) * fx_rates.factors(
+                    fx_rates.codes(currencies), day_numbers(days), self.display
+                )
+                for category, kind, value in zip(row_categories, row_types, values.tolist()):
+                    totals[(category, kind)] += value
+        
+        if group_by is None:
+            return float(sum(totals.values())) if totals else 0
+        grouped = defaultdict(float)
+        for (category, kind), value in totals.items():
+            grouped[category if group_by == 'category' else kind] += float(value)
+        return dict(sorted(grouped.items()))
+
+metrics.register_gauge(
+    'converted_rollups_rebuilds', 'Full rebuilds of the converted per-day totals by display currency',
+    lambda: {(('currency', currency),): rollups.rebuilds for currency, rollups in storage.converted.items()}
+    if isinstance(storage, SQLiteStorage) else {}
+)
+
+class CategoryTree:
+    """Category hierarchy ("Food > Groceries") as a closure table
+
+    category_closure holds one (ancestor, descendant, depth) row for every
+    pair of a category and a category in its subtree, itself included at
+    depth 0, so "everything under Food" is one indexed lookup and moving a
+    subtree is two set-based statements. Transactions keep their category
+    name; a name missing from the categories table is a root of its own.
+
+    Subtree totals fold the per-category totals the storage backend already
+    maintains through a 0/1 membership matrix read from the closure table:
+    one query and one matrix product for any number of nodes, with no walk
+    over the tree in Python.
+    """
+
+    @staticmethod
+    def backfill(conn):
+        """Give every category its depth-0 row (categories from before the hierarchy are roots)"""
+        conn.execute('''
+            INSERT OR IGNORE INTO category_closure (ancestor, descendant, depth)
+            SELECT id, id, 0 FROM categories
+        ''')
+
+    @staticmethod
+    def _ensure(conn, name):
+        """Id of category `name`, creating it as a root if needed"""
+        conn.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (name,))
+        category_id = conn.execute('SELECT id FROM categories WHERE name = ?', (name,)).fetchone()[0]
+        conn.execute('INSERT OR IGNORE INTO category_closure (ancestor, descendant, depth) VALUES (?, ?, 0)',
+                     (category_id, category_id))
+        return category_id
+
+    @staticmethod
+    def place(conn, name, parent=None):
+        """Create `name` under `parent` (None for a root), or move it there with its whole subtree"""
+        if name == parent:
+            raise ValueError(f"Category '{name}' cannot be its own parent")
+        conn.execute('BEGIN IMMEDIATE')   # moves read the closure they rewrite
+        try:
+            node = CategoryTree._ensure(conn, name)
+            parent_id = CategoryTree._ensure(conn, parent) if parent else None
+            if parent_id is not None and conn.execute(
+                'SELECT 1 FROM category_closure WHERE ancestor = ? AND descendant = ?', (node, parent_id)
+            ).fetchone():
+                raise ValueError(f"Category '{parent}' is inside '{name}'")
+            # Detach the subtree from its old ancestors, then hang it under every ancestor of the new parent
+            conn.execute('''
+                DELETE FROM category_closure
+                WHERE descendant IN (SELECT descendant FROM category_closure WHERE ancestor = :node)
+                  AND ancestor NOT IN (SELECT descendant FROM category_closure WHERE ancestor = :node)
+            ''', {"node": node})
+            if parent_id is not None:
+                conn.execute('''
+                    INSERT INTO category_closure (ancestor, descendant, depth)
+                    SELECT above.ancestor, below.descendant, above.depth + below.depth + 1
+                    FROM category_closure AS above, category_closure AS below
+                    WHERE above.descendant = ? AND below.ancestor = ?
+                ''', (parent_id, node))
+            conn.execute('UPDATE categories SET parent_id = ? WHERE id = ?', (parent_id, node))
+            # Subtree totals moved: synced clients and version-keyed caches must refresh
+            conn.execute("INSERT INTO change_log (kind, ref) VALUES ('category', ?)", (name,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def nodes(conn):
+        """Every category as {name, parent, path, depth}, in path order"""
+        ancestors = defaultdict(list)
+        for name, ancestor, depth in conn.execute('''
+            SELECT below.name, above.name, closure.depth
+            FROM category_closure AS closure
+            JOIN categories AS above ON above.id = closure.ancestor
+            JOIN categories AS below ON below.id = closure.descendant
+            ORDER BY closure.depth DESC
+        '''):
+            ancestors[name].append(ancestor)
+        nodes = [
+            {"name": name, "parent": chain[-2] if len(chain) > 1 else None,
+             "path": ' > '.join(chain), "depth": len(chain) - 1}
+            for name, chain in ancestors.items()
+        ]
+        nodes.sort(key=lambda node: node["path"])
+        return nodes
+
+    @staticmethod
+    def membership(conn, categories, nodes):
+        """0/1 matrix [category, node]: 1 where the category lies in the node's subtree"""
+        matrix = np.zeros((len(categories), len(nodes)))
+        if not categories or not nodes:
+            return matrix
+        row = {category: index for index, category in enumerate(categories)}
+        column = {node: index for index, node in enumerate(nodes)}
+        pairs = conn.execute(f'''
+            SELECT above.name, below.name
+            FROM categories AS above
+            JOIN category_closure AS closure ON closure.ancestor = above.id
+            JOIN categories AS below ON below.id = closure.descendant
+            WHERE above.name IN ({",".join("?" * len(column))})
+        ''', list(column)).fetchall()
+        # Names outside the categories table only cover themselves
+        pairs += [(name, name) for name in column if name in row]
+        pairs = [(row[descendant], column[ancestor]) for ancestor, descendant in pairs if descendant in row]
+        if pairs:
+            matrix[tuple(np.array(pairs).T)] = 1.0
+        return matrix
+
+    @staticmethod
+    def subtree_totals(conn, totals, nodes):
+        """{node: sum of `totals` (per-category amounts) over the node's subtree}"""
+        categories = list(totals)
+        flat = np.array([totals[category] for category in categories], dtype=float)
+        summed = flat @ CategoryTree.membership(conn, categories, nodes)
+        return {node: float(value) for node, value in zip(nodes, summed.tolist())}
+
+# Savings goals
+# Days of contributions averaged into the rate that projects completion dates
+GOAL_RATE_DAYS = int(os.environ.get('GOAL_RATE_DAYS', 90))
+DAYS_PER_MONTH = 30.44
+
+class SavingsGoals:
+    """Savings goals whose progress is kept by the write path
+
+    A goal is fed by its linked categories (every transaction in one of them
+    or in a category under it counts in full, such as a "Savings" transfer or
+    "Interest" income) and by `income_share` of every income. Each insert
+    dated on or after a goal's start adds its contribution, converted into
+    DISPLAY_CURRENCY at the day's rate, to goals.saved and to the goal's row
+    for that day in goal_contributions, so progress is never recomputed
+    from history.
+
+    Rolling contribution rates over GOAL_RATE_DAYS (or the goal's age, but at
+    least a month, so one early deposit does not project an absurd date), and
+    the completion dates projected from them, are cached per ledger version
+    and day. A caller
+    that already knows the version, as the advice snapshot does after its
+    totals, gets them without a query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None     # (database, ledger version, today)
+        self._goals = []
+
+    @staticmethod
+    def apply(conn, timestamp, currency, category, transaction_type, amount):
+        """Add one inserted transaction's contribution to the goals it feeds"""
+        shares = conn.execute('''
+            SELECT goals.id,
+                   EXISTS (
+                       SELECT 1 FROM goal_categories AS linked
+                       WHERE linked.goal_id = goals.id AND linked.category IN (
+                           SELECT :category
+                           UNION ALL
+                           SELECT above.name FROM categories AS below
+                           JOIN category_closure AS closure ON closure.descendant = below.id
+                           JOIN categories AS above ON above.id = closure.ancestor
+                           WHERE below.name = :category
+                       )
+                   ) + CASE WHEN :type = 'income' THEN goals.income_share ELSE 0 END
+            FROM goals
+            WHERE goals.start_date <= :timestamp
+        ''', {"category": category, "type": transaction_type, "timestamp": timestamp}).fetchall()
+        shares = [(goal_id, share) for goal_id, share in shares if share]
+        if not shares:
+            return
+        value = float(amount)
+        if currency != DISPLAY_CURRENCY:
+            value *= float(fx_rates.factors(fx_rates.codes([currency]), day_numbers([timestamp]), DISPLAY_CURRENCY)[0])
+        conn.executemany('UPDATE goals SET saved = saved + ? WHERE id = ?',
+                         [(value * share, goal_id) for goal_id, share in shares])
+        conn.executemany('''
+            INSERT INTO goal_contributions (goal_id, day, amount, count) VALUES (?, ?, ?, 1)
+            ON CONFLICT (goal_id, day) DO UPDATE SET amount = amount + excluded.amount, count = count + 1
+        ''', [(goal_id, timestamp[:10], value * share) for goal_id, share in shares])
+
+    @staticmethod
+    def save(conn, name, target, deadline=None, categories=(), income_share=0.0, saved=None):
+        """Create or update the goal called `name`; returns its id
+
+        An existing goal keeps its progress and start unless `saved` is given.
+        """
+        target = float(target)
+        income_share = float(income_share or 0)
+        if target <= 0:
+            raise ValueError("target must be positive")
+        if not 0 <= income_share <= 1:
+            raise ValueError("income_share must be between 0 and 1")
+        if not categories and not income_share:
+            raise ValueError("A goal needs linked categories or an income_share")
+        if deadline:
+            deadline = date_cls.fromisoformat(deadline[:10]).isoformat()
+        try:
+            conn.execute('''
+                INSERT INTO goals (name, target, deadline, income_share, saved) VALUES (?, ?, ?, ?, COALESCE(?, 0))
+                ON CONFLICT (name) DO UPDATE SET
+                    target = excluded.target, deadline = excluded.deadline, income_share = excluded.income_share,
+                    saved = COALESCE(?, saved)
+            ''', (name, target, deadline or None, income_share, saved, saved))
+            goal_id = conn.execute('SELECT id FROM goals WHERE name = ?', (name,)).fetchone()[0]
+            conn.execute('DELETE FROM goal_categories WHERE goal_id = ?', (goal_id,))
+            conn.executemany('INSERT OR IGNORE INTO goal_categories (goal_id, category) VALUES (?, ?)',
+                             [(goal_id, category) for category in categories])
+            # Moves the ledger version, so every worker's cached projections are re-read
+            conn.execute("INSERT INTO change_log (kind, ref) VALUES ('goal', ?)", (name,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return goal_id
+
+    @staticmethod
+    def _project(row, today):
+        """API form of a goal row, with its rolling rate and projected completion date"""
+        goal_id, name, target, saved, deadline, income_share, started, recent, categories = row
+        started = date_cls.fromisoformat(started[:10])
+        daily = recent / min(max((today - started).days + 1, 30), GOAL_RATE_DAYS)
+        remaining = max(target - saved, 0.0)
+        projected = None
+        if not remaining:
+            projected = today
+        elif daily > 0 and remaining / daily < 36525:
+            projected = today + timedelta(days=math.ceil(remaining / daily))
+        goal = {
+            "id": goal_id,
+            "name": name,
+            "target": target,
+            "saved": saved,
+            "remaining": remaining,
+            "progress": saved / target * 100,
+            "categories": sorted(json.loads(categories)),
+            "income_share": income_share,
+            "start_date": started.isoformat(),
+            "deadline": deadline,
+            "monthly_rate": round(daily * DAYS_PER_MONTH, 2),
+            "projected_date": projected.isoformat() if projected else None,
+            "reached": not remaining,
+            "on_track": None,
+            "required_monthly": None,
+        }
+        if deadline:
+            ends = date_cls.fromisoformat(deadline)
+            goal["on_track"] = projected is not None and projected <= ends
+            # Past the deadline, whatever is left is due now
+            goal["required_monthly"] = round(remaining / max((ends - today).days, 1) * DAYS_PER_MONTH, 2) \
+                if ends > today else remaining
+        return goal
+
+    def current(self, version=None):
+        """Every goal with progress and projection, re-read only when the ledger version or the day moves
+
+        With `version` (a ledger version the caller has just read) matching the
+        cache, no query runs. The list is shared; callers must not modify it.
+        """
+        today = date_cls.today()
+        with self._lock:
+            if version is not None and self._key == (DATABASE, version, today):
+                return self._goals
+            with get_db(read_only=True) as conn:
+                conn.execute('BEGIN')   # version and goals from one snapshot
+                key = (DATABASE, SQLiteStorage._version(conn), today)
+                if key != self._key:
+                    rows = conn.execute('''
+                        SELECT goals.id, goals.name, goals.target, goals.saved, goals.deadline, goals.income_share,
+                               goals.start_date,
+                               (SELECT TOTAL(amount) FROM goal_contributions
+                                WHERE goal_id = goals.id AND day >= ?),
+                               (SELECT json_group_array(category) FROM goal_categories WHERE goal_id = goals.id)
+                        FROM goals
+                        ORDER BY goals.id
+                    ''', ((today - timedelta(days=GOAL_RATE_DAYS - 1)).isoformat(),)).fetchall()
+                    self._goals = [self._project(tuple(row), today) for row in rows]
+                    self._key = key
+                conn.rollback()
+            return self._goals
+
+savings_goals = SavingsGoals()
+
+# Tag and merchant filtering
+# Ids per statement when reading the rows a filter matched
+QUERY_ID_BATCH = int(os.environ.get('QUERY_ID_BATCH', 5000))
+# /api/query ?group= -> SQL expression each group is keyed by
+QUERY_GROUPS = {
+    'merchant': 'merchant_id',
+    'tag': 'tag_id',
+    'category': 'category',
+    'month': 'substr(date, 1, 7)',
+    'type': 'type',
+}
+
+class DimensionIndex:
+    """Sorted transaction-id lists per merchant and per tag
+
+    Every transaction has one merchant (named explicitly, or taken from its
+    description) and any number of tags. Each merchant and tag keeps a
+    sorted int64 numpy array of the ids carrying it. A filter such as
+    "tagged tax-deductible at Amazon" becomes an intersection of a few
+    lists. The lists are walked smallest first with binary search, so the
+    cost follows the shortest list rather than the ledger. Only the
+    surviving ids are looked up and summed, in SQL by rowid.
+
+    Lists catch up with rows written by any process through watermarks: the
+    last transactions.id and transaction_tags.id seen, as the recurring
+    detector does. The maintenance task saves them to dimension_postings,
+    delta-encoded and zlib-compressed. A new process loads them there and
+    reads only the rows written after the saved watermarks.
+    """
+
+    # dimension -> rows (watermark, key, transaction id) past a watermark, in watermark order
+    SOURCES = {
+        'merchant': 'SELECT id, merchant_id, id FROM transactions WHERE id > ? AND merchant_id IS NOT NULL ORDER BY id',
+        'tag': 'SELECT id, tag_id, transaction_id FROM transaction_tags WHERE id > ? ORDER BY id',
+    }
+    BATCH_ROWS = 100_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, database):
+        self._database = database
+        self._loaded = False
+        self._postings = {dimension: {} for dimension in self.SOURCES}   # key -> sorted id array
+        self._watermarks = dict.fromkeys(self.SOURCES, 0)
+        self._dirty = {dimension: set() for dimension in self.SOURCES}   # keys changed since the last load or save
+
+    # Write path
+    @staticmethod
+    def backfill(conn):
+        """Give rows from before merchants existed the merchant named by their description"""
+        if not conn.execute('SELECT 1 FROM transactions WHERE merchant_id IS NULL LIMIT 1').fetchone():
+            return
+        conn.create_function('merchant_key', 1, normalize_description, deterministic=True)
+        conn.execute('''
+            INSERT OR IGNORE INTO merchants (key, name)
+            SELECT merchant_key(description), MIN(description) FROM transactions
+            WHERE merchant_id IS NULL
+            GROUP BY 1
+        ''')
+        conn.execute('''
+            UPDATE transactions
+            SET merchant_id = (SELECT id FROM merchants WHERE key = merchant_key(transactions.description))
+            WHERE merchant_id IS NULL
+        ''')
+
+    @staticmethod
+    def merchant(conn, name):
+        """Id of the merchant `name` normalizes to, created on first use"""
+        key = normalize_description(name)
+        conn.execute('INSERT OR IGNORE INTO merchants (key, name) VALUES (?, ?)', (key, name.strip()))
+        return conn.execute('SELECT id FROM merchants WHERE key = ?', (key,)).fetchone()[0]
+
+    @staticmethod
+    def tag(conn, transaction_id, tags):
+        """Attach tags (created on first use) to a transaction; tags it already has are ignored"""
+        names = sorted({tag.strip().lower() for tag in tags})
+        conn.executemany('INSERT OR IGNORE INTO tags (name) VALUES (?)', [(name,) for name in names])
+        conn.execute(f'''
+            INSERT OR IGNORE INTO transaction_tags (transaction_id, tag_id)
+            SELECT ?, id FROM tags WHERE name IN ({",".join("?" * len(names))})
+        ''', [transaction_id, *names])
+
+    # In-memory lists
+    @staticmethod
+    def encode(ids):
+        return zlib.compress(np.diff(ids, prepend=0).astype('<i8').tobytes(), 6)
+
+    @staticmethod
+    def decode(blob):
+        return np.cumsum(np.frombuffer(zlib.decompress(blob), dtype='<i8')).astype(np.int64)
+
+    def _load(self, conn):
+        conn.execute('BEGIN')   # watermarks and lists from one snapshot
+        for dimension, through in conn.execute('SELECT dimension, through FROM dimension_watermarks'):
+            if dimension in self._watermarks:
+                self._watermarks[dimension] = through
+        for dimension, key, blob in conn.execute('SELECT dimension, key, ids FROM dimension_postings'):
+            if dimension in self._postings:
+                self._postings[dimension][key] = self.decode(blob)
+        conn.rollback()
+        self._loaded = True
+
+    def _apply(self, dimension, rows):
+        watermarks, keys, ids = (np.array(column, dtype=np.int64) for column in zip(*rows))
+        order = np.lexsort((ids, keys))
+        keys, ids = keys[order], ids[order]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        postings = self._postings[dimension]
+        for key, added in zip(keys[starts].tolist(), np.split(ids, starts[1:])):
+            existing = postings.get(key)
+            if existing is None or not len(existing):
+                postings[key] = np.unique(added)
+            elif added[0] > existing[-1]:
+                postings[key] = np.concatenate((existing, np.unique(added)))
+            else:
+                # Tags added to older transactions, or rows already in a freshly loaded list
+                postings[key] = np.union1d(existing, added)
+            self._dirty[dimension].add(key)
+        self._watermarks[dimension] = max(self._watermarks[dimension], int(watermarks.max()))
+
+    def refresh(self, conn=None):
+        """Load the saved lists on first use, then fold in rows past the watermarks"""
+        if conn is None:
+            with get_db(read_only=True) as conn:
+                return self.refresh(conn)
+        with self._lock:
+            if self._database != DATABASE:
+                self._reset(DATABASE)
+            if not self._loaded:
+                self._load(conn)
+            for dimension, query in self.SOURCES.items():
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                cursor.execute(query, (self._watermarks[dimension],))
+                while True:
+                    rows = cursor.fetchmany(self.BATCH_ROWS)
+                    if not rows:
+                        break
+                    self._apply(dimension, rows)
+
+    def save(self, conn):
+        """Persist the lists changed since the last load or save, with their watermarks"""
+        self.refresh(conn)
+        with self._lock:
+            rows = [
+                (dimension, key, self.encode(self._postings[dimension][key]))
+                for dimension, keys in self._dirty.items() for key in sorted(keys)
+            ]
+            if not rows:
+                return {'lists': 0, 'bytes': 0}
+            conn.execute('BEGIN IMMEDIATE')
+            saved = dict(conn.execute('SELECT dimension, through FROM dimension_watermarks').fetchall())
+            if any(saved.get(dimension, 0) > through for dimension, through in self._watermarks.items()):
+                # Another process saved a later state; ours would move the watermarks back
+                conn.rollback()
+                return {'skipped': 'a newer index is already saved'}
+            conn.executemany('INSERT OR REPLACE INTO dimension_postings (dimension, key, ids) VALUES (?, ?, ?)', rows)
+            conn.executemany('INSERT OR REPLACE INTO dimension_watermarks (dimension, through) VALUES (?, ?)',
+                             list(self._watermarks.items()))
+            conn.commit()
+            for keys in self._dirty.values():
+                keys.clear()
+            return {'lists': len(rows), 'bytes': sum(len(blob) for _, _, blob in rows), **self._watermarks}
+
+    def matching(self, merchants=(), tags=()):
+        """Sorted ids at any of the `merchants` keys carrying all of the `tags` keys, as of the last refresh
+
+        None when neither is given.
+        """
+        with self._lock:
+            lists = []
+            if merchants:
+                found = [self._postings['merchant'].get(key) for key in merchants]
+                found = [ids for ids in found if ids is not None]
+                lists.append(found[0] if len(found) == 1 else np.unique(np.concatenate(found or [np.zeros(0, np.int64)])))
+            lists += [self._postings['tag'].get(key, np.zeros(0, np.int64)) for key in tags]
+        if not lists:
+            return None
+        lists.sort(key=len)
+        result = lists[0]
+        for other in lists[1:]:
+            if not len(result):
+                break
+            positions = np.minimum(np.searchsorted(other, result), len(other) - 1)
+            result = result[other[positions] == result]
+        return result
+
+    def sizes(self):
+        with self._lock:
+            return {dimension: sum(len(ids) for ids in postings.values()) for dimension, postings in self._postings.items()}
+
+    # Queries
+    def query(self, conn, merchants=(), tags=(), category=None, transaction_type=None, since=None, until=None,
+              group=None, currency=None, limit=0):
+        """Counts and converted totals of the transactions matching every filter, optionally grouped
+
+        Any of the `merchants` names matches, every one of the `tags` must be
+        present and `category` covers its subtree. Amounts are converted into
+        `currency` (default DISPLAY_CURRENCY) at each day's rate.
+        """
+        if group is not None and group not in QUERY_GROUPS:
+            raise ValueError(f"Unknown group '{group}'; expected one of {', '.join(QUERY_GROUPS)}")
+        display = currency or DISPLAY_CURRENCY
+        self.refresh(conn)
+        merchant_keys = [row[0] for row in conn.execute(
+            f'SELECT id FROM merchants WHERE key IN ({",".join("?" * len(merchants))})',
+            [normalize_description(name) for name in merchants]
+        )] if merchants else []
+        tag_names = sorted({tag.strip().lower() for tag in tags})
+        tag_keys = [row[0] for row in conn.execute(
+            f'SELECT id FROM tags WHERE name IN ({",".join("?" * len(tag_names))})', tag_names
+        )] if tag_names else []
+        if len(merchant_keys) < bool(merchants) or len(tag_keys) < len(tag_names):
+            candidates = np.zeros(0, dtype=np.int64)   # an unknown merchant or tag matches nothing
+        else:
+            candidates = self.matching(merchant_keys, tag_keys)
+
+        where, params = SQLiteStorage._where(since, until, transaction_type)
+        clauses = [where[len(' WHERE '):]] if where else []
+        if category is not None:
+            subtree = [name for name, in conn.execute('''
+                SELECT below.name FROM categories AS above
+                JOIN category_closure AS closure ON closure.ancestor = above.id
+                JOIN categories AS below ON below.id = closure.descendant
+                WHERE above.name = ?
+            ''', (category,))] or [category]
+            clauses.append(f'category IN ({",".join("?" * len(subtree))})')
+            params += subtree
+        cursor = conn.cursor()
+        cursor.row_factory = None
+
+        def batches(sql, lead=(), conditions=(), extra=()):
+            """Rows of `sql` (with a {where} slot) over the candidate ids a batch at a time, or once unfiltered
+
+            `lead` binds before the filter, `extra` after it; `conditions` are
+            (clause, params) pairs added to the filter.
+            """
+            base = clauses + [clause for clause, _ in conditions]
+            base_params = params + [value for _, values in conditions for value in values]
+
+            def run(more=(), more_params=()):
+                filters = base + list(more)
+                sql_where = ' WHERE ' + ' AND '.join(filters) if filters else ''
+                return cursor.execute(sql.format(where=sql_where), [*lead, *base_params, *more_params, *extra]).fetchall()
+
+            if candidates is None:
+                return run()
+            rows = []
+            for start in range(0, len(candidates), QUERY_ID_BATCH):
+                batch = candidates[start:start + QUERY_ID_BATCH].tolist()
+                rows += run([f'transactions.id IN ({",".join("?" * len(batch))})'], batch)
+            return rows
+
+        def totals(key):
+            """{key: [count, expenses, income]} in `display`
+
+            Rows already in `display` are summed in one ungrouped pass; rows in
+            other currencies, if the first pass saw any, are summed per day
+            in a second one and converted.
+            """
+            join = ' JOIN transaction_tags ON transaction_tags.transaction_id = transactions.id' if key == 'tag_id' else ''
+            grouped = {}
+            foreign = False
+            for label, count, others, expenses, income in batches(f'''
+                SELECT {key}, COUNT(*), TOTAL(currency != ?),
+                       TOTAL(CASE WHEN currency = ? AND type = 'expense' THEN amount END),
+                       TOTAL(CASE WHEN currency = ? AND type = 'income' THEN amount END)
+                FROM transactions{join}{{where}}{'' if key == 'NULL' else ' GROUP BY 1'}
+            ''', lead=(display,) * 3):
+                if count:
+                    entry = grouped.setdefault(label, [0, 0.0, 0.0])
+                    entry[0] += count
+                    entry[1] += expenses
+                    entry[2] += income
+                    foreign = foreign or others > 0
+            if foreign:
+                labels, types, currencies, days, sums = zip(*batches(f'''
+                    SELECT {key}, type, currency, substr(date, 1, 10), SUM(amount)
+                    FROM transactions{join}{{where}}
+                    GROUP BY 1, 2, 3, 4
+                ''', conditions=[('currency != ?', (display,))]))
+                values = np.array(sums, dtype=float) * fx_rates.factors(
+                    fx_rates.codes(currencies), day_numbers(days), display
+                )
+                for label, kind, value in zip(labels, types, values.tolist()):
+                    grouped[label][1 if kind == 'expense' else 2] += value
+            return grouped
+
+        result = {"currency": display}
+        grouped = totals(QUERY_GROUPS[group]) if group else None
+        # Every row has exactly one key except under tags, where it counts once per tag
+        overall = totals('NULL').get(None) if group in (None, 'tag') else [
+            sum(column) for column in zip(*grouped.values())
+        ]
+        count, expenses, income = overall or (0, 0.0, 0.0)
+        result.update({"count": count, "expenses": expenses, "income": income})
+        if group:
+            names = {}
+            if group in ('merchant', 'tag') and grouped:
+                table = 'merchants' if group == 'merchant' else 'tags'
+                names = dict(conn.execute(
+                    f'SELECT id, name FROM {table} WHERE id IN ({",".join("?" * len(grouped))})', list(grouped)
+                ).fetchall())
+            result["groups"] = dict(sorted((
+                (str(names.get(label, 'unknown') if group in ('merchant', 'tag') else label),
+                 {"count": count, "expenses": expenses, "income": income})
+                for label, (count, expenses, income) in grouped.items()
+            ), key=lambda item: item[0]))
+        if limit:
+            newest = sorted(batches(
+                f'SELECT {", ".join(TRANSACTION_COLUMNS)} FROM transactions{{where}} ORDER BY date DESC, id DESC LIMIT ?',
+                extra=(limit,)
+            ), key=lambda row: (row[5], row[0]), reverse=True)[:limit]
+            result["transactions"] = [dict(zip(TRANSACTION_COLUMNS, row)) for row in newest]
+        return result
+
+dimension_index = DimensionIndex()
+
+metrics.register_gauge(
+    'dimension_index_ids', 'Transaction ids held in the in-memory tag and merchant lists',
+    lambda: {(('dimension', dimension),): count for dimension, count in dimension_index.sizes().items()}
+)
+
+# Ledger storage backends: 'sqlite' (the database file) or 'memory' (ephemeral)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+# Delta sync: clients further behind than this many changes get a full snapshot instead
+CHANGES_MAX = int(os.environ.get('CHANGES_MAX', 500))
+# Transaction fields every backend returns; user_id is an internal partition key for digests
+TRANSACTION_COLUMNS = ('id', 'amount', 'category', 'description', 'type', 'date', 'currency')
+
+class SQLiteStorage:
+    """Ledger storage in the SQLite database file (the default)
+
+    Every backend implements the same operations: insert, scan(_rows),
+    aggregate, set_budget, budgets, place_category, plus version and changes for delta sync
+    and count and stream for exports. Time bounds are datetimes (or stored
+    'YYYY-MM-DD HH:MM:SS' strings) and ranges are half-open, since <= date < until.
+    Duplicate fingerprints, the balance series, spending sketches, merchants,
+    tags and savings goal progress are maintained alongside each insert here,
+    so the analytics built on them only have data with this backend.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self):
+        self.converted = {}   # display currency -> ConvertedRollups
+
+    @staticmethod
+    def _insert(conn, amount, category, description, transaction_type, date, on_duplicate, currency=None,
+                merchant=None, tags=None):
+        """Insert one row through the duplicate index; returns (transaction id or None, duplicate_of)"""
+        currency = currency or BASE_CURRENCY
+        timestamp = normalize_timestamp(date)
+        fingerprint, day = DuplicateIndex.fingerprint(amount, category, description, transaction_type, timestamp, currency)
+        duplicate_of = None
+        if on_duplicate != 'allow':
+            duplicate_of = DuplicateIndex.find(conn, fingerprint, day)
+        if duplicate_of is not None and on_duplicate == 'reject':
+            return None, duplicate_of
+        
+        cursor = conn.execute(
+            'INSERT INTO transactions (amount, category, description, type, date, currency, merchant_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (float(amount), category, description, transaction_type, timestamp, currency,
+             DimensionIndex.merchant(conn, merchant or description))
+        )
+        txn_id = cursor.lastrowid
+        if tags:
+            DimensionIndex.tag(conn, txn_id, tags)
+        conn.execute("INSERT INTO change_log (kind, ref) VALUES ('transaction', ?)", (str(txn_id),))
+        DuplicateIndex.record(conn, txn_id, fingerprint, day, duplicate_of)
+        BalanceSeries.apply(conn, timestamp, amount, transaction_type)
+        ConvertedRollups.apply(conn, timestamp, currency, category, transaction_type, amount)
+        SavingsGoals.apply(conn, timestamp, currency, category, transaction_type, amount)
+        if transaction_type == 'expense':
+            SpendingDistribution.apply(conn, category, timestamp[:7], currency, amount)
+        return txn_id, duplicate_of
+
+    def insert(self, rows, on_duplicate='allow', idempotency_key=None, respond=None):
+        """Insert rows atomically; returns respond([(id or None, duplicate_of), ...])
+
+        With an idempotency key the response is stored with the rows, and a
+        repeated key returns the stored response (marked "replayed") instead.
+        """
+        with get_db() as conn:
+            if idempotency_key:
+                replay = DuplicateIndex.replay(conn, idempotency_key)
+                if replay is not None:
+                    return replay
+            
+            outcomes = [
+                self._insert(conn, row['amount'], row['category'], row['description'], row['type'],
+                             row.get('date'), on_duplicate, row.get('currency') or BASE_CURRENCY,
+                             row.get('merchant'), row.get('tags'))
+                for row in rows
+            ]
+            result = respond(outcomes) if respond else outcomes
+            
+            if idempotency_key and not DuplicateIndex.remember(conn, idempotency_key, result):
+                # A concurrent request with the same key won the race
+                conn.rollback()
+                return DuplicateIndex.replay(conn, idempotency_key)
+            conn.commit()
+            return result
+
+    @staticmethod
+    def _where(since, until, transaction_type):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append('date >= ?')
+            params.append(normalize_timestamp(since))
+        if until is not None:
+            clauses.append('date < ?')
+            params.append(normalize_timestamp(until))
+        if transaction_type is not None:
+            clauses.append('type = ?')
+            params.append(transaction_type)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def scan_rows(self, since=None, until=None, transaction_type=None, limit=None):
+        """(column names, row tuples) for transactions in the range, newest first"""
+        where, params = self._where(since, until, transaction_type)
+        query = f'SELECT {", ".join(TRANSACTION_COLUMNS)} FROM transactions{where} ORDER BY date DESC, id DESC'
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with get_db(read_only=True) as conn:
+            conn.row_factory = None
+            cursor = conn.execute(query, params)
+            rows = cursor.fetchall()
+            return tuple(column[0] for column in cursor.description), rows
+
+    def scan(self, since=None, until=None, transaction_type=None, limit=None):
+        """Transactions in the range as dicts, newest first"""
+        columns, rows = self.scan_rows(since, until, transaction_type, limit)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def count(self, since=None, until=None, transaction_type=None):
+        """Number of transactions in the range"""
+        where, params = self._where(since, until, transaction_type)
+        with get_db(read_only=True) as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM transactions{where}', params).fetchone()[0]
+
+    def stream(self, since=None, until=None, transaction_type=None, batch=5000):
+        """Lists of at most `batch` row tuples (TRANSACTION_COLUMNS), oldest first
+
+        Rows come from one cursor over one read snapshot, walked in date index
+        order, so memory stays at one batch however long the range.
+        """
+        where, params = self._where(since, until, transaction_type)
+        with get_db(read_only=True) as conn:
+            conn.row_factory = None
+            conn.execute('BEGIN')
+            cursor = conn.execute(
+                f'SELECT {", ".join(TRANSACTION_COLUMNS)} FROM transactions INDEXED BY idx_transactions_date{where} '
+                'ORDER BY date, id', params
+            )
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    return
+                yield rows
+
+    def aggregate(self, group_by=None, since=None, until=None, transaction_type=None, currency=None):
+        """SUM(amount) per 'category' or 'type' as a dict, or the plain total when group_by is None
+
+        Amounts are converted into `currency` (default DISPLAY_CURRENCY) at
+        each day's rate. While the ledger holds no other currency the sums
+        run in SQL as before; otherwise they come from ConvertedRollups.
+        """
+        if group_by not in (None, 'category', 'type'):
+            raise ValueError(f"cannot group by {group_by!r}")
+        currency = currency or DISPLAY_CURRENCY
+        fx_rates.code(currency)
+        rollups = self.rollups(currency)
+        where, params = self._where(since, until, transaction_type)
+        with get_db(read_only=True) as conn:
+            conn.execute('BEGIN')  # the rollups and any edge rows read one snapshot
+            rollups.sync(conn)
+            if not rollups.currencies <= {currency}:
+                return rollups.totals(conn, group_by, since, until, transaction_type)
+            if group_by is None:
+                return conn.execute(f'SELECT SUM(amount) FROM transactions{where}', params).fetchone()[0] or 0
+            rows = conn.execute(
+                f'SELECT {group_by}, SUM(amount) FROM transactions{where} GROUP BY {group_by}', params
+            ).fetchall()
+            return {key: total for key, total in rows}
+
+    def rollups(self, currency):
+        """The process's ConvertedRollups for a display currency"""
+        return self.converted.get(currency) or self.converted.setdefault(currency, ConvertedRollups(currency))
+
+    def set_budget(self, category, amount):
+        with get_db() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO budgets (category, amount) VALUES (?, ?)',
+                (category, float(amount))
+            )
+            conn.execute("INSERT INTO change_log (kind, ref) VALUES ('budget', ?)", (category,))
+            conn.commit()
+
+    def budgets(self):
+        with get_db(read_only=True) as conn:
+            return [dict(row) for row in conn.execute('SELECT * FROM budgets').fetchall()]
+
+    def place_category(self, name, parent=None):
+        with get_db() as conn:
+            CategoryTree.place(conn, name, parent)
+
+    @staticmethod
+    def _version(conn):
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        return row[0] if row else 0
+
+    def version(self):
+        """Version of the latest change (0 before the first one)"""
+        with get_db(read_only=True) as conn:
+            return self._version(conn)
+
+    def changes(self, since, limit=None):
+        """(version, transactions, budgets) changed after version `since`, or None
+
+        None means the log cannot answer: the client is ahead of this
+        database, entries it needs were pruned, or more than `limit` changed.
+        Writers are serialized by SQLite, so versions commit in order and a
+        client never skips a change that commits late.
+        """
+        limit = CHANGES_MAX if limit is None else limit
+        with get_db(read_only=True) as conn:
+            conn.execute('BEGIN')  # one read snapshot for all the queries below
+            version = self._version(conn)
+            oldest = conn.execute('SELECT MIN(version) FROM change_log').fetchone()[0] or version + 1
+            if since > version or since + 1 < oldest:
+                return None
+            entries = conn.execute(
+                'SELECT kind, ref FROM change_log WHERE version > ? ORDER BY version LIMIT ?', (since, limit + 1)
+            ).fetchall()
+            if len(entries) > limit:
+                return None
+            
+            ids = [int(ref) for kind, ref in entries if kind == 'transaction']
+            categories = list(dict.fromkeys(ref for kind, ref in entries if kind == 'budget'))
+            transactions = [
+                dict(row) for row in conn.execute(
+                    f'SELECT {", ".join(TRANSACTION_COLUMNS)} FROM transactions WHERE id IN ({",".join("?" * len(ids))}) '
+                    'ORDER BY date DESC, id DESC', ids
+                ).fetchall()
+            ] if ids else []
+            budgets = [
+                dict(row) for row in conn.execute(
+                    f'SELECT * FROM budgets WHERE category IN ({",".join("?" * len(categories))}) ORDER BY id', categories
+                ).fetchall()
+            ] if categories else []
+            return version, transactions, budgets
+
+class MemoryStorage:
+    """Process-local ledger in compact array columns; contents vanish on exit
+
+    Amounts, timestamps (epoch seconds), ids, category and currency codes and
+    types each live in an array.array, so 1M rows take ~32 MB plus the
+    description strings. Range filters and grouped sums run over zero-copy numpy views of
+    those arrays. Rows arriving in date order (the common case) keep the
+    columns sorted and newest-first scans need no sort at all.
+    """
+
+    name = 'memory'
+    TYPES = ('expense', 'income')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = array('q')
+        self._amounts = array('d')
+        self._stamps = array('q')
+        self._categories = array('q')
+        self._types = array('b')
+        self._descriptions = []
+        self._category_names = []
+        self._category_codes = {}
+        self._currencies = array('h')
+        self._currency_names = []
+        self._currency_codes = {}
+        self._in_order = True
+        self._next_id = 1
+        self._fingerprints = defaultdict(list)   # fingerprint -> [(day, id)]
+        self._idempotency = {}
+        self._budgets = {}
+        self._next_budget_id = 1
+        self._version = 0
+        self._change_log = deque(maxlen=100_000)  # (version, kind, ref)
+
+    @classmethod
+    def from_sqlite(cls, database):
+        """Load the ledger and budgets from a SQLite file (for demos and benchmarks)"""
+        storage = cls()
+        conn = sqlite3.connect(database)
+        try:
+            for row in conn.execute(f'SELECT {", ".join(TRANSACTION_COLUMNS)} FROM transactions ORDER BY id'):
+                storage._append(*row)
+            for category, amount, period, created in conn.execute(
+                    'SELECT category, amount, period, created_date FROM budgets ORDER BY id'):
+                storage._put_budget(category, amount, period, created)
+        finally:
+            conn.close()
+        return storage
+
+    @staticmethod
+    def _epoch(value):
+        return int(datetime.fromisoformat(normalize_timestamp(value)).replace(tzinfo=timezone.utc).timestamp())
+
+    def _prepare(self, amount, category, description, transaction_type, timestamp, currency=None):
+        """Validated column values for one row; raises ValueError before anything is stored"""
+        if transaction_type not in self.TYPES:
+            raise ValueError(f"Transaction type must be one of: {', '.join(self.TYPES)}")
+        timestamp = normalize_timestamp(timestamp)
+        return (float(amount), category, description, transaction_type, timestamp, self._epoch(timestamp),
+                currency or BASE_CURRENCY)
+
+    def _append(self, txn_id, amount, category, description, transaction_type, timestamp, currency=None):
+        self._push(txn_id, *self._prepare(amount, category, description, transaction_type, timestamp, currency))
+
+    def _push(self, txn_id, amount, category, description, transaction_type, timestamp, stamp, currency):
+        """Append one prepared row to every column; nothing here can fail halfway"""
+        code = self._category_codes.get(category)
+        if code is None:
+            code = self._category_codes[category] = len(self._category_names)
+            self._category_names.append(category)
+        currency_code = self._currency_codes.get(currency)
+        if currency_code is None:
+            currency_code = self._currency_codes[currency] = len(self._currency_names)
+            self._currency_names.append(currency)
+        if self._stamps and stamp < self._stamps[-1]:
+            self._in_order = False
+        self._ids.append(txn_id)
+        self._amounts.append(amount)
+        self._stamps.append(stamp)
+        self._categories.append(code)
+        self._currencies.append(currency_code)
+        self._types.append(self.TYPES.index(transaction_type))
+        self._descriptions.append(description)
+        fingerprint, day = DuplicateIndex.fingerprint(amount, category, description, transaction_type, timestamp, currency)
+        self._fingerprints[fingerprint].append((day, txn_id))
+        self._next_id = max(self._next_id, txn_id + 1)
+
+    def insert(self, rows, on_duplicate='allow', idempotency_key=None, respond=None):
+        """Same contract as SQLiteStorage.insert"""
+        with self._lock:
+            if idempotency_key and idempotency_key in self._idempotency:
+                result = json.loads(self._idempotency[idempotency_key])
+                result["replayed"] = True
+                return result
+            
+            # Every row is validated before the first is stored, so a batch is all-or-nothing as with SQLite
+            prepared = [
+                self._prepare(row['amount'], row['category'], row['description'], row['type'], row.get('date'),
+                              row.get('currency'))
+                for row in rows
+            ]
+            outcomes = []
+            for values in prepared:
+                amount, category, description, transaction_type, timestamp, _, currency = values
+                duplicate_of = None
+                if on_duplicate != 'allow':
+                    fingerprint, day = DuplicateIndex.fingerprint(amount, category, description, transaction_type,
+                                                                  timestamp, currency)
+                    duplicate_of = next(
+                        (txn_id for seen, txn_id in self._fingerprints.get(fingerprint, ())
+                         if abs(seen - day) <= DUPLICATE_WINDOW_DAYS),
+                        None
+                    )
+                if duplicate_of is not None and on_duplicate == 'reject':
+                    outcomes.append((None, duplicate_of))
+                    continue
+                txn_id = self._next_id
+                self._push(txn_id, *values)
+                self._log('transaction', txn_id)
+                outcomes.append((txn_id, duplicate_of))
+            
+            result = respond(outcomes) if respond else outcomes
+            if idempotency_key:
+                self._idempotency[idempotency_key] = json.dumps(result)
+            return result
+
+    def _mask(self, since, until, transaction_type):
+        """Boolean numpy mask over all rows; call with the lock held"""
+        stamps = np.frombuffer(self._stamps, dtype=np.int64)
+        mask = np.ones(len(stamps), dtype=bool)
+        if since is not None:
+            mask &= stamps >= self._epoch(since)
+        if until is not None:
+            mask &= stamps < self._epoch(until)
+        if transaction_type is not None:
+            mask &= np.frombuffer(self._types, dtype=np.int8) == self.TYPES.index(transaction_type)
+        return mask
+
+    COLUMNS = TRANSACTION_COLUMNS
+
+    def _positions(self, since, until, transaction_type):
+        """Row positions in the range, newest first; call with the lock held"""
+        positions = np.flatnonzero(self._mask(since, until, transaction_type))
+        if self._in_order:
+            return positions[::-1]
+        stamps = np.frombuffer(self._stamps, dtype=np.int64)[positions]
+        ids = np.frombuffer(self._ids, dtype=np.int64)[positions]
+        return positions[np.lexsort((ids, stamps))[::-1]]
+
+    def _rows(self, positions):
+        """Row tuples (COLUMNS) at the given positions; call with the lock held"""
+        ids = np.frombuffer(self._ids, dtype=np.int64)[positions].tolist()
+        amounts = np.frombuffer(self._amounts, dtype=np.float64)[positions].tolist()
+        categories = map(self._category_names.__getitem__, np.frombuffer(self._categories, dtype=np.int64)[positions].tolist())
+        descriptions = map(self._descriptions.__getitem__, positions.tolist())
+        types = map(self.TYPES.__getitem__, np.frombuffer(self._types, dtype=np.int8)[positions].tolist())
+        dates = [
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(stamp))
+            for stamp in np.frombuffer(self._stamps, dtype=np.int64)[positions].tolist()
+        ]
+        currencies = map(self._currency_names.__getitem__, np.frombuffer(self._currencies, dtype=np.int16)[positions].tolist())
+        return list(zip(ids, amounts, categories, descriptions, types, dates, currencies))
+
+    def scan_rows(self, since=None, until=None, transaction_type=None, limit=None):
+        """(column names, row tuples) for transactions in the range, newest first"""
+        with self._lock:
+            if not self._ids:
+                return self.COLUMNS, []
+            positions = self._positions(since, until, transaction_type)
+            if limit:
+                positions = positions[:limit]
+            return self.COLUMNS, self._rows(positions)
+
+    def count(self, since=None, until=None, transaction_type=None):
+        """Number of transactions in the range"""
+        with self._lock:
+            return int(self._mask(since, until, transaction_type).sum()) if self._ids else 0
+
+    def stream(self, since=None, until=None, transaction_type=None, batch=5000):
+        """Same contract as SQLiteStorage.stream; the lock is held per batch, never across a yield"""
+        with self._lock:
+            positions = self._positions(since, until, transaction_type)[::-1] if self._ids else np.zeros(0, dtype=np.intp)
+        for start in range(0, len(positions), batch):
+            with self._lock:
+                rows = self._rows(positions[start:start + batch])
+            yield rows
+
+    def scan(self, since=None, until=None, transaction_type=None, limit=None):
+        """Transactions in the range as dicts, newest first"""
+        columns, rows = self.scan_rows(since, until, transaction_type, limit)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def aggregate(self, group_by=None, since=None, until=None, transaction_type=None, currency=None):
+        """Same contract as SQLiteStorage.aggregate; rows in other currencies are converted in one vectorized pass"""
+        if group_by not in (None, 'category', 'type'):
+            raise ValueError(f"cannot group by {group_by!r}")
+        currency = currency or DISPLAY_CURRENCY
+        fx_rates.code(currency)
+        with self._lock:
+            if not self._ids:
+                return 0 if group_by is None else {}
+            mask = self._mask(since, until, transaction_type)
+            amounts = np.frombuffer(self._amounts, dtype=np.float64)[mask]
+            if self._currency_names != [currency]:
+                fx_rates.refresh()
+                codes = fx_rates.codes(self._currency_names)[np.frombuffer(self._currencies, dtype=np.int16)[mask]]
+                days = np.frombuffer(self._stamps, dtype=np.int64)[mask] // 86400 + _EPOCH_DAY
+                amounts = amounts * fx_rates.factors(codes, days, currency)
+            if group_by is None:
+                return float(amounts.sum()) if len(amounts) else 0
+            if group_by == 'category':
+                codes, names = np.frombuffer(self._categories, dtype=np.int64)[mask], self._category_names
+            else:
+                codes, names = np.frombuffer(self._types, dtype=np.int8)[mask].astype(np.int64), self.TYPES
+            totals = np.bincount(codes, weights=amounts, minlength=len(names))
+            counts = np.bincount(codes, minlength=len(names))
+            return {names[code]: float(totals[code]) for code in np.flatnonzero(counts).tolist()}
+
+    def _put_budget(self, category, amount, period='monthly', created=None):
+        # INSERT OR REPLACE semantics: a replaced budget gets a new id and moves last
+        self._budgets.pop(category, None)
+        self._budgets[category] = {
+            "id": self._next_budget_id,
+            "category": category,
+            "amount": float(amount),
+            "period": period,
+            "created_date": created or normalize_timestamp(None),
+        }
+        self._next_budget_id += 1
+
+    def set_budget(self, category, amount):
+        with self._lock:
+            self._put_budget(category, amount)
+            self._log('budget', category)
+
+    def budgets(self):
+        with self._lock:
+            return [dict(budget) for budget in self._budgets.values()]
+
+    def place_category(self, name, parent=None):
+        """The category tree is kept in the SQLite file for every backend; the move is logged here too"""
+        with get_db() as conn:
+            CategoryTree.place(conn, name, parent)
+        with self._lock:
+            self._log('category', name)
+
+    def _log(self, kind, ref):
+        self._version += 1
+        self._change_log.append((self._version, kind, ref))
+
+    def version(self):
+        return self._version
+
+    def changes(self, since, limit=None):
+        """Same contract as SQLiteStorage.changes"""
+        limit = CHANGES_MAX if limit is None else limit
+        with self._lock:
+            oldest = self._change_log[0][0] if self._change_log else self._version + 1
+            if since > self._version or since + 1 < oldest:
+                return None
+            entries = [(kind, ref) for version, kind, ref in self._change_log if version > since]
+            if len(entries) > limit:
+                return None
+            positions = [bisect.bisect_left(self._ids, ref) for kind, ref in entries if kind == 'transaction']
+            transactions = [
+                dict(zip(self.COLUMNS, (
+                    self._ids[position],
+                    self._amounts[position],
+                    self._category_names[self._categories[position]],
+                    self._descriptions[position],
+                    self.TYPES[self._types[position]],
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self._stamps[position])),
+                    self._currency_names[self._currencies[position]],
+                )))
+                for position in positions
+            ]
+            transactions.sort(key=lambda row: (row['date'], row['id']), reverse=True)
+            categories = {ref for kind, ref in entries if kind == 'budget'}
+            budgets = [dict(budget) for category, budget in self._budgets.items() if category in categories]
+            return self._version, transactions, budgets
+
+STORAGE_BACKENDS = {'sqlite': SQLiteStorage, 'memory': MemoryStorage}
+
+def create_storage(backend=STORAGE_BACKEND):
+    """Instantiate the configured storage backend"""
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"unknown STORAGE_BACKEND {backend!r}; expected one of {', '.join(STORAGE_BACKENDS)}")
+    return STORAGE_BACKENDS[backend]()
+
+storage = create_storage()
+
+class AIFinanceTracker:
+    """Enhanced AI Finance Tracker with database integration"""
+    
+    @staticmethod
+    def add_transaction(amount, category, description, transaction_type, date=None,
+                        on_duplicate=None, idempotency_key=None, currency=None, merchant=None, tags=None):
+        """Add a new transaction to the database (in BASE_CURRENCY unless `currency` is given)
+
+        `merchant` defaults to the description; `tags` is a list of labels.
+        """
+        on_duplicate = DUPLICATE_POLICY if on_duplicate is None else on_duplicate
+        
+        def respond(outcomes):
+            txn_id, duplicate_of = outcomes[0]
+            if txn_id is None:
+                return {
+                    "success": False,
+                    "duplicate_of": duplicate_of,
+                    "message": f"Duplicate {transaction_type} rejected: matches transaction #{duplicate_of}"
+                }
+            amount_text = f"{amount} {currency}" if currency else f"${amount}"
+            result = {"success": True, "id": txn_id, "message": f"{transaction_type.capitalize()} of {amount_text} added successfully!"}
+            if duplicate_of is not None:
+                result["duplicate_of"] = duplicate_of
+                result["message"] += f" (possible duplicate of #{duplicate_of})"
+            return result
+        
+        row = {"amount": amount, "category": category, "description": description, "type": transaction_type,
+               "date": date, "currency": currency, "merchant": merchant, "tags": tags}
+        return storage.insert([row], on_duplicate, idempotency_key, respond)
+    
+    @staticmethod
+    def add_transactions(rows, on_duplicate='reject'):
+        """Add a batch of transactions in one database transaction"""
+        outcomes = storage.insert(rows, on_duplicate)
+        inserted = [txn_id for txn_id, _ in outcomes if txn_id is not None]
+        duplicates = [
+            {"index": index, "id": txn_id, "duplicate_of": duplicate_of}
+            for index, (txn_id, duplicate_of) in enumerate(outcomes)
+            if duplicate_of is not None
+        ]
+        return {
+            "success": True,
+            "inserted": len(inserted),
+            "duplicates": duplicates,
+            "message": f"Imported {len(inserted)} of {len(rows)} transactions ({len(duplicates)} duplicates {'skipped' if on_duplicate == 'reject' else 'flagged'})"
+        }
+    
+    @staticmethod
+    def tag_transaction(transaction_id, tags):
+        """Add tags to an existing transaction"""
+        with get_db() as conn:
+            if not conn.execute('SELECT 1 FROM transactions WHERE id = ?', (transaction_id,)).fetchone():
+                return {"success": False, "message": f"Transaction #{transaction_id} not found"}
+            DimensionIndex.tag(conn, transaction_id, tags)
+            conn.commit()
+        return {"success": True, "message": f"Tagged transaction #{transaction_id}: {', '.join(tags)}"}
+    
+    @staticmethod
+    def query(merchants=(), tags=(), category=None, transaction_type=None, since=None, until=None,
+              group=None, currency=None, limit=0):
+        """Counts and totals of the transactions matching tag, merchant, category, type and date filters"""
+        with get_db(read_only=True) as conn:
+            return dimension_index.query(conn, merchants, tags, category, transaction_type, since, until,
+                                         group, currency, limit)
+    
+    @staticmethod
+    def get_transactions(limit=None, days=None):
+        """Get transactions with optional filters"""
+        since = datetime.now() - timedelta(days=days) if days else None
+        return storage.scan(since=since, limit=limit)
+    
+    @staticmethod
+    def get_transaction_rows(limit=None, days=None):
+        """Same as get_transactions, as (column names, row tuples) for the row encoders"""
+        since = datetime.now() - timedelta(days=days) if days else None
+        return storage.scan_rows(since=since, limit=limit)
+    
+    @staticmethod
+    def set_budget(category, amount):
+        """Set or update budget for a category"""
+        storage.set_budget(category, amount)
+        return {"success": True, "message": f"Budget set: ${amount} for {category}"}
+    
+    @staticmethod
+    def get_budgets():
+        """Get all budgets"""
+        return storage.budgets()
+    
+    @staticmethod
+    def get_categories(days=30, currency=None):
+        """Category tree with each node's own spending and its subtree total for the last N days"""
+        spending = AIFinanceTracker.get_spending_by_category(days, currency)
+        with get_db(read_only=True) as conn:
+            nodes = CategoryTree.nodes(conn)
+            known = {node["name"] for node in nodes}
+            # Categories only ever used on transactions are roots of their own
+            nodes += [
+                {"name": category, "parent": None, "path": category, "depth": 0}
+                for category in spending if category not in known
+            ]
+            totals = CategoryTree.subtree_totals(conn, spending, [node["name"] for node in nodes])
+        for node in nodes:
+            node["spent"] = spending.get(node["name"], 0)
+            node["total"] = totals[node["name"]]
+        nodes.sort(key=lambda node: node["path"])
+        return nodes
+    
+    @staticmethod
+    def set_category_parent(name, parent=None):
+        """Create a category under `parent`, or move an existing one there with everything under it"""
+        storage.place_category(name, parent)
+        if parent:
+            return {"success": True, "message": f"Category {name} placed under {parent}"}
+        return {"success": True, "message": f"Category {name} is now a top-level category"}
+    
+    @staticmethod
+    def get_goals():
+        """Savings goals with progress, rolling contribution rate and projected completion date"""
+        return savings_goals.current()
+    
+    @staticmethod
+    def set_goal(name, target, deadline=None, categories=(), income_share=0.0, saved=None):
+        """Create a savings goal, or update the one with this name"""
+        with get_db() as conn:
+            goal_id = SavingsGoals.save(conn, name, target, deadline, categories, income_share, saved)
+        return {"success": True, "id": goal_id, "message": f"Goal {name} saved: target ${float(target):.2f}"}
+    
+    @staticmethod
+    def get_spending_by_category(days=30, currency=None):
+        """Get spending breakdown by category for the last N days, in `currency` (default DISPLAY_CURRENCY)"""
+        cutoff_date = datetime.now() - timedelta(days=days)
+        return storage.aggregate('category', since=cutoff_date, transaction_type='expense', currency=currency)
+    
+    @staticmethod
+    def get_income_vs_expenses(days=30, currency=None):
+        """Calculate total income vs expenses for the last N days, in `currency` (default DISPLAY_CURRENCY)"""
+        cutoff_date = datetime.now() - timedelta(days=days)
+        totals = storage.aggregate('type', since=cutoff_date, currency=currency)
+        return {"income": totals.get('income', 0), "expenses": totals.get('expense', 0)}
+    
+    @staticmethod
+    def get_budget_status(currency=None):
+        """Check budget status for all categories (budgets are amounts in the display currency)"""
+        spending = AIFinanceTracker.get_spending_by_category(30, currency)
+        budgets = AIFinanceTracker.get_budgets()
+        # A budget on a parent category covers everything under it
+        with get_db(read_only=True) as conn:
+            spending = CategoryTree.subtree_totals(conn, spending, [budget['category'] for budget in budgets])
+        
+        status = {}
+        for budget in budgets:
+            category = budget['category']
+            spent = spending.get(category, 0)
+            budget_amount = budget['amount']
+            percentage_used = (spent / budget_amount) * 100 if budget_amount > 0 else 0
+            
+            status[category] = {
+                "spent": spent,
+                "budget": budget_amount,
+                "remaining": budget_amount - spent,
+                "percentage_used": percentage_used
+            }
+        
+        return status
+    
+    @staticmethod
+    def get_analytics(weeks=4, currency=None):
+        """Weekly spending trend plus category trends"""
+        weekly_data = []
+        now = datetime.now()
+        for week in range(weeks):
+            start_date = now - timedelta(weeks=week+1)
+            end_date = now - timedelta(weeks=week)
+            weekly_data.append({
+                "week": f"Week {weeks-week}",
+                "amount": storage.aggregate(since=start_date, until=end_date, transaction_type='expense', currency=currency)
+            })
+        
+        return {
+            "weekly_spending": weekly_data,
+            "category_trends": AIFinanceTracker.get_spending_by_category(30, currency)
+        }
+    
+    @staticmethod
+    def get_duplicates():
+        """Get groups of existing transactions that look like duplicates of each other"""
+        return DuplicateIndex.report()
+    
+    @staticmethod
+    def get_balance_series(bucket='day', start=None, end=None):
+        """Get the running balance bucketed by day, week, month or year"""
+        return BalanceSeries.series(bucket, start, end)
+    
+    @staticmethod
+    def get_spending_distribution(months=12, category=None, group='category'):
+        """Get median/p90/p99 expense sizes per category (or per month) from quantile sketches"""
+        blobs = SpendingDistribution.sketch_blobs(months, category, group)
+        return analytics_pool.run(_summarize_sketch_blobs, blobs)
+    
+    @staticmethod
+    def simulate_savings(**options):
+        """Run a Monte Carlo projection of balances and savings goals"""
+        return SavingsSimulator.simulate(**options)
+    
+    @staticmethod
+    def get_recurring_charges(active_only=False):
+        """Get detected recurring transactions (subscriptions, bills, salary)"""
+        patterns = recurring_detector.patterns()
+        if active_only:
+            patterns = [pattern for pattern in patterns if pattern["active"]]
+        return patterns
+    
+    @staticmethod
+    def get_summary(currency=None):
+        """Income vs expenses, category spending and budget status for the last 30 days"""
+        return {
+            "currency": currency or DISPLAY_CURRENCY,
+            "income_expenses": AIFinanceTracker.get_income_vs_expenses(30, currency),
+            "spending_by_category": AIFinanceTracker.get_spending_by_category(30, currency),
+            "budget_status": AIFinanceTracker.get_budget_status(currency)
+        }
+    
+    @staticmethod
+    def get_changes(since=None, limit=10):
+        """Delta since a client's version, or a full dashboard snapshot (reset) when it cannot be served
+
+        A delta carries the inserted transactions, the current state of changed
+        budgets and the inserts' contribution to the 30-day summary, converted
+        into DISPLAY_CURRENCY. Whenever the version moved it also carries the
+        full budget status, since a parent budget's spending rolls up its
+        subtree, which the flat per-category delta cannot. Summary windows move with the clock and totals
+        with the FX rates, so clients re-snapshot when window_start changes day
+        or rates_version changes.
+        """
+        window_start = normalize_timestamp(datetime.now() - timedelta(days=30))
+        delta = storage.changes(since) if since is not None else None
+        if delta is not None:
+            version, transactions, budgets = delta
+            income = expenses = 0
+            spending = defaultdict(float)
+            in_window = [row for row in transactions if row['date'] >= window_start]
+            factors = fx_rates.factors(
+                fx_rates.codes([row['currency'] for row in in_window]),
+                day_numbers([row['date'] for row in in_window]),
+                DISPLAY_CURRENCY
+            ).tolist() if in_window else []
+            for row, factor in zip(in_window, factors):
+                amount = row['amount'] * factor
+                if row['type'] == 'income':
+                    income += amount
+                else:
+                    expenses += amount
+                    spending[row['category']] += amount
+            return {
+                "version": version,
+                "reset": False,
+                "window_start": window_start,
+                "rates_version": fx_rates.version,
+                "transactions": transactions,
+                "budgets": budgets,
+                "summary_delta": {"income": income, "expenses": expenses, "spending_by_category": dict(spending)},
+                "budget_status": AIFinanceTracker.get_budget_status() if version != since else None
+            }
+        
+        # Read the version on both sides of the snapshot so it matches the data
+        for _ in range(3):
+            version = storage.version()
+            snapshot = {
+                "summary": AIFinanceTracker.get_summary(),
+                "transactions": AIFinanceTracker.get_transactions(limit=limit),
+                "budgets": AIFinanceTracker.get_budgets()
+            }
+            if storage.version() == version:
+                break
+        return {"version": version, "reset": True, "window_start": window_start, "rates_version": fx_rates.version, **snapshot}
+    
+    @staticmethod
+    def advice_snapshot(sources=None):
+        """What the enabled advice rules read, in compact picklable form (arrays, not row dicts)
+
+        Only the sources some enabled rule needs (advice_engine.sources) are gathered.
+        """
+        sources = advice_engine.sources if sources is None else frozenset(sources)
+        snapshot = {"today": date_cls.today().isoformat(), "sources": sorted(sources)}
+        if 'totals' in sources:
+            income_expenses = AIFinanceTracker.get_income_vs_expenses(30)
+            snapshot["income"] = income_expenses["income"]
+            snapshot["expenses"] = income_expenses["expenses"]
+        if 'categories' in sources:
+            snapshot["spending_by_category"] = AIFinanceTracker.get_spending_by_category(30)
+        if 'budgets' in sources:
+            snapshot["budget_status"] = AIFinanceTracker.get_budget_status()
+        if sources & {'recent', 'sketches'}:
+            columns, rows = AIFinanceTracker.get_transaction_rows(days=7)
+            recent = dict(zip(columns, zip(*rows))) if rows else {column: () for column in columns}
+            expenses = [index for index, kind in enumerate(recent['type']) if kind == 'expense']
+            amounts = np.array([recent['amount'][index] for index in expenses], dtype=float)
+            if expenses:
+                amounts *= fx_rates.factors(
+                    fx_rates.codes([recent['currency'][index] for index in expenses]),
+                    day_numbers([recent['date'][index] for index in expenses]),
+                    DISPLAY_CURRENCY
+                )
+            snapshot["recent_count"] = len(rows)
+            snapshot["expense_amounts"] = array('d', amounts.tolist())
+            snapshot["expense_categories"] = [recent['category'][index] for index in expenses]
+            snapshot["expense_descriptions"] = [recent['description'][index] for index in expenses]
+        if 'recurring' in sources:
+            snapshot["recurring"] = AIFinanceTracker.get_recurring_charges(active_only=True)
+        if 'goals' in sources:
+            # The totals above synced the rollups to the current ledger version; while
+            # it matches the cached goals, they come without a query. Other backends keep no goal progress.
+            if isinstance(storage, SQLiteStorage):
+                rollups = storage.converted.get(DISPLAY_CURRENCY) if 'totals' in sources else None
+                snapshot["goals"] = savings_goals.current(rollups.ledger_version if rollups else None)
+            else:
+                snapshot["goals"] = []
+        if 'sketches' in sources:
+            categories = set(snapshot["expense_categories"])
+            snapshot["sketches"] = {
+                category: blobs for category, blobs in SpendingDistribution.sketch_blobs(12).items()
+                if category in categories
+            }
+        return snapshot
+    
+    @staticmethod
+    def generate_ai_advice():
+        """Generate comprehensive AI-powered financial insights"""
+        # Gathering is I/O on this thread; the rules run in the analytics pool when enabled
+        advice, stats = analytics_pool.run(_evaluate_advice, AIFinanceTracker.advice_snapshot())
+        advice_engine.record(stats)
+        return advice
+    
+    @staticmethod
+    def get_advice_rules():
+        """Enabled advice rules with their inputs, hit counts and evaluation time"""
+        return advice_engine.describe()
+    
+    @staticmethod
+    def get_advice_digest(user_id=1):
+        """(advice JSON text, generated date) from the last digest run for an account, or None"""
+        with get_db(read_only=True) as conn:
+            row = conn.execute(
+                'SELECT advice, generated_date FROM advice_cache WHERE user_id = ?', (user_id,)
+            ).fetchone()
+            return tuple(row) if row else None
+
+# Advice rules
+# A rule fires for an account when `when` holds, or, with a `family`, for each
+# of the account's budgets, recurring charges or recent expenses that matches.
+# `when`, `suggestion_if` and `values` are numpy expressions over the inputs
+# below and the rule's `params`; `message` and `suggestion` are str.format
+# templates over the same names. Advice comes out in rule order.
+ADVICE_RULES_DISABLED = frozenset(filter(None, map(str.strip, os.environ.get('ADVICE_RULES_DISABLED', '').split(','))))
+ADVICE_UPCOMING_DAYS = 7
+
+# Per-account inputs and the snapshot source that provides each one
+ADVICE_INPUTS = {
+    'income': 'totals',
+    'expenses': 'totals',
+    'savings_rate': 'totals',
+    'has_spending': 'categories',
+    'top_category': 'categories',
+    'top_amount': 'categories',
+    'recent_count': 'recent',
+    'upcoming_count': 'recurring',
+    'upcoming_total': 'recurring',
+    'upcoming_names': 'recurring',
+    'advice_count': None,  # advice the earlier rules produced for the account
+}
+
+# Per-item families: (snapshot source, item fields)
+ADVICE_FAMILIES = {
+    'budget': ('budgets', ('category', 'category_lower', 'spent', 'budget', 'remaining', 'used')),
+    'recurring': ('recurring', (
+        'description', 'cadence', 'is_expense', 'price_increase', 'days_since_last',
+        'previous_amount', 'last_amount', 'amount_change',
+    )),
+    'recent_expense': ('sketches', ('category', 'description', 'amount', 'history', 'median', 'p99')),
+    'goal': ('goals', (
+        'goal', 'target', 'saved', 'remaining', 'progress', 'monthly_rate', 'required_monthly',
+        'has_deadline', 'deadline', 'projected', 'reached', 'on_track', 'age_days',
+    )),
+}
+
+ADVICE_RULES = (
+    # Financial health analysis
+    {
+        "name": 'deficit',
+        "when": '(expenses > income) & (income > 0)',
+        "values": {"deficit": 'expenses - income'},
+        "type": 'alert',
+        "icon": '🚨',
+        "message": "ALERT: You're spending ${deficit:.2f} more than you earn this month!",
+        "suggestion": 'Consider reducing discretionary expenses or finding additional income sources.',
+    },
+    {
+        "name": 'surplus',
+        "when": '(income > expenses) & (income > 0)',
+        "values": {"surplus": 'income - expenses'},
+        "type": 'positive',
+        "icon": '🎉',
+        "message": 'Great job! You have a surplus of ${surplus:.2f} this month.',
+        "suggestion": 'Consider saving or investing this extra money for future goals.',
+    },
+    # Budget analysis
+    {
+        "name": 'over_budget',
+        "family": 'budget',
+        "when": 'used > limit',
+        "params": {"limit": 100},
+        "values": {"overspend": 'spent - budget'},
+        "type": 'warning',
+        "icon": '🚨',
+        "message": 'Over budget in {category} by ${overspend:.2f}',
+        "suggestion": "You've used {used:.1f}% of your {category} budget. Consider cutting back on non-essential {category_lower} expenses.",
+    },
+    {
+        "name": 'near_budget',
+        "family": 'budget',
+        "when": '(used > warn) & (used <= limit)',
+        "params": {"warn": 80, "limit": 100},
+        "type": 'caution',
+        "icon": '⚡',
+        "message": 'Close to {category} budget limit ({used:.1f}% used)',
+        "suggestion": 'You have ${remaining:.2f} left in your {category} budget. Plan carefully for the rest of the month.',
+    },
+    # Spending pattern analysis
+    {
+        "name": 'top_category',
+        "when": 'has_spending',
+        "values": {"share": 'top_amount / expenses * 100'},
+        "type": 'info',
+        "icon": '📊',
+        "message": 'Your highest spending category is {top_category} (${top_amount:.2f})',
+        "suggestion": 'This represents {share:.1f}% of your total expenses.',
+        "suggestion_if": 'expenses > 0',
+    },
+    {
+        "name": 'top_category_high',
+        "when": 'has_spending & (income > 0) & (top_amount > income * share)',
+        "params": {"share": 0.3},
+        "type": 'insight',
+        "icon": '💭',
+        "message": 'Your {top_category} spending is high relative to income',
+        "suggestion": 'Consider if {top_amount:.2f} on {top_category} aligns with your financial priorities.',
+    },
+    # Savings recommendations
+    {
+        "name": 'negative_savings',
+        "when": '(income > 0) & (savings_rate < 0)',
+        "type": 'urgent',
+        "icon": '🆘',
+        "message": 'Negative savings rate - spending exceeds income',
+        "suggestion": 'Create an emergency budget focusing only on essential expenses.',
+    },
+    {
+        "name": 'low_savings',
+        "when": '(income > 0) & (savings_rate >= 0) & (savings_rate < target * 100)',
+        "params": {"target": 0.10},
+        "values": {"target_savings": 'income * target'},
+        "type": 'goal',
+        "icon": '💰',
+        "message": 'Current savings rate: {savings_rate:.1f}%',
+        "suggestion": 'Aim to save ${target_savings:.2f} monthly (10% of income) for financial security.',
+    },
+    {
+        "name": 'high_savings',
+        "when": '(income > 0) & (savings_rate >= excellent)',
+        "params": {"excellent": 20},
+        "type": 'excellent',
+        "icon": '🌟',
+        "message": 'Excellent savings rate of {savings_rate:.1f}%!',
+        "suggestion": 'Consider diversifying investments or increasing emergency fund contributions.',
+    },
+    # Savings goals
+    {
+        "name": 'goal_reached',
+        "family": 'goal',
+        "when": 'reached',
+        "type": 'excellent',
+        "icon": '🏆',
+        "message": 'Goal reached: {goal} (${target:.2f})',
+        "suggestion": 'Set a new target, or point its contributions at your next goal.',
+    },
+    {
+        "name": 'goal_behind',
+        "family": 'goal',
+        "when": '~reached & has_deadline & ~on_track & (monthly_rate > 0)',
+        "type": 'caution',
+        "icon": '🎯',
+        "message": '{goal} is behind schedule: at ${monthly_rate:.2f}/month you reach ${target:.2f} around {projected}',
+        "suggestion": 'Save about ${required_monthly:.2f} a month to finish by {deadline}.',
+    },
+    {
+        "name": 'goal_stalled',
+        "family": 'goal',
+        "when": '~reached & (monthly_rate <= 0) & (age_days >= days)',
+        "params": {"days": 30},
+        "type": 'warning',
+        "icon": '⏸️',
+        "message": 'No recent contributions to {goal} ({progress:.0f}% saved)',
+        "suggestion": 'You still need ${remaining:.2f}. Even a small automatic transfer keeps it moving.',
+    },
+    {
+        "name": 'goal_on_track',
+        "family": 'goal',
+        "when": '~reached & (monthly_rate > 0) & (~has_deadline | on_track)',
+        "type": 'positive',
+        "icon": '🎯',
+        "message": '{goal}: {progress:.0f}% of ${target:.2f} saved',
+        "suggestion": 'At ${monthly_rate:.2f} a month you finish around {projected}.',
+    },
+    # Transaction behavior insights
+    {
+        "name": 'busy_week',
+        "when": 'recent_count > limit',
+        "params": {"limit": 20},
+        "values": {"daily_avg": 'recent_count / 7'},
+        "type": 'behavioral',
+        "icon": '📱',
+        "message": 'High transaction frequency: {recent_count} transactions this week',
+        "suggestion": 'Averaging {daily_avg:.1f} transactions per day. Consider consolidating purchases to reduce impulse spending.',
+    },
+    # Recurring charge insights
+    {
+        "name": 'upcoming_charges',
+        "when": 'upcoming_count > 0',
+        "type": 'info',
+        "icon": '📅',
+        "message": '{upcoming_count} recurring charge(s) due in the next 7 days (${upcoming_total:.2f})',
+        "suggestion": 'Upcoming: {upcoming_names}. Make sure your balance covers them.',
+    },
+    {
+        "name": 'price_increase',
+        "family": 'recurring',
+        "when": 'is_expense & price_increase & (days_since_last <= recent_days)',
+        "params": {"recent_days": 45},
+        "type": 'caution',
+        "icon": '📈',
+        "message": 'Price increase: {description} went from ${previous_amount:.2f} to ${last_amount:.2f}',
+        "suggestion": 'This {cadence} charge is now ${amount_change:.2f} more. Check whether it is still worth keeping.',
+    },
+    # Unusually large purchases compared with each category's history
+    {
+        "name": 'unusual_purchase',
+        "family": 'recent_expense',
+        "when": '(history >= min_history) & (amount > p99)',
+        "params": {"min_history": 20},
+        "order": 'amount',
+        "limit": 3,
+        "type": 'caution',
+        "icon": '🔍',
+        "message": 'Unusually large {category} purchase: ${amount:.2f} ({description})',
+        "suggestion": 'That is above 99% of your {category} transactions this year; a typical one is ${median:.2f}.',
+    },
+    # Emergency fund recommendation
+    {
+        "name": 'emergency_fund',
+        "when": 'expenses > 0',
+        "params": {"months": 3},
+        "values": {"fund_target": 'expenses * months'},
+        "type": 'planning',
+        "icon": '🛡️',
+        "message": 'Emergency Fund Recommendation',
+        "suggestion": 'Based on your monthly expenses (${expenses:.2f}), aim for an emergency fund of ${fund_target:.2f} (3 months of expenses).',
+    },
+    # If no specific advice, provide encouragement
+    {
+        "name": 'encouragement',
+        "when": 'advice_count == 0',
+        "type": 'encouragement',
+        "icon": '💡',
+        "message": 'Keep tracking your finances!',
+        "suggestion": "More insights will be available as you add more transaction data. You're building great financial habits!",
+    },
+)
+
+_RULE_GLOBALS = {"__builtins__": {}}
+
+class AdviceEngine:
+    """ADVICE_RULES compiled once into an evaluator over frames of accounts
+
+    A frame holds N accounts' inputs as arrays (one live snapshot is a frame
+    of one; a digest chunk is thousands). Each rule is one numpy mask over
+    the frame and only its hits are formatted. The inputs a rule needs are
+    read off the names its expressions and templates use, so callers gather
+    only the snapshot `sources` the enabled rules need; rules whose sources
+    a frame lacks are skipped. Hit counts and evaluation time are kept per
+    rule; `run` returns them separately so a pool worker's numbers can be
+    recorded in the parent.
+    """
+
+    def __init__(self, rules=None, disabled=None):
+        rules = ADVICE_RULES if rules is None else rules
+        disabled = ADVICE_RULES_DISABLED if disabled is None else disabled
+        self.rules = [self._compile(rule) for rule in rules if rule["name"] not in disabled]
+        self.sources = frozenset().union(*(rule["sources"] for rule in self.rules))
+        self._lock = threading.Lock()
+        self.hits = dict.fromkeys((rule["name"] for rule in self.rules), 0)
+        self.evaluated = dict.fromkeys(self.hits, 0)
+        self.seconds = dict.fromkeys(self.hits, 0.0)
+
+    @staticmethod
+    def _compile(rule):
+        name = rule["name"]
+        family = rule.get("family")
+        params = dict(rule.get("params", {}))
+        
+        def expression(text, part):
+            return compile(text, f"<advice rule {name}: {part}>", 'eval')
+        
+        when = expression(rule["when"], 'when')
+        gate = expression(rule["suggestion_if"], 'suggestion_if') if "suggestion_if" in rule else None
+        values = {key: expression(text, key) for key, text in rule.get("values", {}).items()}
+        templates = {"message": rule["message"], "suggestion": rule["suggestion"]}
+        fields = list(dict.fromkeys(
+            field.split('.')[0].split('[')[0]
+            for text in templates.values()
+            for _, field, _, _ in string.Formatter().parse(text) if field
+        ))
+        
+        referenced = set(when.co_names).union(*(code.co_names for code in values.values()), fields)
+        if gate is not None:
+            referenced.update(gate.co_names)
+        if rule.get("order"):
+            referenced.add(rule["order"])
+        inputs = referenced - set(params) - set(values)
+        known = set(ADVICE_INPUTS) | set(ADVICE_FAMILIES[family][1] if family else ())
+        if inputs - known:
+            raise ValueError(f"advice rule {name!r} uses unknown inputs: {', '.join(sorted(inputs - known))}")
+        sources = {ADVICE_INPUTS[input_name] for input_name in inputs if ADVICE_INPUTS.get(input_name)}
+        if family:
+            sources.add(ADVICE_FAMILIES[family][0])
+        return {
+            "name": name,
+            "family": family,
+            "params": params,
+            "when": when,
+            "gate": gate,
+            "values": values,
+            "templates": templates,
+            "fields": fields,
+            "order": rule.get("order"),
+            "limit": rule.get("limit"),
+            "inputs": frozenset(inputs),
+            "sources": frozenset(sources),
+            "entry": {"type": rule["type"], "icon": rule["icon"]},
+        }
+
+    def describe(self):
+        """Each enabled rule with its inputs, sources, params and counters"""
+        with self._lock:
+            return [
+                {
+                    "name": rule["name"],
+                    "family": rule["family"],
+                    "inputs": sorted(rule["inputs"]),
+                    "sources": sorted(rule["sources"]),
+                    "params": rule["params"],
+                    "hits": self.hits[rule["name"]],
+                    "evaluated": self.evaluated[rule["name"]],
+                    "seconds": round(self.seconds[rule["name"]], 6),
+                }
+                for rule in self.rules
+            ]
+
+    def record(self, stats):
+        """Add the per-rule (hits, evaluated, seconds) returned by run()"""
+        with self._lock:
+            for name, (hits, evaluated, seconds) in stats.items():
+                self.hits[name] += hits
+                self.evaluated[name] += evaluated
+                self.seconds[name] += seconds
+
+    def run(self, frame):
+        """(advice list per account, per-rule stats) for a frame"""
+        count = frame["count"]
+        advice = [[] for _ in range(count)]
+        stats = {}
+        pending = []  # (account, item key, rule position, entry) for the current family
+        family = None
+        for position, rule in enumerate(self.rules):
+            if not rule["sources"] <= frame["sources"]:
+                continue
+            if pending and rule["family"] != family:
+                self._flush(advice, pending)
+            family = rule["family"]
+            started = time.perf_counter()
+            hits = self._apply(rule, position, frame, advice, pending)
+            stats[rule["name"]] = (hits, count, time.perf_counter() - started)
+        if pending:
+            self._flush(advice, pending)
+        return advice, stats
+
+    @staticmethod
+    def _flush(advice, pending):
+        pending.sort(key=lambda hit: hit[:3])
+        for account, _, _, entry in pending:
+            advice[account].append(entry)
+        pending.clear()
+
+    @staticmethod
+    def _apply(rule, position, frame, advice, pending):
+        inputs = frame["inputs"]
+        if rule["family"] is None:
+            namespace = dict(inputs)
+            size = frame["count"]
+            accounts = None
+        else:
+            items = frame["families"][rule["family"]]
+            namespace = dict(items)
+            accounts = items["account"]
+            size = len(accounts)
+            for name in rule["inputs"] & inputs.keys():
+                namespace[name] = inputs[name][accounts]
+        if "advice_count" in rule["inputs"]:
+            produced = np.fromiter(map(len, advice), dtype=np.intp, count=frame["count"])
+            namespace["advice_count"] = produced if accounts is None else produced[accounts]
+        namespace.update(rule["params"])
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            hits = np.flatnonzero(np.broadcast_to(eval(rule["when"], _RULE_GLOBALS, namespace), (size,)))
+            if not len(hits):
+                return 0
+            keys = hits
+            if rule["limit"]:
+                # Largest `order` first within each account, at most `limit` each
+                owners = accounts[hits]
+                ranked = hits[np.lexsort((hits, -np.asarray(namespace[rule["order"]], dtype=float)[hits], owners))]
+                owners = accounts[ranked]
+                rank = np.arange(len(ranked)) - np.searchsorted(owners, owners)
+                hits, keys = ranked[rank < rule["limit"]], rank[rank < rule["limit"]]
+            for key, code in rule["values"].items():
+                namespace[key] = eval(code, _RULE_GLOBALS, namespace)
+            gate = None
+            if rule["gate"] is not None:
+                gate = np.broadcast_to(eval(rule["gate"], _RULE_GLOBALS, namespace), (size,))[hits].tolist()
+        
+        columns = [np.broadcast_to(namespace[field], (size,))[hits].tolist() for field in rule["fields"]]
+        message, suggestion = rule["templates"]["message"], rule["templates"]["suggestion"]
+        owners = hits.tolist() if accounts is None else accounts[hits].tolist()
+        for index, (account, key, row) in enumerate(zip(owners, keys.tolist(), zip(*columns) if columns else [()] * len(hits))):
+            values = dict(zip(rule["fields"], row))
+            entry = dict(rule["entry"])
+            entry["message"] = message.format_map(values)
+            entry["suggestion"] = suggestion.format_map(values) if gate is None or gate[index] else ""
+            if accounts is None:
+                advice[account].append(entry)
+            else:
+                pending.append((account, key, position, entry))
+        return len(hits)
+
+advice_engine = AdviceEngine()
+
+metrics.register_gauge(
+    'advice_rule_hits', 'Advice produced per rule since start',
+    lambda: {(('rule', name),): hits for name, hits in advice_engine.hits.items()}
+)
+metrics.register_gauge(
+    'advice_rule_seconds', 'Time spent evaluating each advice rule since start',
+    lambda: {(('rule', name),): round(seconds, 6) for name, seconds in advice_engine.seconds.items()}
+)
+
+def _savings_rate(income, expenses):
+    return np.divide(income - expenses, income, out=np.zeros(len(income)), where=income > 0) * 100
+
+def _advice_frame(snapshot):
+    """Frame of one account from an advice_snapshot(); pure, so it can run in a pool worker"""
+    sources = frozenset(snapshot["sources"])
+    inputs, families = {}, {}
+    today = date_cls.fromisoformat(snapshot["today"])
+    
+    if 'totals' in sources:
+        income = np.array([snapshot["income"]], dtype=float)
+        expenses = np.array([snapshot["expenses"]], dtype=float)
+        inputs.update(income=income, expenses=expenses, savings_rate=_savings_rate(income, expenses))
+    
+    if 'categories' in sources:
+        spending = snapshot["spending_by_category"]
+        top = max(spending, key=spending.get) if spending else None
+        inputs.update(
+            has_spending=np.array([bool(spending)]),
+            top_category=np.array([top], dtype=object),
+            top_amount=np.array([spending.get(top, 0)], dtype=float),
+        )
+    
+    if 'recent' in sources:
+        inputs["recent_count"] = np.array([snapshot["recent_count"]])
+    
+    if 'budgets' in sources:
+        status = snapshot["budget_status"]
+        families['budget'] = {
+            "account": np.zeros(len(status), dtype=np.intp),
+            "category": np.array(list(status), dtype=object),
+            "category_lower": np.array([category.lower() for category in status], dtype=object),
+            "spent": np.array([entry["spent"] for entry in status.values()], dtype=float),
+            "budget": np.array([entry["budget"] for entry in status.values()], dtype=float),
+            "remaining": np.array([entry["remaining"] for entry in status.values()], dtype=float),
+            "used": np.array([entry["percentage_used"] for entry in status.values()], dtype=float),
+        }
+    
+    if 'recurring' in sources:
+        patterns = snapshot["recurring"]
+        upcoming = [
+            pattern for pattern in patterns
+            if pattern["type"] == "expense"
+            and 0 <= (date_cls.fromisoformat(pattern["next_date"]) - today).days <= ADVICE_UPCOMING_DAYS
+        ]
+        inputs.update(
+            upcoming_count=np.array([len(upcoming)]),
+            upcoming_total=np.array([sum(pattern["last_amount"] for pattern in upcoming)], dtype=float),
+            upcoming_names=np.array([", ".join(pattern["description"] for pattern in upcoming[:3])], dtype=object),
+        )
+        
+        def column(key):
+            return np.array([pattern[key] for pattern in patterns], dtype=object)
+        
+        families['recurring'] = {
+            "account": np.zeros(len(patterns), dtype=np.intp),
+            "description": column("description"),
+            "cadence": column("cadence"),
+            "is_expense": np.array([pattern["type"] == "expense" for pattern in patterns], dtype=bool),
+            "price_increase": np.array([bool(pattern["price_increase"]) for pattern in patterns], dtype=bool),
+            "days_since_last": np.array(
+                [(today - date_cls.fromisoformat(pattern["last_date"])).days for pattern in patterns], dtype=np.int64
+            ),
+            "previous_amount": column("previous_amount"),
+            "last_amount": column("last_amount"),
+            "amount_change": column("amount_change"),
+        }
+    
+    if 'goals' in sources:
+        goals = snapshot["goals"]
+        
+        def column(key, dtype=float):
+            return np.array([goal[key] for goal in goals], dtype=dtype)
+        
+        families['goal'] = {
+            "account": np.zeros(len(goals), dtype=np.intp),
+            "goal": column("name", object),
+            "target": column("target"),
+            "saved": column("saved"),
+            "remaining": column("remaining"),
+            "progress": column("progress"),
+            "monthly_rate": column("monthly_rate"),
+            "required_monthly": np.array([goal["required_monthly"] or 0.0 for goal in goals], dtype=float),
+            "has_deadline": np.array([goal["deadline"] is not None for goal in goals], dtype=bool),
+            "deadline": column("deadline", object),
+            "projected": column("projected_date", object),
+            "reached": column("reached", bool),
+            "on_track": np.array([bool(goal["on_track"]) for goal in goals], dtype=bool),
+            "age_days": np.array(
+                [(today - date_cls.fromisoformat(goal["start_date"])).days for goal in goals], dtype=np.int64
+            ),
+        }
+    
+    if 'sketches' in sources:
+        categories = snapshot["expense_categories"]
+        distributions = _merge_sketch_blobs(snapshot["sketches"]) if categories else {}
+        history = {
+            category: (sketch.count, *sketch.quantiles((0.5, 0.99))) for category, sketch in distributions.items()
+        }
+        known = [history.get(category, (0, None, math.inf)) for category in categories]
+        families['recent_expense'] = {
+            "account": np.zeros(len(categories), dtype=np.intp),
+            "category": np.array(categories, dtype=object),
+            "description": np.array(snapshot["expense_descriptions"], dtype=object),
+            "amount": np.frombuffer(snapshot["expense_amounts"], dtype=float) if categories else np.zeros(0),
+            "history": np.array([entry[0] for entry in known], dtype=np.int64),
+            "median": np.array([entry[1] for entry in known], dtype=object),
+            "p99": np.array([entry[2] for entry in known], dtype=float),
+        }
+    
+    return {"count": 1, "sources": sources, "inputs": inputs, "families": families}
+
+def _evaluate_advice(snapshot):
+    """Advice for one advice_snapshot() and the per-rule stats; pure, so it can run in a pool worker"""
+    advice, stats = advice_engine.run(_advice_frame(snapshot))
+    return advice[0], stats
+
+class AdviceDigest:
+    """Advice for every account, computed a chunk of users at a time into advice_cache
+
+    Accounts are walked in user_id order, `chunk` at a time. One grouped query
+    per chunk over the (user_id, date) index gathers the SOURCES inputs
+    (30-day income, expense totals per category, 7-day activity) as a frame
+    for advice_engine, which evaluates each rule over the whole chunk at
+    once. Memory is bounded by the chunk, whatever the number of accounts.
+    Budgets are household-wide, so every account is measured against the
+    same ones. Rules that need recurring-charge or sketch sources read
+    database-wide detectors rather than one account's history; the engine
+    skips them here and they stay in the live /api/ai-advice.
+    """
+
+    SOURCES = frozenset({'totals', 'categories', 'budgets', 'recent'})
+
+    @staticmethod
+    def user_chunks(conn, chunk):
+        """Sorted lists of at most `chunk` user ids, read lazily"""
+        last = 0
+        while True:
+            users = [row[0] for row in conn.execute(
+                'SELECT DISTINCT user_id FROM transactions WHERE user_id > ? ORDER BY user_id LIMIT ?', (last, chunk)
+            )]
+            if not users:
+                return
+            yield users
+            last = users[-1]
+
+    @staticmethod
+    def gather(conn, users, since, recent_since, budgets):
+        """advice_engine frame for a sorted chunk of user ids"""
+        # Rows in the display currency collapse to one group; others are summed per day for conversion
+        rows = conn.execute('''
+            SELECT user_id, type, category, SUM(amount), SUM(date >= ?),
+                   currency, CASE WHEN currency = ? THEN NULL ELSE substr(date, 1, 10) END AS day
+            FROM transactions
+            WHERE user_id BETWEEN ? AND ? AND date >= ?
+            GROUP BY user_id, type, category, currency, day
+        ''', (recent_since, DISPLAY_CURRENCY, users[0], users[-1], since)).fetchall()
+        count = len(users)
+        income = np.zeros(count)
+        recent = np.zeros(count, dtype=np.int64)
+        categories = []
+        spending = np.zeros((count, 0))
+        has_spending = np.zeros((count, 0), dtype=bool)
+        if rows:
+            user_ids, types, row_categories, totals, recent_counts, currencies, days = zip(*rows)
+            index = np.searchsorted(np.array(users), np.array(user_ids))
+            totals = np.array(totals, dtype=float)
+            foreign = np.flatnonzero([day is not None for day in days])
+            if len(foreign):
+                totals[foreign] *= fx_rates.factors(
+                    fx_rates.codes([currencies[row] for row in foreign.tolist()]),
+                    day_numbers([days[row] for row in foreign.tolist()]),
+                    DISPLAY_CURRENCY
+                )
+            is_expense = np.array(types) == 'expense'
+            np.add.at(income, index[~is_expense], totals[~is_expense])
+            recent = np.bincount(index, weights=np.array(recent_counts, dtype=float), minlength=count).astype(np.int64)
+            
+            categories = sorted(set(row_categories))
+            column = {category: code for code, category in enumerate(categories)}
+            codes = np.fromiter(map(column.__getitem__, row_categories), dtype=np.intp, count=len(rows))
+            spending = np.zeros((count, len(categories)))
+            has_spending = np.zeros((count, len(categories)), dtype=bool)
+            np.add.at(spending, (index[is_expense], codes[is_expense]), totals[is_expense])
+            has_spending[index[is_expense], codes[is_expense]] = True
+        expenses = spending.sum(axis=1)
+        
+        # Ties go to the first category by name, as max() over the name-ordered dict does
+        top = np.where(has_spending, spending, -np.inf).argmax(axis=1) if categories else np.zeros(count, dtype=np.intp)
+        inputs = {
+            "income": income,
+            "expenses": expenses,
+            "savings_rate": _savings_rate(income, expenses),
+            "has_spending": has_spending.any(axis=1),
+            "top_category": np.array(categories or [None], dtype=object)[top],
+            "top_amount": spending[np.arange(count), top] if categories else np.zeros(count),
+            "recent_count": recent,
+        }
+        
+        # Budget items grouped by budget, so item order within an account follows budget order;
+        # a budget on a parent category covers its whole subtree
+        names = [category for category, _ in budgets]
+        spent = (spending @ CategoryTree.membership(conn, categories, names)).T.ravel()
+        amounts = np.repeat(np.array([amount for _, amount in budgets], dtype=float), count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            used = np.where(amounts > 0, spent / amounts * 100, 0.0)
+        families = {
+            "budget": {
+                "account": np.tile(np.arange(count), len(budgets)),
+                "category": np.repeat(np.array(names, dtype=object), count),
+                "category_lower": np.repeat(np.array([name.lower() for name in names], dtype=object), count),
+                "spent": spent,
+                "budget": amounts,
+                "remaining": amounts - spent,
+                "used": used,
+            }
+        }
+        return {"count": count, "sources": AdviceDigest.SOURCES, "inputs": inputs, "families": families}
+
+    @staticmethod
+    def run(conn, chunk=None, now=None, pause=None, progress=None):
+        """Rebuild advice_cache for every account; returns counts and throughput
+
+        `pause` runs between chunks (maintenance yields there) and
+        `progress(users_done, seconds)` is called after each chunk is committed.
+        """
+        chunk = ADVICE_DIGEST_CHUNK_USERS if chunk is None else chunk
+        now = now or datetime.now()
+        since = normalize_timestamp(now - timedelta(days=30))
+        recent_since = normalize_timestamp(now - timedelta(days=7))
+        generated = normalize_timestamp(None)
+        budgets = conn.execute('SELECT category, amount FROM budgets ORDER BY id').fetchall()
+        started = time.perf_counter()
+        done = chunks = 0
+        for users in AdviceDigest.user_chunks(conn, chunk):
+            advice, stats = advice_engine.run(AdviceDigest.gather(conn, users, since, recent_since, budgets))
+            advice_engine.record(stats)
+            conn.executemany(
+                'INSERT OR REPLACE INTO advice_cache (user_id, advice, generated_date) VALUES (?, ?, ?)',
+                [(user, json.dumps(entries, separators=(',', ':')), generated) for user, entries in zip(users, advice)]
+            )
+            conn.commit()
+            done += len(users)
+            chunks += 1
+            if progress:
+                progress(done, time.perf_counter() - started)
+            if pause:
+                pause()
+        seconds = time.perf_counter() - started
+        return {
+            'users': done,
+            'chunks': chunks,
+            'seconds': round(seconds, 3),
+            'users_per_second': round(done / seconds) if seconds else None,
+        }
+
+class RecurringDetector:
+    """Incremental detector for recurring charges and income (subscriptions, rent, salary)
+
+    Transactions are grouped by (type, normalized description). Each group is kept
+    sorted by date, split into amount bands with a sort over amounts, and the gaps
+    between consecutive dates are matched against known cadences. New rows are
+    picked up through an id high-water mark so only the groups they touch are
+    re-evaluated.
+    """
+
+    # (name, nominal interval in days, allowed deviation in days)
+    CADENCES = (
+        ('weekly', 7, 1.5),
+        ('biweekly', 14, 2.5),
+        ('monthly', 30.44, 4),
+        ('quarterly', 91.31, 10),
+        ('annual', 365.25, 15),
+    )
+    AMOUNT_TOLERANCE = 0.20  # relative gap that starts a new amount band
+    MIN_REGULARITY = 0.75    # share of gaps that must match the cadence
+    PRICE_CHANGE_THRESHOLD = 0.02
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, database):
+        self._database = database
+        self._last_id = 0
+        self._groups = defaultdict(list)  # key -> [(day ordinal, id, amount, category, description)]
+        self._patterns = {}               # key -> [(pattern dict, last active day ordinal)]
+        self._dirty = set()
+
+    def refresh(self):
+        """Fold rows added since the last refresh into the affected groups"""
+        with self._lock:
+            if self._database != DATABASE:
+                self._reset(DATABASE)
+            with get_db(read_only=True) as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = None  # plain tuples, this loop touches every row
+                cursor.execute('''
+                    SELECT id, date, amount, category, description, type
+                    FROM transactions
+                    WHERE id > ?
+                ''', (self._last_id,))
+                day_cache = {}
+                groups = self._groups
+                touched = set()
+                last_id = self._last_id
+                for txn_id, txn_date, amount, category, description, txn_type in cursor:
+                    day_key = txn_date[:10]
+                    day = day_cache.get(day_key)
+                    if day is None:
+                        day = day_cache[day_key] = date_cls.fromisoformat(day_key).toordinal()
+                    key = (txn_type, normalize_description(description))
+                    groups[key].append((day, txn_id, amount, category, description))
+                    touched.add(key)
+                    if txn_id > last_id:
+                        last_id = txn_id
+                self._last_id = last_id
+            # Rows arrive in id order; one (mostly presorted) sort per touched
+            # group restores date order, including for back-dated inserts
+            for key in touched:
+                groups[key].sort()
+            self._dirty |= touched
+            for key in self._dirty:
+                self._patterns[key] = self._detect(key, self._groups[key])
+            self._dirty.clear()
+
+    def patterns(self):
+        """Return all detected recurring patterns ordered by next expected date
+
+        `active` is judged against today on every read, so a series that lapses
+        goes inactive even if no new rows ever touch its group.
+        """
+        self.refresh()
+        today = date_cls.today().toordinal()
+        found = [
+            dict(pattern, active=today <= active_until)
+            for patterns in self._patterns.values() for pattern, active_until in patterns
+        ]
+        found.sort(key=lambda pattern: pattern['next_date'])
+        return found
+
+    @classmethod
+    def _match_cadence(cls, interval):
+        for name, nominal, deviation in cls.CADENCES:
+            if abs(interval - nominal) <= deviation:
+                return name, nominal, deviation
+        return None
+
+    @classmethod
+    def _detect(cls, key, group):
+        """Find periodic series inside one description group, each with the last day it counts as active"""
+        if len(group) < 2:
+            return []
+
+        # Sort-based amount banding: a new band starts wherever consecutive
+        # sorted amounts differ by more than the tolerance
+        by_amount = sorted(group, key=lambda entry: entry[2])
+        bands = [[by_amount[0]]]
+        for entry in by_amount[1:]:
+            previous = bands[-1][-1][2]
+            if entry[2] - previous > max(abs(previous), 1.0) * cls.AMOUNT_TOLERANCE:
+                bands.append([entry])
+            else:
+                bands[-1].append(entry)
+
+        patterns = []
+        txn_type, _ = key
+        for band in bands:
+            if len(band) < 2:
+                continue
+            band.sort()
+            days = [entry[0] for entry in band]
+            gaps = [b - a for a, b in zip(days, days[1:])]
+            cadence = cls._match_cadence(statistics.median(gaps))
+            if cadence is None:
+                continue
+            name, nominal, deviation = cadence
+            if len(band) < (2 if name == 'annual' else 3):
+                continue
+            regular = sum(1 for gap in gaps if abs(gap - nominal) <= deviation)
+            if regular / len(gaps) < cls.MIN_REGULARITY:
+                continue
+
+            last_day, _, last_amount, category, description = band[-1]
+            previous_amount = band[-2][2]
+            interval = sum(gaps) / len(gaps)
+            next_day = last_day + round(interval)
+            change = last_amount - previous_amount
+            patterns.append(({
+                "description": description,
+                "category": category,
+                "type": txn_type,
+                "cadence": name,
+                "interval_days": round(interval, 1),
+                "occurrences": len(band),
+                "average_amount": round(sum(entry[2] for entry in band) / len(band), 2),
+                "last_amount": last_amount,
+                "previous_amount": previous_amount,
+                "amount_change": round(change, 2),
+                "price_increase": change > abs(previous_amount) * cls.PRICE_CHANGE_THRESHOLD,
+                "first_date": date_cls.fromordinal(band[0][0]).isoformat(),
+                "last_date": date_cls.fromordinal(last_day).isoformat(),
+                "next_date": date_cls.fromordinal(next_day).isoformat(),
+                "transaction_ids": [entry[1] for entry in band],
+            }, last_day + interval * 2 + deviation))
+        return patterns
+
+recurring_detector = RecurringDetector()
+
+class BalanceSeries:
+    """Materialized daily running balance (income minus expenses, cumulative)
+
+    One row per day holds that day's net change and the closing balance. The
+    table is backfilled once with a window function, then maintained by the
+    write path: a new day appends in O(1), and a back-dated row shifts only the
+    closing balances of the days after it, so the work is bounded by the number
+    of later days rather than the number of later transactions.
+
+    balance_daily sums amounts as entered, so it answers only while the ledger
+    holds nothing but the display currency. Otherwise the series comes from
+    ConvertedRollups, which converts each day at its own rate and rebuilds
+    when the rates reload; like balance_daily it still covers archived rows.
+    """
+
+    BUCKETS = {
+        'day': '%Y-%m-%d',
+        'week': '%Y-W%W',
+        'month': '%Y-%m',
+        'year': '%Y',
+    }
+
+    @staticmethod
+    def backfill(conn, force=False):
+        """Build the series from the full history if it has not been built yet"""
+        if not force and conn.execute('SELECT 1 FROM balance_daily LIMIT 1').fetchone():
+            return
+        conn.execute('DELETE FROM balance_daily')
+        conn.execute('''
+            INSERT INTO balance_daily (day, net, closing_balance, transaction_count)
+            SELECT day, net, SUM(net) OVER (ORDER BY day ROWS UNBOUNDED PRECEDING), transaction_count
+            FROM (
+                SELECT date(date) AS day,
+                       SUM(CASE WHEN type = 'income' THEN amount ELSE -amount END) AS net,
+                       COUNT(*) AS transaction_count
+                FROM transactions
+                GROUP BY date(date)
+            )
+        ''')
+
+    @staticmethod
+    def apply(conn, timestamp, amount, transaction_type):
+        """Fold one inserted transaction into the series"""
+        day = timestamp[:10]
+        delta = float(amount) if transaction_type == 'income' else -float(amount)
+        # Bounded suffix recompute: only days after a back-dated row move
+        conn.execute(
+            'UPDATE balance_daily SET closing_balance = closing_balance + ? WHERE day > ?',
+            (delta, day)
+        )
+        conn.execute('''
+            INSERT INTO balance_daily (day, net, closing_balance, transaction_count)
+            VALUES (?, ?, COALESCE((SELECT closing_balance FROM balance_daily WHERE day < ? ORDER BY day DESC LIMIT 1), 0) + ?, 1)
+            ON CONFLICT(day) DO UPDATE SET
+                net = net + excluded.net,
+                closing_balance = closing_balance + excluded.net,
+                transaction_count = transaction_count + 1
+        ''', (day, delta, day, delta))
+
+    @staticmethod
+    def _converted(conn, currency):
+        """Synced ConvertedRollups when the ledger holds currencies other than `currency`, else None"""
+        if not isinstance(storage, SQLiteStorage):
+            return None
+        rollups = storage.rollups(currency)
+        rollups.sync(conn)
+        return None if rollups.currencies <= {currency} else rollups
+
+    @staticmethod
+    def current(currency=None):
+        """Latest closing balance in `currency` (default DISPLAY_CURRENCY)"""
+        currency = currency or DISPLAY_CURRENCY
+        with get_db(read_only=True) as conn:
+            conn.execute('BEGIN')
+            rollups = BalanceSeries._converted(conn, currency)
+            if rollups is not None:
+                return float(rollups.daily()[1].sum())
+            row = conn.execute('SELECT closing_balance FROM balance_daily ORDER BY day DESC LIMIT 1').fetchone()
+        return row[0] if row else 0.0
+
+    @staticmethod
+    def series(bucket='day', start=None, end=None, currency=None):
+        """Closing balance and net change per bucket, in `currency` (default DISPLAY_CURRENCY)"""
+        currency = currency or DISPLAY_CURRENCY
+        query = '''
+            SELECT strftime(?, day) AS period, MAX(day) AS day, closing_balance, SUM(net) AS net,
+                   SUM(transaction_count) AS transaction_count
+            FROM balance_daily
+        '''
+        params = [BalanceSeries.BUCKETS[bucket]]
+        conditions = []
+        if start:
+            conditions.append('day >= ?')
+            params.append(start[:10])
+        if end:
+            conditions.append('day <= ?')
+            params.append(end[:10])
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' GROUP BY period ORDER BY period'
+
+        with get_db(read_only=True) as conn:
+            conn.execute('BEGIN')
+            rollups = BalanceSeries._converted(conn, currency)
+            if rollups is not None:
+                return BalanceSeries._converted_series(rollups, bucket, start, end)
+            return [
+                {
+                    "period": row['period'],
+                    "date": row['day'],
+                    "balance": round(row['closing_balance'], 2),
+                    "net": round(row['net'], 2),
+                    "transaction_count": row['transaction_count']
+                }
+                for row in conn.execute(query, params)
+            ]
+
+    @staticmethod
+    def _converted_series(rollups, bucket, start, end):
+        """series() from the converted per-day totals: the same buckets over days with transactions"""
+        first, net, counts = rollups.daily()
+        closing = np.cumsum(net)
+        periods = {}
+        for offset in np.flatnonzero(counts).tolist():
+            day = date_cls.fromordinal(first + offset)
+            if (start and day.isoformat() < start[:10]) or (end and day.isoformat() > end[:10]):
+                continue
+            period = day.strftime(BalanceSeries.BUCKETS[bucket])
+            entry = periods.get(period)
+            if entry is None:
+                entry = periods[period] = {"period": period, "net": 0.0, "transaction_count": 0}
+            entry["date"] = day.isoformat()
+            entry["balance"] = round(float(closing[offset]), 2)
+            entry["net"] += float(net[offset])
+            entry["transaction_count"] += int(counts[offset])
+        return [
+            {
+                "period": entry["period"],
+                "date": entry["date"],
+                "balance": entry["balance"],
+                "net": round(entry["net"], 2),
+                "transaction_count": entry["transaction_count"]
+            }
+            for _, entry in sorted(periods.items())
+        ]
+
+class QuantileSketch:
+    """Mergeable t-digest quantile sketch with a compact binary encoding
+
+    Values are clustered into weighted centroids whose allowed size shrinks
+    towards both tails (arcsine scale function), so p90/p99 stay accurate while
+    the sketch holds only a few hundred centroids. Two sketches merge by
+    pooling their centroids and recompressing.
+    """
+
+    HEADER = struct.Struct('<HIQdd')  # compression, centroids, count, min, max
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.centroids = []  # (mean, weight); unmerged points are weight-1 centroids
+        self._merged = 0     # leading centroids already compressed
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.centroids.append((value, 1))
+        if len(self.centroids) - self._merged > 4 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        self.centroids.extend(other.centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def scale(self, factor):
+        """Multiply every value by a positive factor (e.g. an exchange rate) in place"""
+        self.centroids = [(mean * factor, weight) for mean, weight in self.centroids]
+        self.min *= factor
+        self.max *= factor
+        return self
+
+    def _scale(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _scale_inverse(self, k):
+        k = min(k, self.compression / 4)
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if len(self.centroids) <= 1:
+            self._merged = len(self.centroids)
+            return
+        items = sorted(self.centroids)
+        total = sum(weight for _, weight in items)
+        merged = []
+        weight_so_far = 0
+        q_limit = self._scale_inverse(self._scale(0) + 1)
+        mean, weight = items[0]
+        for next_mean, next_weight in items[1:]:
+            if (weight_so_far + weight + next_weight) / total <= q_limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                merged.append((mean, weight))
+                weight_so_far += weight
+                q_limit = self._scale_inverse(self._scale(weight_so_far / total) + 1)
+                mean, weight = next_mean, next_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+        self._merged = len(merged)
+
+    def quantiles(self, fractions):
+        """Approximate values at the given fractions (0..1)"""
+        if not self.count:
+            return [None for _ in fractions]
+        if self._merged != len(self.centroids):
+            self._compress()
+        centroids = self.centroids
+        results = []
+        for fraction in fractions:
+            target = fraction * self.count
+            # Interpolate between centroid centres, anchored on the exact min/max
+            previous_position, previous_value = 0, self.min
+            cumulative = 0
+            value = self.max
+            for mean, weight in centroids:
+                position = cumulative + weight / 2
+                if target < position:
+                    span = position - previous_position
+                    share = (target - previous_position) / span if span else 0
+                    value = previous_value + (mean - previous_value) * share
+                    break
+                cumulative += weight
+                previous_position, previous_value = position, mean
+            else:
+                span = self.count - previous_position
+                share = (target - previous_position) / span if span else 0
+                value = previous_value + (self.max - previous_value) * share
+            results.append(value)
+        return results
+
+    def to_bytes(self):
+        if self._merged != len(self.centroids):
+            self._compress()
+        means = array('d', (mean for mean, _ in self.centroids))
+        weights = array('d', (weight for _, weight in self.centroids))
+        header = self.HEADER.pack(self.compression, len(self.centroids), self.count, self.min, self.max)
+        return header + means.tobytes() + weights.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        compression, size, count, low, high = cls.HEADER.unpack_from(blob)
+        sketch = cls(compression)
+        sketch.count, sketch.min, sketch.max = count, low, high
+        offset = cls.HEADER.size
+        means = array('d')
+        means.frombytes(blob[offset:offset + 8 * size])
+        weights = array('d')
+        weights.frombytes(blob[offset + 8 * size:offset + 16 * size])
+        sketch.centroids = list(zip(means, weights))
+        sketch._merged = size
+        return sketch
+
+class SpendingDistribution:
+    """Per-category, per-month, per-currency quantile sketches of expense sizes
+
+    Sketches are updated by the insert path and stored as small blobs, so
+    medians and tail percentiles for any range of months come from merging a
+    handful of sketches instead of sorting raw transactions. Amounts stay in
+    the currency they were entered in; reads scale each sketch into the
+    display currency at its month's average rate, so a rates reload needs no
+    rebuild.
+    """
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    @staticmethod
+    def apply(conn, category, period, currency, amount):
+        """Add one expense to its (category, month, currency) sketch"""
+        row = conn.execute(
+            'SELECT sketch FROM spending_sketches WHERE category = ? AND period = ? AND currency = ?',
+            (category, period, currency)
+        ).fetchone()
+        sketch = QuantileSketch.from_bytes(row[0]) if row else QuantileSketch()
+        sketch.add(amount)
+        conn.execute(
+            'INSERT OR REPLACE INTO spending_sketches (category, period, currency, sketch, count) VALUES (?, ?, ?, ?, ?)',
+            (category, period, currency, sketch.to_bytes(), sketch.count)
+        )
+
+    @staticmethod
+    def backfill(conn, force=False):
+        """Build sketches from history if none exist yet"""
+        if not force and conn.execute('SELECT 1 FROM spending_sketches LIMIT 1').fetchone():
+            return
+        conn.execute('DELETE FROM spending_sketches')
+        sketches = defaultdict(QuantileSketch)
+        cursor = conn.execute(
+            "SELECT category, substr(date, 1, 7), currency, amount FROM transactions WHERE type = 'expense'"
+        )
+        for category, period, currency, amount in cursor:
+            sketches[(category, period, currency)].add(amount)
+        conn.executemany(
+            'INSERT INTO spending_sketches (category, period, currency, sketch, count) VALUES (?, ?, ?, ?, ?)',
+            [(*key, sketch.to_bytes(), sketch.count) for key, sketch in sketches.items()]
+        )
+
+    @staticmethod
+    def month_rate(currency, period, display):
+        """Average factor taking `currency` into `display` over the days of month 'YYYY-MM'"""
+        first = date_cls.fromisoformat(period + '-01')
+        following = date_cls(first.year + first.month // 12, first.month % 12 + 1, 1)
+        days = np.arange(first.toordinal(), following.toordinal())
+        return float(fx_rates.factors(np.full(len(days), fx_rates.code(currency)), days, display).mean())
+
+    @staticmethod
+    def sketch_blobs(months=12, category=None, group='category', currency=None):
+        """Stored sketch blobs for the last N months in `currency` (default DISPLAY_CURRENCY),
+        grouped by category or by period (unmerged)"""
+        currency = currency or DISPLAY_CURRENCY
+        fx_rates.refresh()
+        today = date_cls.today()
+        month_index = today.year * 12 + today.month - 1 - (months - 1)
+        first_period = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
+        query = 'SELECT category, period, currency, sketch FROM spending_sketches WHERE period >= ?'
+        params = [first_period]
+        if category:
+            query += ' AND category = ?'
+            params.append(category)
+
+        groups = defaultdict(list)
+        with get_db(read_only=True) as conn:
+            for row_category, period, row_currency, blob in conn.execute(query, params):
+                if row_currency != currency:
+                    blob = QuantileSketch.from_bytes(blob).scale(
+                        SpendingDistribution.month_rate(row_currency, period, currency)
+                    ).to_bytes()
+                groups[row_category if group == 'category' else period].append(blob)
+        return dict(groups)
+
+    @staticmethod
+    def sketches(months=12, category=None, group='category'):
+        """Merge stored sketches for the last N months, grouped by category or by period"""
+        return _merge_sketch_blobs(SpendingDistribution.sketch_blobs(months, category, group))
+
+    @staticmethod
+    def summarize(sketch):
+        median, p90, p99 = sketch.quantiles(SpendingDistribution.QUANTILES)
+        return {
+            "count": sketch.count,
+            "min": round(sketch.min, 2),
+            "median": round(median, 2),
+            "p90": round(p90, 2),
+            "p99": round(p99, 2),
+            "max": round(sketch.max, 2),
+        }
+
+def _merge_sketch_blobs(groups):
+    """{key: [sketch blob, ...]} -> {key: merged QuantileSketch}"""
+    merged = {}
+    for key, blobs in groups.items():
+        sketch = QuantileSketch.from_bytes(blobs[0])
+        for blob in blobs[1:]:
+            sketch.merge(QuantileSketch.from_bytes(blob))
+        merged[key] = sketch
+    return merged
+
+def _summarize_sketch_blobs(groups):
+    """Merged summaries per key, sorted; the pool-side half of get_spending_distribution"""
+    return {
+        key: SpendingDistribution.summarize(sketch)
+        for key, sketch in sorted(_merge_sketch_blobs(groups).items())
+    }
+
+def _simulate_paths(daily_net, starting_balance, days, paths, seed, checkpoints, goal_target):
+    """Run one chunk of bootstrap paths; module-level so process pool workers can import it"""
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, len(daily_net), size=(paths, days), dtype=np.int32)
+    balances = daily_net[draws]
+    np.cumsum(balances, axis=1, out=balances)
+    balances += starting_balance
+    goal_days = None
+    if goal_target is not None:
+        reached = balances >= goal_target
+        goal_days = np.where(reached.any(axis=1), reached.argmax(axis=1) + 1, -1)
+    return balances[:, checkpoints], balances.min(axis=1), goal_days
+
+class SavingsSimulator:
+    """Monte Carlo balance projections bootstrapped from the user's own history
+
+    Each simulated day draws a whole historical day (income and every expense
+    category together, so within-day correlations survive) and applies the
+    what-if multipliers. Paths are generated in chunks of whole matrices:
+    one integer draw, one gather and one cumulative sum per chunk.
+    """
+
+    HISTORY_DAYS = 365
+    CHUNK_CELLS = 2_000_000  # paths x days per chunk, bounds peak memory
+    MAX_PATHS = 100_000
+    MAX_DAYS = 365 * 30
+
+    @staticmethod
+    def daily_history(adjustments=None, history_days=HISTORY_DAYS):
+        """Net cash flow in DISPLAY_CURRENCY for each calendar day of the history window, after adjustments"""
+        adjustments = adjustments or {}
+        cutoff = (date_cls.today() - timedelta(days=history_days - 1)).isoformat()
+        with get_db(read_only=True) as conn:
+            rows = conn.execute('''
+                SELECT date(date) AS day, type, category, currency, SUM(amount) AS total
+                FROM transactions
+                WHERE date >= ?
+                GROUP BY day, type, category, currency
+            ''', (cutoff,)).fetchall()
+        if not rows:
+            return None
+
+        fx_rates.refresh()
+        factors = fx_rates.factors(
+            fx_rates.codes([row['currency'] for row in rows]), day_numbers([row['day'] for row in rows]), DISPLAY_CURRENCY
+        ).tolist()
+        first_day = date_cls.fromisoformat(min(row['day'] for row in rows)).toordinal()
+        today = date_cls.today().toordinal()
+        daily_net = np.zeros(max(today, first_day) - first_day + 1)
+        for row, factor in zip(rows, factors):
+            if row['type'] == 'income':
+                flow = row['total'] * factor * adjustments.get('income', 1.0)
+            else:
+                flow = -row['total'] * factor * adjustments.get(row['category'], 1.0)
+            offset = date_cls.fromisoformat(row['day']).toordinal() - first_day
+            if 0 <= offset < len(daily_net):
+                daily_net[offset] += flow
+        return daily_net
+
+    @staticmethod
+    def simulate(paths=10_000, days=365 * 5, starting_balance=None, adjustments=None,
+                 goal_target=None, percentiles=(5, 25, 50, 75, 95), checkpoint_days=30,
+                 seed=None, workers=1):
+        """Project balances over `days` for `paths` bootstrap paths and summarize as percentile bands
+
+        Raises ValueError for malformed options. `workers` only applies without
+        the analytics pool and is capped at the CPU count.
+        """
+        def number(value, name, kind=float):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError(f"{name} must be a number")
+            return kind(value)
+        
+        paths = max(1, min(number(paths, 'paths', int), SavingsSimulator.MAX_PATHS))
+        days = max(1, min(number(days, 'days', int), SavingsSimulator.MAX_DAYS))
+        checkpoint_days = max(1, number(checkpoint_days, 'checkpoint_days', int))
+        workers = max(1, min(number(workers, 'workers', int), os.cpu_count() or 1))
+        if starting_balance is not None:
+            starting_balance = number(starting_balance, 'starting_balance')
+        if goal_target is not None:
+            goal_target = number(goal_target, 'goal target')
+        if seed is not None:
+            seed = number(seed, 'seed', int)
+        if not isinstance(percentiles, (list, tuple)) or not percentiles or \
+                not all(0 <= number(value, 'percentiles') <= 100 for value in percentiles):
+            raise ValueError("percentiles must be a list of numbers between 0 and 100")
+        percentiles = tuple(percentiles)
+        if adjustments is not None:
+            if not isinstance(adjustments, dict):
+                raise ValueError("adjustments must map categories (or 'income') to multipliers")
+            adjustments = {key: number(value, f"adjustment for {key}") for key, value in adjustments.items()}
+        daily_net = SavingsSimulator.daily_history(adjustments)
+        if daily_net is None:
+            return {"success": False, "message": "Not enough transaction history to simulate"}
+        if starting_balance is None:
+            starting_balance = BalanceSeries.current()
+
+        checkpoints = np.unique(np.append(np.arange(checkpoint_days - 1, days, checkpoint_days), days - 1))
+        chunk_paths = max(1, SavingsSimulator.CHUNK_CELLS // days)
+        sizes = [min(chunk_paths, paths - start) for start in range(0, paths, chunk_paths)]
+        # Seeds are tied to chunks, not workers, so results do not depend on the pool size
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        jobs = [
+            (daily_net, float(starting_balance), days, size, chunk_seed, checkpoints, goal_target)
+            for size, chunk_seed in zip(sizes, seeds)
+        ]
+        if analytics_pool.running:
+            results = analytics_pool.map(_simulate_paths, jobs)
+        elif workers and workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                results = list(pool.map(_simulate_paths, *zip(*jobs)))
+        else:
+            results = [_simulate_paths(*job) for job in jobs]
+
+        at_checkpoints = np.concatenate([result[0] for result in results])
+        lowest = np.concatenate([result[1] for result in results])
+        bands = np.percentile(at_checkpoints, percentiles, axis=0)
+        today = date_cls.today()
+        projection = {
+            "success": True,
+            "paths": paths,
+            "days": days,
+            "starting_balance": round(float(starting_balance), 2),
+            "history_days": len(daily_net),
+            "average_daily_net": round(float(daily_net.mean()), 2),
+            "checkpoints": [
+                {"day": int(day) + 1, "date": (today + timedelta(days=int(day) + 1)).isoformat()}
+                for day in checkpoints
+            ],
+            "bands": {
+                f"p{percentile:g}": np.round(band, 2).tolist()
+                for percentile, band in zip(percentiles, bands)
+            },
+            "final_balance": {
+                f"p{percentile:g}": round(float(band[-1]), 2)
+                for percentile, band in zip(percentiles, bands)
+            },
+            "probability_negative": round(float((lowest < 0).mean()), 4),
+        }
+        if goal_target is not None:
+            goal_days = np.concatenate([result[2] for result in results])
+            reached = goal_days[goal_days > 0]
+            goal = {
+                "target": goal_target,
+                "probability": round(len(reached) / paths, 4),
+            }
+            if len(reached):
+                for percentile in (10, 50, 90):
+                    day = int(np.percentile(reached, percentile))
+                    goal[f"p{percentile}_date"] = (today + timedelta(days=day)).isoformat()
+            projection["goal"] = goal
+        return projection
+
+class DuplicateIndex:
+    """Content-hash index used to catch re-imported and retried transactions
+
+    Each row gets a fingerprint over (type, amount, currency, category,
+    normalized description) plus its day number. A lookup for the same fingerprint within
+    DUPLICATE_WINDOW_DAYS is a single probe of the (fingerprint, day) index, and
+    rows inserted earlier in the same batch are visible to it because the batch
+    shares one connection.
+    """
+
+    @staticmethod
+    def fingerprint(amount, category, description, transaction_type, timestamp, currency=None):
+        content = (f"{transaction_type}|{round(float(amount) * 100)}|{currency or BASE_CURRENCY}|"
+                   f"{category.strip().lower()}|{normalize_description(description)}")
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()[:20]
+        return digest, date_cls.fromisoformat(timestamp[:10]).toordinal()
+
+    @staticmethod
+    def find(conn, fingerprint, day):
+        """Return the id of an existing row matching the fingerprint, or None"""
+        row = conn.execute('''
+            SELECT transaction_id FROM transaction_fingerprints
+            WHERE fingerprint = ? AND day BETWEEN ? AND ?
+            LIMIT 1
+        ''', (fingerprint, day - DUPLICATE_WINDOW_DAYS, day + DUPLICATE_WINDOW_DAYS)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def record(conn, transaction_id, fingerprint, day, duplicate_of=None):
+        conn.execute(
+            'INSERT INTO transaction_fingerprints (transaction_id, fingerprint, day, duplicate_of) VALUES (?, ?, ?, ?)',
+            (transaction_id, fingerprint, day, duplicate_of)
+        )
+
+    @staticmethod
+    def replay(conn, key):
+        """Return the stored response for an idempotency key, or None"""
+        row = conn.execute('SELECT response FROM idempotency_keys WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row[0])
+        result["replayed"] = True
+        return result
+
+    @staticmethod
+    def remember(conn, key, result):
+        """Store the response for an idempotency key; False if the key already exists"""
+        try:
+            conn.execute('INSERT INTO idempotency_keys (key, response) VALUES (?, ?)', (key, json.dumps(result)))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    @staticmethod
+    def backfill(conn, rehash=False):
+        """Fingerprint rows that predate the index; `rehash` recomputes existing fingerprints too"""
+        rows = conn.execute(f'''
+            SELECT t.id, t.amount, t.category, t.description, t.type, t.date, t.currency
+            FROM transactions t
+            LEFT JOIN transaction_fingerprints f ON f.transaction_id = t.id
+            {'' if rehash else 'WHERE f.transaction_id IS NULL'}
+        ''').fetchall()
+        entries = []
+        for txn_id, amount, category, description, txn_type, txn_date, currency in rows:
+            fingerprint, day = DuplicateIndex.fingerprint(amount, category, description, txn_type, txn_date, currency)
+            entries.append((txn_id, fingerprint, day))
+        # Upsert keeps duplicate_of on rows that are already indexed
+        conn.executemany('''
+            INSERT INTO transaction_fingerprints (transaction_id, fingerprint, day) VALUES (?, ?, ?)
+            ON CONFLICT (transaction_id) DO UPDATE SET fingerprint = excluded.fingerprint, day = excluded.day
+        ''', entries)
+
+    @staticmethod
+    def report():
+        """Group existing rows whose fingerprints collide within the window"""
+        with get_db(read_only=True) as conn:
+            pairs = conn.execute('''
+                SELECT a.transaction_id, b.transaction_id
+                FROM transaction_fingerprints a
+                JOIN transaction_fingerprints b
+                  ON b.fingerprint = a.fingerprint
+                 AND b.day BETWEEN a.day - ? AND a.day + ?
+                 AND b.transaction_id > a.transaction_id
+                ORDER BY a.transaction_id
+            ''', (DUPLICATE_WINDOW_DAYS, DUPLICATE_WINDOW_DAYS)).fetchall()
+
+            # Union-find over matching pairs; each group is keyed by its earliest id
+            parent = {}
+            
+            def find_root(txn_id):
+                while parent.setdefault(txn_id, txn_id) != txn_id:
+                    parent[txn_id] = parent[parent[txn_id]]
+                    txn_id = parent[txn_id]
+                return txn_id
+            
+            for first, second in pairs:
+                first_root, second_root = find_root(first), find_root(second)
+                if first_root != second_root:
+                    parent[max(first_root, second_root)] = min(first_root, second_root)
+            members = defaultdict(list)
+            for txn_id in parent:
+                members[find_root(txn_id)].append(txn_id)
+
+            ids = list(parent)
+            rows = {}
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for row in conn.execute(
+                        f'SELECT {", ".join(TRANSACTION_COLUMNS)} FROM transactions WHERE id IN ({placeholders})', chunk):
+                    rows[row['id']] = dict(row)
+
+        return [
+            {
+                "original_id": root,
+                "duplicate_ids": sorted(txn_id for txn_id in txn_ids if txn_id != root),
+                "transactions": [rows[txn_id] for txn_id in sorted(txn_ids) if txn_id in rows]
+            }
+            for root, txn_ids in sorted(members.items())
+        ]
+
+# CPU-bound analytics offload
+ANALYTICS_WORKERS = int(os.environ.get('ANALYTICS_WORKERS', 0))
+ANALYTICS_TIMEOUT_SECONDS = float(os.environ.get('ANALYTICS_TIMEOUT_SECONDS', 10))
+
+class AnalyticsTimeout(Exception):
+    """An analytics job did not finish within ANALYTICS_TIMEOUT_SECONDS"""
+
+def _analytics_worker_ready():
+    return os.getpid()
+
+def _analytics_worker_init(settings):
+    """Apply the parent's create_app settings; spawned workers import this module afresh"""
+    global advice_engine
+    globals().update(settings)
+    if settings.keys() & _SERVICE_SETTINGS['advice_engine']:
+        advice_engine = AdviceEngine()
+
+class AnalyticsPool:
+    """Managed process pool for CPU-bound analytics (advice rules, sketch merges, simulations)
+
+    Jobs are module-level functions over compact inputs: arrays, sketch
+    blobs and plain numbers gathered on the request thread, never row dicts
+    or connections. Workers are spawned (not forked, so threads and open
+    SQLite handles stay in the parent) and pre-warmed on start. A job that
+    runs past its timeout is cancelled if it has not started; a running one
+    finishes in the background while the caller gets AnalyticsTimeout, which
+    is why long work (simulations) is submitted as many short chunks. With
+    no workers configured every job runs inline on the calling thread.
+    """
+
+    def __init__(self, workers=None, timeout=None):
+        self.workers = ANALYTICS_WORKERS if workers is None else workers
+        self.timeout = ANALYTICS_TIMEOUT_SECONDS if timeout is None else timeout
+        self._executor = None
+        self.completed = 0
+        self.timed_out = 0
+
+    @property
+    def running(self):
+        return self._executor is not None
+
+    def start(self):
+        """Spawn the workers and wait until each has imported this module"""
+        if self._executor is not None or self.workers <= 0:
+            return self
+        import multiprocessing
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_analytics_worker_init, initargs=(dict(_settings),)
+        )
+        # One ping per worker forces every process to start now rather than on the first request
+        futures_wait([self._executor.submit(_analytics_worker_ready) for _ in range(self.workers)])
+        return self
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def run(self, function, *args, timeout=None):
+        """function(*args) in a worker; raises AnalyticsTimeout past the deadline"""
+        if self._executor is None:
+            return function(*args)
+        future = self._executor.submit(function, *args)
+        try:
+            result = future.result(timeout or self.timeout)
+        except FuturesTimeout:
+            future.cancel()
+            self.timed_out += 1
+            raise AnalyticsTimeout(function.__name__)
+        self.completed += 1
+        return result
+
+    def map(self, function, jobs, timeout=None):
+        """[function(*job) for job in jobs] across the workers, under one deadline for the batch"""
+        if self._executor is None:
+            return [function(*job) for job in jobs]
+        futures = [self._executor.submit(function, *job) for job in jobs]
+        done, pending = futures_wait(futures, timeout or self.timeout)
+        if pending:
+            for future in pending:
+                future.cancel()
+            self.timed_out += 1
+            raise AnalyticsTimeout(function.__name__)
+        self.completed += 1
+        return [future.result() for future in futures]
+
+analytics_pool = AnalyticsPool()
+
+metrics.register_gauge(
+    'analytics_pool_workers', 'Worker processes in the analytics pool (0: jobs run inline)',
+    lambda: {(): analytics_pool.workers if analytics_pool.running else 0}
+)
+metrics.register_gauge(
+    'analytics_jobs', 'Analytics pool jobs by outcome',
+    lambda: {(('outcome', 'completed'),): analytics_pool.completed, (('outcome', 'timeout'),): analytics_pool.timed_out}
+    if analytics_pool.running else {}
+)
+
+# Report exports: files written by a small background pool, downloadable until they expire
+EXPORT_DIR = os.environ.get('EXPORT_DIR', 'exports')
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 1))
+# Jobs waiting beyond the running ones; more are refused with 429
+EXPORT_MAX_QUEUE = int(os.environ.get('EXPORT_MAX_QUEUE', 8))
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', 5000))
+EXPORT_PAUSE_MS = float(os.environ.get('EXPORT_PAUSE_MS', 5))
+EXPORT_MAX_DEFER_MS = float(os.environ.get('EXPORT_MAX_DEFER_MS', 500))
+EXPORT_TTL_HOURS = int(os.environ.get('EXPORT_TTL_HOURS', 24))
+
+export_log = logging.getLogger('finance_tracker.exports')
+
+class CSVExport:
+    """CSV with a header row"""
+
+    def __init__(self, handle, columns):
+        self._text = io.TextIOWrapper(handle, encoding='utf-8', newline='')
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._text.flush()
+
+    def close(self):
+        self._text.flush()
+        self._text.detach()
+
+class JSONLinesExport:
+    """One JSON object per row, encoded a batch at a time by RowEncoder"""
+
+    def __init__(self, handle, columns):
+        self._handle = handle
+        self._encoder = row_encoder(tuple(columns))
+
+    def write(self, rows):
+        self._handle.write(self._encoder.lines(rows).encode('utf-8'))
+
+    def close(self):
+        pass
+
+class ColumnarExport:
+    """Compressed columnar file laid out like Parquet: row groups of column chunks and a footer
+
+    The file is MAGIC, then for each row group (one write batch) one
+    zlib-compressed chunk per column, then a JSON footer listing the columns,
+    their types and every group's row count and chunk offsets, then the
+    footer's length (8 bytes, little-endian) and MAGIC again. Numeric columns
+    are stored as little-endian int64/float64; text columns are dictionary
+    encoded per group (the distinct values as JSON, then int32 codes), which
+    makes category, type and currency nearly free. `read` is the reference
+    reader. Memory is bounded by one group.
+    """
+
+    MAGIC = b'FTCOL1'
+    TYPES = {'id': '<i8', 'amount': '<f8'}   # everything else is text
+
+    def __init__(self, handle, columns):
+        self._handle = handle
+        self._columns = tuple(columns)
+        self._groups = []
+        handle.write(self.MAGIC)
+
+    def _chunk(self, column, values):
+        dtype = self.TYPES.get(column)
+        if dtype:
+            payload = np.array(values, dtype=dtype).tobytes()
+        else:
+            dictionary = {}
+            codes = array('i', [dictionary.setdefault(value, len(dictionary)) for value in values])
+            words = json.dumps(list(dictionary), separators=(',', ':')).encode('utf-8')
+            payload = struct.pack('<Q', len(words)) + words + codes.tobytes()
+        return zlib.compress(payload, 6)
+
+    def write(self, rows):
+        chunks = []
+        for column, values in zip(self._columns, zip(*rows)):
+            data = self._chunk(column, values)
+            chunks.append((self._handle.tell(), len(data)))
+            self._handle.write(data)
+        self._groups.append({"rows": len(rows), "chunks": chunks})
+
+    def close(self):
+        footer = json.dumps({
+            "columns": list(self._columns),
+            "types": [self.TYPES.get(column, 'text') for column in self._columns],
+            "row_groups": self._groups,
+        }, separators=(',', ':')).encode('utf-8')
+        self._handle.write(footer + struct.pack('<Q', len(footer)) + self.MAGIC)
+
+    @classmethod
+    def read(cls, path):
+        """(columns, iterator of row-tuple lists, one per row group)"""
+        with open(path, 'rb') as handle:
+            handle.seek(-len(cls.MAGIC) - 8, os.SEEK_END)
+            footer_length = struct.unpack('<Q', handle.read(8))[0]
+            if handle.read() != cls.MAGIC:
+                raise ValueError(f"{path} is not a columnar export")
+            handle.seek(-len(cls.MAGIC) - 8 - footer_length, os.SEEK_END)
+            footer = json.loads(handle.read(footer_length))
+
+        def groups():
+            with open(path, 'rb') as handle:
+                for group in footer["row_groups"]:
+                    columns = []
+                    for kind, (offset, length) in zip(footer["types"], group["chunks"]):
+                        handle.seek(offset)
+                        payload = zlib.decompress(handle.read(length))
+                        if kind != 'text':
+                            columns.append(np.frombuffer(payload, dtype=kind).tolist())
+                            continue
+                        words_length = struct.unpack('<Q', payload[:8])[0]
+                        words = json.loads(payload[8:8 + words_length])
+                        columns.append(list(map(words.__getitem__, array('i', payload[8 + words_length:]))))
+                    yield list(zip(*columns))
+
+        return tuple(footer["columns"]), groups()
+
+class ExportJobs:
+    """Background ledger exports on a bounded thread pool, with progress in the export_jobs table
+
+    A job streams the range from storage.stream, one EXPORT_BATCH_ROWS
+    batch at a time, straight into the format's writer, so memory stays at
+    one batch whatever the size of the ledger. Between batches it records
+    progress and yields like maintenance does: a short sleep, then a bounded
+    wait for this worker's in-flight requests to finish, so exports soak up
+    idle time instead of competing with interactive requests. Files are
+    written under a temporary name and renamed when complete. Job state is
+    in the database, so any worker can report on or serve any job.
+    """
+
+    FORMATS = {
+        'csv': (CSVExport, '.csv', 'text/csv'),
+        'jsonl': (JSONLinesExport, '.jsonl', 'application/x-ndjson'),
+        'columnar': (ColumnarExport, '.ftcol', 'application/octet-stream'),
+    }
+
+    def __init__(self, workers=None, max_queue=None):
+        self.workers = EXPORT_WORKERS if workers is None else workers
+        self.max_queue = EXPORT_MAX_QUEUE if max_queue is None else max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self.active = 0      # queued or running in this process
+        self.completed = 0
+        self.failed = 0
 
-class AIFinanceTracker:
-    """Enhanced AI Finance Tracker with database integration"""
-    
-    @staticmethod
-    def add_transaction(amount, category, description, transaction_type):
-        """Add a new transaction to the database"""
-        with get_db() as conn:
-            conn.execute(
-                'INSERT INTO transactions (amount, category, description, type) VALUES (?, ?, ?, ?)',
-                (float(amount), category, description, transaction_type)
-            )
-            conn.commit()
-            return {"success": True, "message": f"{transaction_type.capitalize()} of ${amount} added successfully!"}
-    
     @staticmethod
-    def get_transactions(limit=None, days=None):
-        """Get transactions with optional filters"""
-        query = 'SELECT * FROM transactions'
-        params = []
-        
-        if days:
-            query += ' WHERE date >= ?'
-            params.append((datetime.now() - timedelta(days=days)).isoformat())
-        
-        query += ' ORDER BY date DESC'
-        
-        if limit:
-            query += ' LIMIT ?'
-            params.append(limit)
-        
-        with get_db() as conn:
-            return [dict(row) for row in conn.execute(query, params).fetchall()]
-    
+    def export_range(month=None, start=None, end=None):
+        """(since, until) timestamps for a 'YYYY-MM' statement month or inclusive start/end dates"""
+        for name, value in (('month', month), ('start', start), ('end', end)):
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"{name} must be a date string")
+        if month:
+            first = datetime.strptime(month, '%Y-%m')
+            following = (first + timedelta(days=32)).replace(day=1)
+            return normalize_timestamp(first), normalize_timestamp(following)
+        since = normalize_timestamp(start) if start else None
+        until = normalize_timestamp(datetime.fromisoformat(end[:10]) + timedelta(days=1)) if end else None
+        return since, until
+
+    def submit(self, export_format, since=None, until=None):
+        """Queue an export; returns its status, or None when the queue is full"""
+        with self._lock:
+            if self.active >= self.workers + self.max_queue:
+                return None
+            self.active += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export')
+        job_id = secrets.token_hex(8)
+        queued = False
+        try:
+            with get_db() as conn:
+                conn.execute(
+                    "INSERT INTO export_jobs (id, format, since, until, status) VALUES (?, ?, ?, ?, 'queued')",
+                    (job_id, export_format, since, until)
+                )
+                conn.commit()
+            queued = True
+            self._executor.submit(self._run, job_id, export_format, since, until)
+        except Exception as error:
+            # The slot taken above is only given back by _run, which will never run
+            with self._lock:
+                self.active -= 1
+                self.failed += 1
+            if queued:
+                self._update(job_id, status='failed', error=str(error), finished_date=normalize_timestamp(None))
+            raise
+        return self.status(job_id)
+
     @staticmethod
-    def set_budget(category, amount):
-        """Set or update budget for a category"""
+    def _update(job_id, **fields):
         with get_db() as conn:
             conn.execute(
-                'INSERT OR REPLACE INTO budgets (category, amount) VALUES (?, ?)',
-                (category, float(amount))
+                f'UPDATE export_jobs SET {", ".join(f"{name} = ?" for name in fields)} WHERE id = ?',
+                (*fields.values(), job_id)
             )
             conn.commit()
-            return {"success": True, "message": f"Budget set: ${amount} for {category}"}
-    
+
     @staticmethod
-    def get_budgets():
-        """Get all budgets"""
-        with get_db() as conn:
-            return [dict(row) for row in conn.execute('SELECT * FROM budgets').fetchall()]
-    
+    def pause():
+        """Bounded yield between batches, as in Maintenance.pause"""
+        time.sleep(EXPORT_PAUSE_MS / 1000)
+        deadline = time.monotonic() + EXPORT_MAX_DEFER_MS / 1000
+        while metrics.in_flight > 0 and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def _run(self, job_id, export_format, since, until):
+        writer_class, extension, _ = self.FORMATS[export_format]
+        path = os.path.join(EXPORT_DIR, job_id + extension)
+        partial = path + '.part'
+        succeeded = False
+        try:
+            self._update(job_id, status='running', total_rows=storage.count(since, until))
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            written = 0
+            with open(partial, 'wb') as handle:
+                writer = writer_class(handle, TRANSACTION_COLUMNS)
+                for rows in storage.stream(since, until, batch=EXPORT_BATCH_ROWS):
+                    writer.write(rows)
+                    written += len(rows)
+                    self._update(job_id, rows=written, bytes=handle.tell())
+                    self.pause()
+                writer.close()
+            os.replace(partial, path)
+            self._update(job_id, status='done', rows=written, bytes=os.path.getsize(path),
+                         file=os.path.basename(path), finished_date=normalize_timestamp(None))
+            succeeded = True
+        except Exception as error:
+            export_log.warning("export %s failed: %s", job_id, error)
+            if os.path.exists(partial):
+                os.remove(partial)
+            self._update(job_id, status='failed', error=str(error), finished_date=normalize_timestamp(None))
+        finally:
+            with self._lock:
+                self.active -= 1
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
     @staticmethod
-    def get_spending_by_category(days=30):
-        """Get spending breakdown by category for the last N days"""
-        cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
-        
+    def _describe(row):
+        job = dict(row)
+        total = job["total_rows"]
+        job["progress"] = 1.0 if job["status"] == 'done' else round(min(job["rows"] / total, 1.0), 4) if total else 0.0
+        job["download"] = f"/api/exports/{job['id']}/download" if job["status"] == 'done' else None
+        return job
+
+    def status(self, job_id):
+        """A job's state and progress, or None"""
         with get_db() as conn:
-            rows = conn.execute('''
-                SELECT category, SUM(amount) as total
-                FROM transactions 
-                WHERE type = 'expense' AND date >= ?
-                GROUP BY category
-            ''', (cutoff_date,)).fetchall()
-            
-            return {row['category']: row['total'] for row in rows}
-    
-    @staticmethod
-    def get_income_vs_expenses(days=30):
-        """Calculate total income vs expenses for the last N days"""
-        cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
-        
+            row = conn.execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._describe(row) if row else None
+
+    def recent(self, limit=20):
+        """Latest jobs, newest first"""
         with get_db() as conn:
-            result = conn.execute('''
-                SELECT 
-                    type,
-                    SUM(amount) as total
-                FROM transactions 
-                WHERE date >= ?
-                GROUP BY type
-            ''', (cutoff_date,)).fetchall()
-            
-            income = 0
-            expenses = 0
-            for row in result:
-                if row['type'] == 'income':
-                    income = row['total']
-                elif row['type'] == 'expense':
-                    expenses = row['total']
-            
-            return {"income": income, "expenses": expenses}
-    
-    @staticmethod
-    def get_budget_status():
-        """Check budget status for all categories"""
-        spending = AIFinanceTracker.get_spending_by_category(30)
-        budgets = AIFinanceTracker.get_budgets()
-        
-        status = {}
-        for budget in budgets:
-            category = budget['category']
-            spent = spending.get(category, 0)
-            budget_amount = budget['amount']
-            percentage_used = (spent / budget_amount) * 100 if budget_amount > 0 else 0
-            
-            status[category] = {
-                "spent": spent,
-                "budget": budget_amount,
-                "remaining": budget_amount - spent,
-                "percentage_used": percentage_used
-            }
-        
-        return status
-    
+            rows = conn.execute('SELECT * FROM export_jobs ORDER BY created_date DESC, rowid DESC LIMIT ?', (limit,)).fetchall()
+        return [self._describe(row) for row in rows]
+
     @staticmethod
-    def generate_ai_advice():
-        """Generate comprehensive AI-powered financial insights"""
-        advice = []
-        
-        # Get financial data
-        income_expenses = AIFinanceTracker.get_income_vs_expenses(30)
-        income = income_expenses["income"]
-        expenses = income_expenses["expenses"]
-        spending_by_category = AIFinanceTracker.get_spending_by_category(30)
-        budget_status = AIFinanceTracker.get_budget_status()
-        recent_transactions = AIFinanceTracker.get_transactions(days=7)
-        
-        # Financial health analysis
-        if expenses > income and income > 0:
-            deficit = expenses - income
-            advice.append({
-                "type": "alert",
-                "icon": "🚨",
-                "message": f"ALERT: You're spending ${deficit:.2f} more than you earn this month!",
-                "suggestion": "Consider reducing discretionary expenses or finding additional income sources."
-            })
-        elif income > expenses and income > 0:
-            surplus = income - expenses
-            advice.append({
-                "type": "positive",
-                "icon": "🎉", 
-                "message": f"Great job! You have a surplus of ${surplus:.2f} this month.",
-                "suggestion": "Consider saving or investing this extra money for future goals."
-            })
-        
-        # Budget analysis with advanced insights
-        for category, status in budget_status.items():
-            if status["percentage_used"] > 100:
-                overspend = status["spent"] - status["budget"]
-                advice.append({
-                    "type": "warning",
-                    "icon": "🚨",
-                    "message": f"Over budget in {category} by ${overspend:.2f}",
-                    "suggestion": f"You've used {status['percentage_used']:.1f}% of your {category} budget. Consider cutting back on non-essential {category.lower()} expenses."
-                })
-            elif status["percentage_used"] > 80:
-                advice.append({
-                    "type": "caution",
-                    "icon": "⚡",
-                    "message": f"Close to {category} budget limit ({status['percentage_used']:.1f}% used)",
-                    "suggestion": f"You have ${status['remaining']:.2f} left in your {category} budget. Plan carefully for the rest of the month."
-                })
-        
-        # Spending pattern analysis
-        if spending_by_category:
-            top_category = max(spending_by_category, key=spending_by_category.get)
-            top_amount = spending_by_category[top_category]
-            
-            advice.append({
-                "type": "info",
-                "icon": "📊",
-                "message": f"Your highest spending category is {top_category} (${top_amount:.2f})",
-                "suggestion": f"This represents {(top_amount/expenses*100):.1f}% of your total expenses." if expenses > 0 else ""
-            })
-            
-            # Category-specific advice
-            if income > 0 and top_amount > income * 0.3:
-                advice.append({
-                    "type": "insight",
-                    "icon": "💭",
-                    "message": f"Your {top_category} spending is high relative to income",
-                    "suggestion": f"Consider if {top_amount:.2f} on {top_category} aligns with your financial priorities."
-                })
-        
-        # Savings recommendations with specific targets
-        if income > 0:
-            savings_rate = ((income - expenses) / income) * 100
-            if savings_rate < 0:
-                advice.append({
-                    "type": "urgent",
-                    "icon": "🆘",
-                    "message": "Negative savings rate - spending exceeds income",
-                    "suggestion": "Create an emergency budget focusing only on essential expenses."
-                })
-            elif savings_rate < 10:
-                target_savings = income * 0.10
-                advice.append({
-                    "type": "goal",
-                    "icon": "💰",
-                    "message": f"Current savings rate: {savings_rate:.1f}%",
-                    "suggestion": f"Aim to save ${target_savings:.2f} monthly (10% of income) for financial security."
-                })
-            elif savings_rate >= 20:
-                advice.append({
-                    "type": "excellent",
-                    "icon": "🌟",
-                    "message": f"Excellent savings rate of {savings_rate:.1f}%!",
-                    "suggestion": "Consider diversifying investments or increasing emergency fund contributions."
-                })
-        
-        # Transaction behavior insights
-        if len(recent_transactions) > 20:
-            daily_avg = len(recent_transactions) / 7
-            advice.append({
-                "type": "behavioral",
-                "icon": "📱",
-                "message": f"High transaction frequency: {len(recent_transactions)} transactions this week",
-                "suggestion": f"Averaging {daily_avg:.1f} transactions per day. Consider consolidating purchases to reduce impulse spending."
-            })
-        
-        # Emergency fund recommendation
-        monthly_expenses = expenses
-        if monthly_expenses > 0:
-            emergency_fund_target = monthly_expenses * 3  # 3 months of expenses
-            advice.append({
-                "type": "planning",
-                "icon": "🛡️",
-                "message": "Emergency Fund Recommendation",
-                "suggestion": f"Based on your monthly expenses (${monthly_expenses:.2f}), aim for an emergency fund of ${emergency_fund_target:.2f} (3 months of expenses)."
-            })
-        
-        # If no specific advice, provide encouragement
-        if not advice:
-            advice.append({
-                "type": "encouragement",
-                "icon": "💡",
-                "message": "Keep tracking your finances!",
-                "suggestion": "More insights will be available as you add more transaction data. You're building great financial habits!"
-            })
-        
-        return advice
+    def expire(conn, hours=None):
+        """Delete finished jobs older than `hours` and their files; returns how many"""
+        hours = EXPORT_TTL_HOURS if hours is None else hours
+        rows = conn.execute(
+            "SELECT id, file FROM export_jobs WHERE status IN ('done', 'failed') AND created_date < datetime('now', ?)",
+            (f'-{hours} hours',)
+        ).fetchall()
+        for _, name in rows:
+            if name and os.path.exists(os.path.join(EXPORT_DIR, name)):
+                os.remove(os.path.join(EXPORT_DIR, name))
+        conn.executemany('DELETE FROM export_jobs WHERE id = ?', [(job_id,) for job_id, _ in rows])
+        conn.commit()
+        return len(rows)
+
+export_jobs = ExportJobs()
+
+metrics.register_gauge(
+    'export_jobs', 'Export jobs handled by this worker',
+    lambda: {(('state', 'active'),): export_jobs.active, (('state', 'completed'),): export_jobs.completed,
+             (('state', 'failed'),): export_jobs.failed}
+)
 
 # Frontend HTML embedded in Python
 HTML_CONTENT = '''<!DOCTYPE html>
@@ -875,11 +5668,11 @@ HTML_CONTENT = '''<!DOCTYPE html>
         async function apiCall(endpoint, options = {}) {
             try {
                 const response = await fetch(`${API_BASE}${endpoint}`, {
+                    ...options,
                     headers: {
                         'Content-Type': 'application/json',
                         ...options.headers
-                    },
-                    ...options
+                    }
                 });
                 
                 if (!response.ok) {
@@ -917,12 +5710,91 @@ HTML_CONTENT = '''<!DOCTYPE html>
             }
         }
 
+        // Local copy of the dashboard data, kept current with /api/changes deltas
+        const RECENT_LIMIT = 10;
+        const dashboard = { version: null, windowDay: null, ratesVersion: null, summary: null, transactions: [], budgets: [] };
+
+        function applyChanges(changes) {
+            const summary = dashboard.summary;
+            const delta = changes.summary_delta;
+            summary.income_expenses.income += delta.income;
+            summary.income_expenses.expenses += delta.expenses;
+            Object.entries(delta.spending_by_category).forEach(([category, amount]) => {
+                summary.spending_by_category[category] = (summary.spending_by_category[category] || 0) + amount;
+            });
+            
+            // Budgets are replaced, so a changed one moves to the end (matches server order)
+            changes.budgets.forEach(budget => {
+                dashboard.budgets = dashboard.budgets.filter(existing => existing.category !== budget.category);
+                dashboard.budgets.push(budget);
+            });
+            // Parent budgets roll up their subtree, so the server sends the status whenever anything changed
+            if (changes.budget_status) {
+                summary.budget_status = changes.budget_status;
+            }
+            
+            dashboard.transactions = changes.transactions.concat(dashboard.transactions)
+                .sort((a, b) => (b.date > a.date) - (b.date < a.date) || b.id - a.id)
+                .slice(0, RECENT_LIMIT);
+            dashboard.version = changes.version;
+        }
+
+        // One sync at a time, so the same delta is never applied twice. A caller arriving while one
+        // runs (it may predate the caller's own write) waits for a single follow-up sync shared by all
+        let syncInFlight = null;
+        let syncNext = null;
+
+        function syncDashboard() {
+            if (syncInFlight === null) {
+                syncInFlight = fetchChanges().finally(() => { syncInFlight = null; });
+                return syncInFlight;
+            }
+            if (syncNext === null) {
+                syncNext = syncInFlight.catch(() => {}).then(() => {
+                    syncNext = null;
+                    return syncDashboard();
+                });
+            }
+            return syncNext;
+        }
+
+        async function fetchChanges() {
+            const since = dashboard.version;
+            let changes = null;
+            if (since !== null) {
+                changes = await apiCall(`/changes?since=${since}&limit=${RECENT_LIMIT}`);
+                // The 30-day window moved or the FX rates changed: totals from the delta alone would drift
+                if (!changes.reset && (changes.window_start.slice(0, 10) !== dashboard.windowDay
+                        || changes.rates_version !== dashboard.ratesVersion)) {
+                    changes = null;
+                }
+            }
+            if (changes === null) {
+                changes = await apiCall(`/changes?limit=${RECENT_LIMIT}`);
+            }
+            
+            if (changes.reset) {
+                dashboard.summary = changes.summary;
+                dashboard.transactions = changes.transactions;
+                dashboard.budgets = changes.budgets;
+                dashboard.version = changes.version;
+            } else if (since === dashboard.version) {
+                applyChanges(changes);
+            } else {
+                // The local copy moved past `since` meanwhile; this delta is already counted
+                return dashboard;
+            }
+            dashboard.windowDay = changes.window_start.slice(0, 10);
+            dashboard.ratesVersion = changes.rates_version;
+            return dashboard;
+        }
+
         // Dashboard Functions
         async function loadDashboard() {
             try {
-                const summary = await apiCall('/summary');
+                const { summary, transactions } = await syncDashboard();
                 updateSummaryCards(summary);
-                await loadRecentTransactions();
+                renderRecentTransactions(transactions);
                 updateBudgetOverview(summary.budget_status);
             } catch (error) {
                 console.error('Failed to load dashboard:', error);
@@ -943,9 +5815,8 @@ HTML_CONTENT = '''<!DOCTYPE html>
             netBalanceElement.className = `summary-item ${netBalance >= 0 ? 'positive' : 'negative'}`;
         }
 
-        async function loadRecentTransactions() {
+        function renderRecentTransactions(transactions) {
             try {
-                const transactions = await apiCall('/transactions?limit=10');
                 const container = document.getElementById('recentTransactions');
                 
                 if (transactions.length === 0) {
@@ -956,6 +5827,10 @@ HTML_CONTENT = '''<!DOCTYPE html>
                 container.innerHTML = transactions.map(transaction => {
                     const date = new Date(transaction.date).toLocaleDateString();
                     const emoji = transaction.type === 'income' ? '💰' : '💸';
+                    // Amounts are shown as entered; foreign ones carry their currency code
+                    const amount = transaction.currency && transaction.currency !== dashboard.summary.currency
+                        ? `${transaction.amount.toFixed(2)} ${transaction.currency}`
+                        : `$${transaction.amount.toFixed(2)}`;
                     
                     return `
                         <div class="transaction-item">
@@ -964,7 +5839,7 @@ HTML_CONTENT = '''<!DOCTYPE html>
                                 <div class="transaction-description">${transaction.description}</div>
                             </div>
                             <div class="transaction-amount ${transaction.type}">
-                                ${transaction.type === 'income' ? '+' : '-'}$${transaction.amount.toFixed(2)}
+                                ${transaction.type === 'income' ? '+' : '-'}${amount}
                             </div>
                         </div>
                     `;
@@ -1008,10 +5883,18 @@ HTML_CONTENT = '''<!DOCTYPE html>
         }
 
         // Transaction Functions
+        function newIdempotencyKey() {
+            if (window.crypto && crypto.randomUUID) {
+                return crypto.randomUUID();
+            }
+            return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        }
+
         async function addTransaction(type, data) {
             try {
                 const result = await apiCall('/transactions', {
                     method: 'POST',
+                    headers: { 'Idempotency-Key': newIdempotencyKey() },
                     body: JSON.stringify({
                         ...data,
                         type: type
@@ -1045,7 +5928,7 @@ HTML_CONTENT = '''<!DOCTYPE html>
 
         async function loadBudgetStatus() {
             try {
-                const summary = await apiCall('/summary');
+                const { summary } = await syncDashboard();
                 const container = document.getElementById('budgetStatus');
                 const budgetStatus = summary.budget_status;
                 const budgets = Object.keys(budgetStatus);
@@ -1183,7 +6066,7 @@ HTML_CONTENT = '''<!DOCTYPE html>
             loadDashboard();
             
             // Test backend connection
-            apiCall('/summary').then(() => {
+            syncDashboard().then(() => {
                 document.getElementById('connectionStatus').textContent = '🔗 Rohan Chadha (CS4365)';
             }).catch(() => {
                 document.getElementById('connectionStatus').textContent = '❌ Backend Disconnected';
@@ -1194,29 +6077,206 @@ HTML_CONTENT = '''<!DOCTYPE html>
 </html>'''
 
 # API Routes
+@app.errorhandler(AnalyticsTimeout)
+def analytics_timeout(error):
+    """An offloaded analytics job ran past its deadline"""
+    response = jsonify({"success": False, "message": "Analysis timed out, please retry"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+@app.route('/healthz/live')
+def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return jsonify({"status": "alive", "pid": os.getpid()})
+
+@app.route('/healthz/ready')
+def readiness():
+    """Readiness probe: the worker has initialized and the database answers"""
+    if not _worker_ready:
+        return jsonify({"status": "starting", "pid": os.getpid()}), 503
+    try:
+        with get_db() as conn:
+            conn.execute('SELECT 1').fetchone()
+    except sqlite3.Error as error:
+        return jsonify({"status": "unavailable", "error": str(error), "pid": os.getpid()}), 503
+    return jsonify({"status": "ready", "pid": os.getpid()})
+
+@app.route('/api/metrics')
+def metrics_endpoint():
+    """Per-route latency and per-statement SQL metrics in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiling', methods=['GET', 'POST'])
+def profiling():
+    """Inspect or change runtime profiling (admin token required)"""
+    if not profiler.is_admin(request):
+        return jsonify({"success": False, "message": "Profiling requires a valid X-Profile-Token"}), 403
+    if request.method == 'POST':
+        data = request.json or {}
+        profiler.sample_rate = min(max(float(data.get('sample_rate', 0)), 0.0), 1.0)
+        profiler.routes = set(data.get('routes') or ())
+    return jsonify({
+        "sample_rate": profiler.sample_rate,
+        "routes": sorted(profiler.routes),
+        "profiles": list(profiler.recent)
+    })
+
+@app.route('/api/profiles/<profile_id>')
+def download_profile(profile_id):
+    """Download a collapsed-stack profile (flamegraph.pl / speedscope input)"""
+    if not profiler.is_admin(request):
+        return jsonify({"success": False, "message": "Profiling requires a valid X-Profile-Token"}), 403
+    return send_from_directory(os.path.abspath(PROFILE_DIR), profile_id + '.collapsed',
+                               mimetype='text/plain', as_attachment=True)
+
+@lru_cache(maxsize=1)
+def index_page():
+    """The page as (UTF-8 body, gzipped body, ETag), encoded on first request rather than at import"""
+    body = HTML_CONTENT.encode('utf-8')
+    return body, gzip.compress(body, 6, mtime=0), hashlib.sha256(body).hexdigest()[:16]
+
 @app.route('/')
 def index():
     """Serve the main application with embedded HTML"""
-    return HTML_CONTENT
+    body, compressed, etag = index_page()
+    if 'gzip' in request.accept_encodings:
+        response = Response(compressed, mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='text/html')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def date_error(*rows):
+    """Error body for the first row whose date cannot be parsed, or None"""
+    for row in rows:
+        try:
+            normalize_timestamp(row.get('date'))
+        except ValueError:
+            return {"success": False, "message": f"Invalid date '{row.get('date')}'; expected an ISO 8601 date or timestamp"}
+    return None
+
+def type_error(*rows):
+    """Error body for the first row whose type is not income or expense, or None"""
+    for row in rows:
+        if row.get('type') not in MemoryStorage.TYPES:
+            return {"success": False, "message": f"Transaction type must be one of: {', '.join(MemoryStorage.TYPES)}"}
+    return None
+
+def tags_error(*rows):
+    """Error body for the first row whose tags are not a list of non-empty strings, or None"""
+    for row in rows:
+        tags = row.get('tags')
+        if tags is not None and not (isinstance(tags, list) and all(isinstance(tag, str) and tag.strip() for tag in tags)):
+            return {"success": False, "message": "tags must be a list of non-empty strings"}
+    return None
+
+def backend_error(feature):
+    """Error body when `feature` is only maintained by the SQLite backend and another is configured, or None"""
+    if storage.name != 'sqlite':
+        return {"success": False, "message": f"{feature} need the 'sqlite' storage backend (STORAGE_BACKEND={storage.name})"}
+    return None
+
+def dimensions_error(*rows):
+    """Error body when rows carry tags or a merchant the storage backend cannot keep, or None"""
+    if any(row.get('tags') or row.get('merchant') for row in rows):
+        return backend_error("Tags and merchants")
+    return None
+
+def duplicate_policy_error(*policies):
+    """Error body for the first given on_duplicate value that is not a known policy, or None"""
+    for policy in policies:
+        if policy is not None and policy not in DUPLICATE_POLICIES:
+            return {"success": False, "message": f"on_duplicate must be one of: {', '.join(DUPLICATE_POLICIES)}"}
+    return None
+
+def currency_error(*currencies):
+    """Error body for the first given currency the FX rates do not cover, or None"""
+    for currency in currencies:
+        if currency is not None and currency not in fx_rates.currencies:
+            return {"success": False, "message": f"No exchange rates for currency '{currency}'"}
+    return None
 
 @app.route('/api/transactions', methods=['GET', 'POST'])
 def transactions():
     """Handle transaction operations"""
     if request.method == 'POST':
         data = request.json
+        rows = data if isinstance(data, list) else [data]
+        error = (currency_error(*(row.get('currency') for row in rows)) or type_error(*rows) or date_error(*rows)
+                 or tags_error(*rows) or dimensions_error(*rows)
+                 or duplicate_policy_error(*(row.get('on_duplicate') for row in rows))
+                 or duplicate_policy_error(request.args.get('on_duplicate') if isinstance(data, list) else None))
+        if error:
+            return jsonify(error), 400
+        if isinstance(data, list):
+            # Bulk import; duplicates are skipped unless ?on_duplicate=flag|allow
+            result = AIFinanceTracker.add_transactions(
+                data,
+                on_duplicate=request.args.get('on_duplicate', 'reject')
+            )
+            return jsonify(result)
+        
         result = AIFinanceTracker.add_transaction(
             data['amount'],
             data['category'], 
             data['description'],
-            data['type']
+            data['type'],
+            data.get('date'),
+            on_duplicate=data.get('on_duplicate', DUPLICATE_POLICY),
+            idempotency_key=request.headers.get('Idempotency-Key'),
+            currency=data.get('currency'),
+            merchant=data.get('merchant'),
+            tags=data.get('tags')
         )
-        return jsonify(result)
+        return jsonify(result), (200 if result["success"] else 409)
     
-    # GET request
+    # GET request; ?shape=columnar returns {"columns": [...], "rows": [[...], ...]}
+    shape = request.args.get('shape', 'objects')
+    if shape not in RESPONSE_SHAPES:
+        return jsonify({"success": False, "message": f"Unknown shape '{shape}'"}), 400
     days = request.args.get('days', type=int)
     limit = request.args.get('limit', type=int)
-    transactions = AIFinanceTracker.get_transactions(limit=limit, days=days)
-    return jsonify(transactions)
+    columns, rows = AIFinanceTracker.get_transaction_rows(limit=limit, days=days)
+    return rows_response(columns, rows, shape)
+
+@app.route('/api/transactions/<int:transaction_id>/tags', methods=['POST'])
+def transaction_tags(transaction_id):
+    """Add tags to an existing transaction"""
+    data = request.json or {}
+    error = backend_error("Tags and merchants") or (
+        tags_error(data) if data.get('tags') else {"success": False, "message": "tags is required"}
+    )
+    if error:
+        return jsonify(error), 400
+    result = AIFinanceTracker.tag_transaction(transaction_id, data['tags'])
+    return jsonify(result), (200 if result["success"] else 404)
+
+@app.route('/api/query')
+def query():
+    """Counts and totals filtered by tag, merchant, category (with its subtree), type and dates"""
+    currency = request.args.get('currency')
+    error = backend_error("Tag and merchant queries") or currency_error(currency)
+    if error:
+        return jsonify(error), 400
+    split = lambda name: [value for value in request.args.get(name, '').split(',') if value.strip()]
+    try:
+        result = AIFinanceTracker.query(
+            merchants=split('merchant'),
+            tags=split('tags'),
+            category=request.args.get('category'),
+            transaction_type=request.args.get('type'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            group=request.args.get('group'),
+            currency=currency,
+            limit=request.args.get('limit', default=0, type=int)
+        )
+    except ValueError as error:
+        return jsonify({"success": False, "message": str(error)}), 400
+    return jsonify(result)
 
 @app.route('/api/budgets', methods=['GET', 'POST'])
 def budgets():
@@ -1228,53 +6288,725 @@ def budgets():
     
     return jsonify(AIFinanceTracker.get_budgets())
 
+@app.route('/api/categories', methods=['GET', 'POST'])
+def categories():
+    """Category tree with subtree totals; POST {name, parent} creates or moves a category"""
+    if request.method == 'POST':
+        data = request.json or {}
+        if not data.get('name'):
+            return jsonify({"success": False, "message": "Category name is required"}), 400
+        try:
+            result = AIFinanceTracker.set_category_parent(data['name'], data.get('parent'))
+        except ValueError as error:
+            return jsonify({"success": False, "message": str(error)}), 400
+        return jsonify(result)
+    
+    currency = request.args.get('currency')
+    error = currency_error(currency)
+    if error:
+        return jsonify(error), 400
+    return jsonify(AIFinanceTracker.get_categories(request.args.get('days', default=30, type=int), currency))
+
+@app.route('/api/goals', methods=['GET', 'POST'])
+def goals():
+    """Savings goals with progress and projections; POST {name, target, deadline, categories, income_share} saves one"""
+    # Progress is only kept by SQLiteStorage's write path
+    error = backend_error("Savings goals")
+    if error:
+        return jsonify(error), 400
+    if request.method == 'POST':
+        data = request.json or {}
+        if not data.get('name') or data.get('target') is None:
+            return jsonify({"success": False, "message": "Goal name and target are required"}), 400
+        categories = data.get('categories') or []
+        if not (isinstance(categories, list) and all(isinstance(category, str) and category for category in categories)):
+            return jsonify({"success": False, "message": "categories must be a list of category names"}), 400
+        try:
+            result = AIFinanceTracker.set_goal(
+                data['name'], data['target'], data.get('deadline'), categories,
+                data.get('income_share', 0), data.get('saved')
+            )
+        except (TypeError, ValueError) as error:
+            return jsonify({"success": False, "message": str(error)}), 400
+        return jsonify(result)
+
+    return jsonify(AIFinanceTracker.get_goals())
+
 @app.route('/api/summary')
 def summary():
-    """Get financial summary data"""
-    return jsonify({
-        "income_expenses": AIFinanceTracker.get_income_vs_expenses(30),
-        "spending_by_category": AIFinanceTracker.get_spending_by_category(30),
-        "budget_status": AIFinanceTracker.get_budget_status()
-    })
+    """Get financial summary data, converted into ?currency= (default DISPLAY_CURRENCY)"""
+    currency = request.args.get('currency')
+    error = currency_error(currency)
+    if error:
+        return jsonify(error), 400
+    return jsonify(AIFinanceTracker.get_summary(currency))
+
+@app.route('/api/changes')
+def changes():
+    """Inserts, budget changes and summary deltas since ?since=<version>; a full snapshot without it"""
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', default=10, type=int)
+    return jsonify(AIFinanceTracker.get_changes(since, limit))
 
 @app.route('/api/ai-advice')
 def ai_advice():
     """Get AI-powered financial advice"""
     return jsonify(AIFinanceTracker.generate_ai_advice())
 
+@app.route('/api/advice-rules')
+def advice_rules():
+    """List the advice rules with the inputs each needs, hit counts and evaluation time"""
+    return jsonify(AIFinanceTracker.get_advice_rules())
+
+def digest_response(user_id):
+    """(JSON bytes or error dict, status) for a cached digest; the stored advice text is spliced in, not re-encoded"""
+    digest = AIFinanceTracker.get_advice_digest(user_id)
+    if digest is None:
+        return {"success": False, "message": f"No advice digest for user {user_id}"}, 404
+    advice, generated = digest
+    body = '{"advice":' + advice + ',"generated_date":' + json.dumps(generated) + ',"user_id":' + str(user_id) + '}'
+    return body.encode('utf-8'), 200
+
+@app.route('/api/advice-digest')
+def advice_digest():
+    """Get an account's advice from the last nightly digest (?user_id=, default 1)"""
+    body, status = digest_response(request.args.get('user_id', default=1, type=int))
+    if isinstance(body, dict):
+        return jsonify(body), status
+    return app.response_class(body + b'\n', mimetype='application/json')
+
+@app.route('/api/exports', methods=['GET', 'POST'])
+def exports():
+    """Queue a ledger export (POST {"format", "month" | "start"/"end"}) or list recent export jobs"""
+    if request.method == 'POST':
+        data = request.json or {}
+        export_format = data.get('format', 'csv')
+        if export_format not in ExportJobs.FORMATS:
+            return jsonify({"success": False, "message": f"Unknown format '{export_format}'"}), 400
+        try:
+            since, until = ExportJobs.export_range(data.get('month'), data.get('start'), data.get('end'))
+        except ValueError as error:
+            return jsonify({"success": False, "message": f"Invalid export range: {error}"}), 400
+        job = export_jobs.submit(export_format, since, until)
+        if job is None:
+            response = jsonify({"success": False, "message": "Too many exports queued, please retry"})
+            response.status_code = 429
+            response.headers['Retry-After'] = '30'
+            return response
+        return jsonify({"success": True, **job}), 202
+    return jsonify(export_jobs.recent())
+
+@app.route('/api/exports/<job_id>')
+def export_status(job_id):
+    """Get an export job's state and progress"""
+    job = export_jobs.status(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"No export {job_id}"}), 404
+    return jsonify(job)
+
+@app.route('/api/exports/<job_id>/download')
+def export_download(job_id):
+    """Download a finished export"""
+    job = export_jobs.status(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"No export {job_id}"}), 404
+    if job["status"] != 'done':
+        return jsonify({"success": False, "message": f"Export {job_id} is {job['status']}"}), 409
+    _, extension, mimetype = ExportJobs.FORMATS[job["format"]]
+    return send_from_directory(os.path.abspath(EXPORT_DIR), job["file"], mimetype=mimetype, as_attachment=True,
+                               download_name=f"transactions-{job_id}{extension}")
+
+@app.route('/api/duplicates')
+def duplicates():
+    """Report groups of existing transactions that look like duplicates"""
+    return jsonify(AIFinanceTracker.get_duplicates())
+
+@app.route('/api/balance-series')
+def balance_series():
+    """Get the running balance over time"""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BalanceSeries.BUCKETS:
+        return jsonify({"success": False, "message": f"Unknown bucket '{bucket}'"}), 400
+    return jsonify({
+        "bucket": bucket,
+        "series": AIFinanceTracker.get_balance_series(
+            bucket,
+            request.args.get('start'),
+            request.args.get('end')
+        )
+    })
+
+@app.route('/api/distribution')
+def distribution():
+    """Get transaction size distributions per category or per month"""
+    group = request.args.get('group', 'category')
+    if group not in ('category', 'period'):
+        return jsonify({"success": False, "message": f"Unknown group '{group}'"}), 400
+    return jsonify(AIFinanceTracker.get_spending_distribution(
+        months=request.args.get('months', default=12, type=int),
+        category=request.args.get('category'),
+        group=group
+    ))
+
+@app.route('/api/simulate', methods=['POST'])
+def simulate():
+    """Run Monte Carlo balance and savings goal projections"""
+    data = request.json or {}
+    goal = data.get('goal') or {}
+    if not isinstance(goal, dict):
+        return jsonify({"success": False, "message": "goal must be an object with a target"}), 400
+    try:
+        result = AIFinanceTracker.simulate_savings(
+            paths=data.get('paths', 10_000),
+            days=data.get('days', 365 * 5),
+            starting_balance=data.get('starting_balance'),
+            adjustments=data.get('adjustments'),
+            goal_target=goal.get('target'),
+            percentiles=data.get('percentiles', (5, 25, 50, 75, 95)),
+            seed=data.get('seed'),
+            workers=data.get('workers', 1)
+        )
+    except ValueError as error:
+        return jsonify({"success": False, "message": str(error)}), 400
+    return jsonify(result), (200 if result["success"] else 400)
+
+@app.route('/api/recurring')
+def recurring():
+    """Get detected recurring charges and income"""
+    active_only = request.args.get('active', default=0, type=int) == 1
+    return jsonify(AIFinanceTracker.get_recurring_charges(active_only=active_only))
+
 @app.route('/api/analytics')
 def analytics():
-    """Get advanced analytics data"""
-    # Weekly spending trend
-    weekly_data = []
-    for week in range(4):  # Last 4 weeks
-        start_date = datetime.now() - timedelta(weeks=week+1)
-        end_date = datetime.now() - timedelta(weeks=week)
-        
-        with get_db() as conn:
-            result = conn.execute('''
-                SELECT SUM(amount) as total
-                FROM transactions 
-                WHERE type = 'expense' 
-                AND date BETWEEN ? AND ?
-            ''', (start_date.isoformat(), end_date.isoformat())).fetchone()
-            
-            weekly_data.append({
-                "week": f"Week {4-week}",
-                "amount": result['total'] or 0
-            })
-    
-    # Category trends
-    category_trends = AIFinanceTracker.get_spending_by_category(30)
+    """Get advanced analytics data, converted into ?currency= (default DISPLAY_CURRENCY)"""
+    currency = request.args.get('currency')
+    error = currency_error(currency)
+    if error:
+        return jsonify(error), 400
+    return jsonify(AIFinanceTracker.get_analytics(currency=currency))
+
+# Async (ASGI) API
+DB_EXECUTOR_WORKERS = int(os.environ.get('DB_EXECUTOR_WORKERS', 8))
+
+class AsyncRequest:
+    """Minimal request view handed to async route handlers"""
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'').decode('latin-1')
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.headers = Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+        self.body = body
+
+    @property
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+class AsyncAPI:
+    """ASGI application serving /api/* on one event loop
+
+    Handlers are coroutines; every SQLite call goes through `run_db`, a
+    bounded thread pool, so thousands of open connections cost only
+    coroutines while database concurrency stays capped. Paths without a
+    native handler are answered by the Flask app on the same pool, which
+    keeps every response identical to the WSGI deployment.
+    """
+
+    # Sampler of the native request this task is serving, seen by run_db's executor threads
+    sampler = contextvars.ContextVar('asgi_sampler', default=None)
+
+    def __init__(self, flask_app, db_workers=None):
+        self.flask_app = flask_app
+        self.db_workers = db_workers   # None: DB_EXECUTOR_WORKERS when the pool starts
+        self.executor = None
+        self.routes = {}
+
+    def route(self, path, methods=('GET',)):
+        def register(handler):
+            for method in methods:
+                self.routes[(method, path)] = handler
+            return handler
+        return register
+
+    async def run_db(self, function, *args, **kwargs):
+        """Run blocking SQLite work on the dedicated executor
+
+        The call runs in a copy of the caller's context, so its queries count
+        toward the request's SQL totals and an active profile samples the
+        executor thread for as long as it does this work.
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.db_workers or DB_EXECUTOR_WORKERS,
+                                               thread_name_prefix='sqlite')
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._sampled, function, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, contextvars.copy_context().run, call)
+
+    def _sampled(self, function, *args, **kwargs):
+        sampler = self.sampler.get()
+        if sampler is None:
+            return function(*args, **kwargs)
+        thread_id = threading.get_ident()
+        sampler.attach(thread_id)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            sampler.detach(thread_id)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            # Flask's own before/after_request hooks instrument the fallback
+            status, headers, payload = await self.run_db(self._call_flask, scope, body)
+        else:
+            status, headers, payload = await self._instrumented(handler, AsyncRequest(scope, body))
+            if any(name == b'origin' for name, _ in scope['headers']):
+                headers.append((b'access-control-allow-origin', b'*'))
+        headers.append((b'content-length', str(len(payload)).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def _instrumented(self, handler, req):
+        """Native dispatch wrapped in the same metrics and profiling as the Flask hooks"""
+        method, route = req.method, req.path
+        started = time.perf_counter()
+        metrics.begin_request()
+        sampler = profiler.start() if profiler.should_profile(req, route) else None
+        self.sampler.set(sampler)
+        try:
+            status, headers, payload = await self._dispatch(handler, req)
+        except Exception:
+            metrics.end_request(method, route, 500, time.perf_counter() - started)
+            if sampler is not None:
+                sampler.stop()
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.end_request(method, route, status, elapsed)
+        if sampler is not None:
+            headers.append((b'x-profile-id', profiler.finish(sampler, method, route, elapsed).encode('latin-1')))
+        return status, headers, payload
+
+    async def _dispatch(self, handler, req):
+        method, route = req.method, req.path
+        full_path = route + '?' + req.query_string
+        limited = admission.limited(route)
+        if limited and not await admission.acquire_async(route):
+            return self._shed(method, route, full_path)
+        try:
+            result = await handler(req)
+        except AnalyticsTimeout:
+            result = {"success": False, "message": "Analysis timed out, please retry"}, 503
+        finally:
+            if limited:
+                admission.release(route)
+        status = 200
+        if isinstance(result, tuple):
+            result, status = result
+        if isinstance(result, bytes):
+            # Already-encoded JSON from a row encoder
+            payload = result + b'\n'
+        else:
+            payload = (self.flask_app.json.dumps(result, separators=(',', ':')) + '\n').encode('utf-8')
+        headers = [(b'content-type', b'application/json')]
+        if status == 503:
+            headers.append((b'retry-after', b'5'))
+        if limited:
+            admission.remember(method, full_path, status, payload, 'application/json')
+        return status, headers, payload
+
+    @staticmethod
+    def _shed(method, route, full_path):
+        """Same fallbacks as the Flask hook: stale cached result, else 503 with Retry-After"""
+        cached = admission.stale(method, full_path)
+        if cached is not None:
+            admission.count_shed(route, 'stale')
+            age, status, body, mimetype = cached
+            return status, [
+                (b'content-type', mimetype.encode('latin-1')),
+                (b'x-cache', b'stale'),
+                (b'age', str(int(age)).encode('latin-1')),
+            ], body
+        admission.count_shed(route, 'rejected')
+        payload = b'{"message":"Server busy, please retry","success":false}\n'
+        return 503, [
+            (b'content-type', b'application/json'),
+            (b'retry-after', str(admission.retry_after(method, route)).encode('latin-1')),
+        ], payload
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.run_db(create_app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _call_flask(self, scope, body):
+        """Answer a request through the WSGI app (runs on the executor)"""
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            key = name.decode('latin-1').upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = value.decode('latin-1')
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers if name.lower() != 'content-length'
+            ]
+
+        chunks = self.flask_app(environ, start_response)
+        try:
+            payload = b''.join(chunks)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        return started['status'], started['headers'], payload
+
+asgi_app = AsyncAPI(app)
+
+@asgi_app.route('/healthz/live')
+async def async_liveness(req):
+    return {"status": "alive", "pid": os.getpid()}
+
+@asgi_app.route('/api/transactions', methods=('GET', 'POST'))
+async def async_transactions(req):
+    if req.method == 'POST':
+        data = req.json
+        rows = data if isinstance(data, list) else [data]
+        error = (currency_error(*(row.get('currency') for row in rows)) or type_error(*rows) or date_error(*rows)
+                 or tags_error(*rows) or dimensions_error(*rows)
+                 or duplicate_policy_error(*(row.get('on_duplicate') for row in rows))
+                 or duplicate_policy_error(req.args.get('on_duplicate') if isinstance(data, list) else None))
+        if error:
+            return error, 400
+        if isinstance(data, list):
+            return await asgi_app.run_db(
+                AIFinanceTracker.add_transactions,
+                data,
+                on_duplicate=req.args.get('on_duplicate', 'reject')
+            )
+        result = await asgi_app.run_db(
+            AIFinanceTracker.add_transaction,
+            data['amount'],
+            data['category'],
+            data['description'],
+            data['type'],
+            data.get('date'),
+            on_duplicate=data.get('on_duplicate', DUPLICATE_POLICY),
+            idempotency_key=req.headers.get('Idempotency-Key'),
+            currency=data.get('currency'),
+            merchant=data.get('merchant'),
+            tags=data.get('tags')
+        )
+        return result, (200 if result["success"] else 409)
     
-    return jsonify({
-        "weekly_spending": weekly_data,
-        "category_trends": category_trends
-    })
+    shape = req.args.get('shape', 'objects')
+    if shape not in RESPONSE_SHAPES:
+        return {"success": False, "message": f"Unknown shape '{shape}'"}, 400
+    columns, rows = await asgi_app.run_db(
+        AIFinanceTracker.get_transaction_rows,
+        limit=req.args.get('limit', type=int),
+        days=req.args.get('days', type=int)
+    )
+    # Encode off the event loop; a full history can take tens of milliseconds
+    payload = await asgi_app.run_db(row_encoder(columns).encode, rows, shape)
+    return payload.encode('utf-8')
+
+@asgi_app.route('/api/budgets', methods=('GET', 'POST'))
+async def async_budgets(req):
+    if req.method == 'POST':
+        data = req.json
+        return await asgi_app.run_db(AIFinanceTracker.set_budget, data['category'], data['amount'])
+    return await asgi_app.run_db(AIFinanceTracker.get_budgets)
+
+@asgi_app.route('/api/summary')
+async def async_summary(req):
+    currency = req.args.get('currency')
+    error = currency_error(currency)
+    if error:
+        return error, 400
+    return await asgi_app.run_db(AIFinanceTracker.get_summary, currency)
+
+@asgi_app.route('/api/ai-advice')
+async def async_ai_advice(req):
+    return await asgi_app.run_db(AIFinanceTracker.generate_ai_advice)
+
+@asgi_app.route('/api/advice-digest')
+async def async_advice_digest(req):
+    return await asgi_app.run_db(digest_response, req.args.get('user_id', default=1, type=int))
+
+@asgi_app.route('/api/analytics')
+async def async_analytics(req):
+    currency = req.args.get('currency')
+    error = currency_error(currency)
+    if error:
+        return error, 400
+    return await asgi_app.run_db(AIFinanceTracker.get_analytics, currency=currency)
+
+@asgi_app.route('/api/recurring')
+async def async_recurring(req):
+    active_only = req.args.get('active', default=0, type=int) == 1
+    return await asgi_app.run_db(AIFinanceTracker.get_recurring_charges, active_only=active_only)
+
+@asgi_app.route('/api/balance-series')
+async def async_balance_series(req):
+    bucket = req.args.get('bucket', 'day')
+    if bucket not in BalanceSeries.BUCKETS:
+        return {"success": False, "message": f"Unknown bucket '{bucket}'"}, 400
+    series = await asgi_app.run_db(
+        AIFinanceTracker.get_balance_series,
+        bucket,
+        req.args.get('start'),
+        req.args.get('end')
+    )
+    return {"bucket": bucket, "series": series}
+
+def serve_async(host='0.0.0.0', port=5000, workers=1):
+    """Run the ASGI API under uvicorn (one event loop per worker process)"""
+    import uvicorn
+    uvicorn.run('app:asgi_app', host=host, port=port, workers=workers, lifespan='on', log_level='warning')
+
+# Production serving
+_worker_lock = threading.Lock()
+_worker_ready = False
+
+# Build the caches requests would otherwise build on first use in a background
+# thread at startup; off by default so short-lived (serverless) instances only
+# pay for what their first requests need
+WARM_UP = os.environ.get('WARM_UP', '0') == '1'
+
+def init_worker():
+    """Per-process startup: bring the schema up to date and start background services, once per worker"""
+    global _worker_ready
+    with _worker_lock:
+        if _worker_ready:
+            return
+        init_db()
+        if READ_REPLICA:
+            replica.start()
+        maintenance.start()
+        analytics_pool.start()
+        _worker_ready = True
+
+@app.before_request
+def _ensure_schema():
+    # WSGI hosts that import `app:app` directly never call create_app()
+    if DATABASE not in _schema_checked:
+        init_db()
+
+def warm_up():
+    """Build the recurring-charge index, tag and merchant lists, converted totals and index page ahead of the first requests"""
+    started = time.perf_counter()
+    try:
+        recurring_detector.refresh()
+        dimension_index.refresh()
+        AIFinanceTracker.get_summary()
+        index_page()
+    except Exception:
+        logging.getLogger('finance_tracker.startup').exception("warm-up failed")
+        return
+    logging.getLogger('finance_tracker.startup').info("warm-up took %.0f ms", (time.perf_counter() - started) * 1000)
+
+_settings = {}   # module settings overridden by create_app, passed on to analytics workers
+
+# Services built at import read these settings in their constructors; create_app
+# replaces a service (stopping the old one) when any of its settings is overridden
+_SERVICE_SETTINGS = {
+    'admission': {'ADMISSION_ROUTES', 'ADMISSION_SLOTS', 'ADMISSION_MAX_WAIT_MS', 'ADMISSION_MAX_QUEUE',
+                  'ADMISSION_STALE_SECONDS'},
+    'replica': {'REPLICA_MAX_LAG_SECONDS', 'REPLICA_REFRESH_SECONDS'},
+    'profiler': {'PROFILE_SAMPLE_RATE'},
+    'advice_engine': {'ADVICE_RULES', 'ADVICE_RULES_DISABLED'},
+    'analytics_pool': {'ANALYTICS_WORKERS', 'ANALYTICS_TIMEOUT_SECONDS'},
+    'export_jobs': {'EXPORT_WORKERS', 'EXPORT_MAX_QUEUE'},
+}
+
+def create_app(config=None, warm=None):
+    """Application factory: apply `config`, run per-process startup and return the Flask app
+
+    Keys naming upper-case module settings (DATABASE, STORAGE_BACKEND,
+    FX_RATES_FILE, EXPORT_DIR, ...) replace them; any other key goes to
+    `app.config`. Settings are read where they are used, and services built
+    from them at import are rebuilt. DB_EXECUTOR_WORKERS applies only before
+    the ASGI app has served its first request. Heavy caches are built on
+    first use, or right away in a background thread when `warm` (default
+    WARM_UP) is set.
+
+        gunicorn 'app:create_app()'
+    """
+    global storage, fx_rates, admission, replica, profiler, advice_engine, analytics_pool, export_jobs, DISPLAY_CURRENCY
+    config = dict(config or {})
+    for key, value in config.items():
+        if key.isupper() and key in globals() and not callable(globals()[key]):
+            globals()[key] = _settings[key] = value
+        else:
+            app.config[key] = value
+    if 'BASE_CURRENCY' in config and 'DISPLAY_CURRENCY' not in config and 'DISPLAY_CURRENCY' not in os.environ:
+        DISPLAY_CURRENCY = _settings['DISPLAY_CURRENCY'] = BASE_CURRENCY
+    if config.keys() & {'FX_RATES_FILE', 'BASE_CURRENCY'}:
+        fx_rates = FXRates(FX_RATES_FILE, BASE_CURRENCY)
+    if config.keys() & {'STORAGE_BACKEND', 'FX_RATES_FILE', 'BASE_CURRENCY'}:
+        storage = create_storage(STORAGE_BACKEND)
+    if config.keys() & _SERVICE_SETTINGS['admission']:
+        admission = AdmissionController()
+    if config.keys() & _SERVICE_SETTINGS['replica']:
+        replica.stop()
+        replica = ReadReplica()
+    if config.keys() & _SERVICE_SETTINGS['profiler']:
+        profiler = RequestProfiler(sample_rate=PROFILE_SAMPLE_RATE)
+    if config.keys() & _SERVICE_SETTINGS['advice_engine']:
+        advice_engine = AdviceEngine()
+    if config.keys() & _SERVICE_SETTINGS['analytics_pool']:
+        analytics_pool.shutdown()
+        analytics_pool = AnalyticsPool()
+    if config.keys() & _SERVICE_SETTINGS['export_jobs']:
+        export_jobs = ExportJobs()
+    if _worker_ready:
+        # Services replaced after the first start of this process are started here
+        if READ_REPLICA:
+            replica.start()
+        analytics_pool.start()
+    init_worker()
+    if WARM_UP if warm is None else warm:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    return app
+
+def serve(bind='0.0.0.0:5000', workers=None, threads=4, timeout=60, graceful_timeout=30, max_requests=0):
+    """Run the app under gunicorn's pre-forking server
+
+    The master process forks `workers` processes, each serving `threads`
+    concurrent requests. SIGHUP replaces workers gracefully (new ones start
+    before old ones drain) and `max_requests` recycles long-lived workers.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class FinanceTrackerServer(BaseApplication):
+        def load_config(self):
+            settings = {
+                'bind': bind,
+                'workers': workers or os.cpu_count() or 1,
+                'threads': threads,
+                'worker_class': 'gthread' if threads > 1 else 'sync',
+                'timeout': timeout,
+                'graceful_timeout': graceful_timeout,
+                'max_requests': max_requests,
+                'max_requests_jitter': max_requests // 10,
+                'post_fork': lambda server, worker: create_app(warm=True),
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    FinanceTrackerServer().run()
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="AI Finance Tracker")
+    subcommands = parser.add_subparsers(dest='command')
+    serve_parser = subcommands.add_parser('serve', help="run the multi-process production server")
+    serve_parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:5000'))
+    serve_parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 0)) or None,
+                              help="worker processes (default: one per CPU core)")
+    serve_parser.add_argument('--threads', type=int, default=int(os.environ.get('THREADS', 4)))
+    serve_parser.add_argument('--timeout', type=int, default=60)
+    serve_parser.add_argument('--graceful-timeout', type=int, default=30)
+    serve_parser.add_argument('--max-requests', type=int, default=0,
+                              help="recycle a worker after this many requests (0 disables)")
+    async_parser = subcommands.add_parser('serve-async', help="run the asyncio (ASGI) API under uvicorn")
+    async_parser.add_argument('--host', default='0.0.0.0')
+    async_parser.add_argument('--port', type=int, default=5000)
+    async_parser.add_argument('--workers', type=int, default=1)
+    maintain_parser = subcommands.add_parser('maintain', help="run maintenance tasks once and exit")
+    maintain_parser.add_argument('tasks', nargs='*', metavar='task',
+                                 help=f"any of {', '.join(Maintenance.TASKS)} (default: all)")
+    maintain_parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                                 help="switch an existing database to auto_vacuum=INCREMENTAL (full VACUUM, takes it offline)")
+    digest_parser = subcommands.add_parser('digest', help="rebuild the advice digest of every account and exit")
+    digest_parser.add_argument('--chunk', type=int, default=ADVICE_DIGEST_CHUNK_USERS, help="accounts per batch")
+    args = parser.parse_args()
+    
+    if args.command == 'digest':
+        init_db()
+        with sqlite3.connect(DATABASE) as conn:
+            result = AdviceDigest.run(conn, args.chunk, progress=lambda done, seconds: print(
+                f"  {done} accounts, {done / seconds if seconds else 0:.0f}/s", file=sys.stderr
+            ))
+        print(f"digest: {json.dumps(result)}")
+        raise SystemExit(0)
+    
+    if args.command == 'maintain':
+        unknown = set(args.tasks) - set(Maintenance.TASKS)
+        if unknown:
+            parser.error(f"unknown maintenance task: {', '.join(sorted(unknown))}")
+        init_db()
+        if args.enable_incremental_vacuum:
+            with sqlite3.connect(DATABASE) as conn:
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('VACUUM')
+        for task, result in maintenance.run_once(args.tasks or None).items():
+            print(f"{task}: {json.dumps(result)}")
+        raise SystemExit(0)
+    
+    if args.command == 'serve-async':
+        serve_async(host=args.host, port=args.port, workers=args.workers)
+        raise SystemExit(0)
+    
+    if args.command == 'serve':
+        serve(
+            bind=args.bind,
+            workers=args.workers,
+            threads=args.threads,
+            timeout=args.timeout,
+            graceful_timeout=args.graceful_timeout,
+            max_requests=args.max_requests
+        )
+        raise SystemExit(0)
+    
     print("🚀 Initializing AI Finance Tracker...")
-    init_db()
+    create_app()
     print("✅ Database initialized successfully!")
     print("📊 Starting Flask server...")
     print("🌐 Open your browser to: http://localhost:5000")
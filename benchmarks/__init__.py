@@ -0,0 +1,15 @@
+"""Benchmarks for the AI Finance Tracker
+
+- `benchmarks.synthetic` builds deterministic SQLite ledgers (10^3 to 10^7 rows)
+- `benchmarks.run` times every AIFinanceTracker method and /api/* route and
+  stores the results as JSON for regression comparisons
+- `benchmarks/asgi_vs_threaded.py` compares the threaded and ASGI servers
+  under many concurrent connections
+- `benchmarks/serialization.py` compares dicts + jsonify with the row encoders
+- `benchmarks/query.py` times tag and merchant filtering against plain SQL joins
+- `benchmarks/exports.py` measures export throughput and memory per format,
+  and interactive latency while exports run
+- `benchmarks/cold_start.py` times a new interpreter to its first responses
+- `benchmarks/analytics_pool.py` measures analytics throughput per pool size
+- `benchmarks/advice_digest.py` times the nightly advice digest per chunk size
+"""
@@ -0,0 +1,73 @@
+"""Time the nightly advice digest over many accounts, at several chunk sizes
+
+Each run rebuilds advice_cache for every account in a synthetic ledger and
+reports accounts per second and peak Python memory, which should follow the
+chunk size rather than the number of accounts.
+
+    python benchmarks/advice_digest.py --users 1000000 --rows 1600000 --years 0.003 --chunk 1000 5000 20000
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import fixture_path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--years', type=float, default=30 / 365)
+    parser.add_argument('--chunk', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--output', help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    import app
+
+    report = {"rows": args.rows, "users": args.users, "chunks": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(workdir, 'ledger.db')
+        shutil.copyfile(fixture_path(args.rows, args.users, args.years), database)
+        app.DATABASE = database
+        app.init_db()
+        conn = sqlite3.connect(database)
+        try:
+            for chunk in args.chunk:
+                last_report = [0.0]
+
+                def progress(done, seconds):
+                    if seconds - last_report[0] >= 5:
+                        last_report[0] = seconds
+                        print(f"  chunk={chunk}: {done} accounts, {done / seconds:.0f}/s", file=sys.stderr)
+
+                tracemalloc.start()
+                started = time.perf_counter()
+                result = app.AdviceDigest.run(conn, chunk, progress=progress)
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                report["chunks"][str(chunk)] = {
+                    "accounts": result["users"],
+                    "seconds": round(elapsed, 2),
+                    "accounts_per_second": round(result["users"] / elapsed),
+                    "peak_mib": round(peak / 2 ** 20, 1),
+                }
+        finally:
+            conn.close()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Measure analytics throughput with the job pool off and at several worker counts
+
+`--clients` threads call advice, distribution and simulation in a loop for
+`--seconds`; the report gives completed jobs per second for each worker
+count (0 runs every job inline on the client threads, holding the GIL).
+Scaling tracks the cores actually available, reported as cpu_count.
+
+    python benchmarks/analytics_pool.py --rows 100000 --workers 0 1 2 4 --clients 8
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import fixture_path
+
+def jobs(app, paths):
+    return {
+        'advice': app.AIFinanceTracker.generate_ai_advice,
+        'distribution': app.AIFinanceTracker.get_spending_distribution,
+        'simulate': lambda: app.AIFinanceTracker.simulate_savings(paths=paths, days=365, seed=7),
+    }
+
+def drive(app, workers, clients, seconds, paths):
+    """Jobs per second for each job kind with `clients` threads hammering the pool"""
+    app.analytics_pool = app.AnalyticsPool(workers=workers, timeout=600).start()
+    try:
+        results = {}
+        for name, call in jobs(app, paths).items():
+            call()
+            counts = [0] * clients
+            deadline = time.perf_counter() + seconds
+
+            def client(index):
+                while time.perf_counter() < deadline:
+                    call()
+                    counts[index] += 1
+
+            threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results[name] = round(sum(counts) / (time.perf_counter() - started), 2)
+        return results
+    finally:
+        app.analytics_pool.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--paths', type=int, default=2000, help="Monte Carlo paths per simulation job")
+    parser.add_argument('--output', help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    import app
+
+    report = {"cpu_count": os.cpu_count(), "rows": args.rows, "clients": args.clients, "workers": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(workdir, 'ledger.db')
+        shutil.copyfile(fixture_path(args.rows), database)
+        app.DATABASE = database
+        app.init_db()
+        for workers in args.workers:
+            report["workers"][str(workers)] = drive(app, workers, args.clients, args.seconds, args.paths)
+            print(f"  workers={workers}: {report['workers'][str(workers)]}", file=sys.stderr)
+
+    baseline = report["workers"].get(str(args.workers[0]), {})
+    report["speedup"] = {
+        workers: {name: round(rate / baseline[name], 2) for name, rate in rates.items() if baseline.get(name)}
+        for workers, rates in report["workers"].items()
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
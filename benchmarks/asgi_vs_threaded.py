@@ -0,0 +1,125 @@
+"""Compare request latency of the threaded Flask server and the ASGI API
+
+Both servers run in subprocesses against the same seeded SQLite file. The
+client keeps `--connections` requests in flight at once (one socket each,
+`Connection: close`) and reports latency percentiles, throughput and errors
+per server as JSON.
+
+    python benchmarks/asgi_vs_threaded.py --connections 1000 --requests 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import build_fixture
+
+SERVERS = {
+    'threaded-flask': (
+        "import app; app.DATABASE = {db!r}; app.init_worker(); "
+        "from werkzeug.serving import make_server; "
+        "make_server('127.0.0.1', {port}, app.app, threaded=True).serve_forever()"
+    ),
+    'asgi': (
+        "import app, uvicorn; app.DATABASE = {db!r}; "
+        "uvicorn.run(app.asgi_app, host='127.0.0.1', port={port}, log_level='error', "
+        "backlog=4096, limit_concurrency=None)"
+    ),
+}
+
+PATHS = ['/api/summary', '/api/transactions?limit=10', '/api/analytics']
+
+async def fetch(port, path, timeout):
+    started = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), timeout)
+    writer.close()
+    if not response.startswith(b'HTTP/1.1 200') and not response.startswith(b'HTTP/1.0 200'):
+        raise RuntimeError(response[:40])
+    return time.perf_counter() - started
+
+async def run_load(port, connections, requests, timeout):
+    latencies = []
+    errors = 0
+
+    async def client(index):
+        nonlocal errors
+        for request in range(requests):
+            try:
+                latencies.append(await fetch(port, PATHS[(index + request) % len(PATHS)], timeout))
+            except (OSError, asyncio.TimeoutError, RuntimeError):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(connections)))
+    return latencies, errors, time.perf_counter() - started
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+def wait_until_up(port, deadline=30):
+    import urllib.request
+    end = time.time() + deadline
+    while time.time() < end:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz/live", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=5, help="requests per connection slot")
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--port', type=int, default=5071)
+    parser.add_argument('--output', help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    results = {"connections": args.connections, "requests_per_connection": args.requests, "rows": args.rows}
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(workdir, 'bench.db')
+        build_fixture(database, args.rows)
+        for offset, (name, script) in enumerate(SERVERS.items()):
+            port = args.port + offset
+            server = subprocess.Popen(
+                [sys.executable, '-c', script.format(db=database, port=port)],
+                cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_until_up(port)
+                latencies, errors, elapsed = asyncio.run(
+                    run_load(port, args.connections, args.requests, args.timeout)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            results[name] = {
+                "completed": len(latencies),
+                "errors": errors,
+                "requests_per_second": round(len(latencies) / elapsed, 1),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            }
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Cold start: time from a new interpreter to the first responses
+
+Each run starts a fresh Python process that imports app, calls
+create_app() and serves GET / and GET /api/summary through the test client,
+timing every step. Runs against a new database (schema created) and an
+existing one already at SCHEMA_VERSION (one PRAGMA read). The median of
+`--repeat` runs per case is reported; with `--target-ms`, exits non-zero
+when any case's process-start-to-first-summary time exceeds it.
+
+    python benchmarks/cold_start.py --rows 100000 --repeat 10 --target-ms 800
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import fixture_path
+
+# Runs in the child; `started` is the parent's clock reading just before spawning
+CHILD = '''
+import json, sys, time
+marks = {}
+begin = time.perf_counter()
+import app
+marks["import_ms"] = time.perf_counter() - begin
+app.create_app({"DATABASE": sys.argv[1]}, warm=sys.argv[2] == "1")
+marks["create_app_ms"] = time.perf_counter() - begin
+client = app.app.test_client()
+client.get("/", headers={"Accept-Encoding": "gzip"})
+marks["first_page_ms"] = time.perf_counter() - begin
+client.get("/api/summary")
+marks["first_summary_ms"] = time.perf_counter() - begin
+print(json.dumps({key: round(value * 1000, 1) for key, value in marks.items()}))
+'''
+
+def run_once(database, warm):
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, database, '1' if warm else '0'],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    marks = json.loads(output.splitlines()[-1])
+    # Interpreter start-up and exit included
+    marks["process_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return marks
+
+def median_marks(runs):
+    return {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000, help="ledger size of the existing database")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--warm', action='store_true', help="start the background warm-up in create_app()")
+    parser.add_argument('--target-ms', type=float, help="fail when a case's first summary takes longer")
+    parser.add_argument('--output', help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    report = {"rows": args.rows, "repeat": args.repeat, "warm": args.warm, "cases": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        # Compile app.py once so every run measures an import from bytecode, as a deployment would
+        run_once(os.path.join(workdir, 'compile.db'), False)
+        fresh_runs = []
+        for attempt in range(args.repeat):
+            fresh_runs.append(run_once(os.path.join(workdir, f'fresh-{attempt}.db'), args.warm))
+        report["cases"]["new_database"] = median_marks(fresh_runs)
+
+        database = os.path.join(workdir, 'ledger.db')
+        shutil.copyfile(fixture_path(args.rows), database)
+        run_once(database, False)  # brings a fixture from older code up to SCHEMA_VERSION
+        report["cases"]["current_schema"] = median_marks([run_once(database, args.warm) for _ in range(args.repeat)])
+
+    for name, marks in report["cases"].items():
+        print(f"  {name}: {marks}", file=sys.stderr)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    if args.target_ms is not None:
+        slow = [name for name, marks in report["cases"].items() if marks["first_summary_ms"] > args.target_ms]
+        if slow:
+            print(f"over the {args.target_ms:g} ms target: {', '.join(slow)}", file=sys.stderr)
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
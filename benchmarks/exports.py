@@ -0,0 +1,95 @@
+"""Export throughput and memory per format, and interactive latency while exports run
+
+Each format exports the whole ledger once through ExportJobs and reports
+rows per second, file size and peak Python memory, which should follow
+EXPORT_BATCH_ROWS rather than the ledger size. Then /api/summary latency
+is sampled with no exports running and with `--concurrent` full exports
+in flight.
+
+    python benchmarks/exports.py --rows 1000000 --concurrent 2 --samples 200
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import fixture_path
+
+def wait(app, job_ids):
+    while any(app.export_jobs.status(job_id)["status"] in ('queued', 'running') for job_id in job_ids):
+        time.sleep(0.05)
+
+def latency(client, samples):
+    """p50/p99 milliseconds of GET /api/summary"""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        client.get('/api/summary')
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {"p50_ms": round(statistics.median(timings), 2), "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--formats', nargs='+', default=['csv', 'jsonl', 'columnar'])
+    parser.add_argument('--concurrent', type=int, default=2, help="exports in flight during the latency run")
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--output', help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    import app
+
+    report = {"rows": args.rows, "batch_rows": app.EXPORT_BATCH_ROWS, "formats": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(workdir, 'ledger.db')
+        shutil.copyfile(fixture_path(args.rows), database)
+        app.DATABASE = database
+        app.EXPORT_DIR = os.path.join(workdir, 'exports')
+        app.init_db()
+        app.export_jobs = app.ExportJobs(workers=max(args.concurrent, 1), max_queue=args.concurrent + len(args.formats))
+
+        for export_format in args.formats:
+            tracemalloc.start()
+            started = time.perf_counter()
+            job_id = app.export_jobs.submit(export_format)["id"]
+            wait(app, [job_id])
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            job = app.export_jobs.status(job_id)
+            report["formats"][export_format] = {
+                "status": job["status"],
+                "seconds": round(elapsed, 2),
+                "rows_per_second": round(job["rows"] / elapsed),
+                "bytes": job["bytes"],
+                "peak_mib": round(peak / 2 ** 20, 1),
+            }
+            print(f"  {export_format}: {report['formats'][export_format]}", file=sys.stderr)
+
+        client = app.app.test_client()
+        client.get('/api/summary')
+        report["summary_idle"] = latency(client, args.samples)
+        job_ids = [app.export_jobs.submit(args.formats[0])["id"] for _ in range(args.concurrent)]
+        report["summary_during_exports"] = latency(client, args.samples)
+        report["exports_finished_during_sampling"] = sum(
+            app.export_jobs.status(job_id)["status"] == 'done' for job_id in job_ids
+        )
+        wait(app, job_ids)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
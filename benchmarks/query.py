@@ -0,0 +1,116 @@
+"""Tag and merchant filtering: index build/load cost and /api/query latency against plain SQL joins
+
+Tags are attached deterministically to a synthetic ledger (tax-deductible
+healthcare and every tenth shopping row, work transport, a sparse
+reimbursable tag). The script then reports:
+- the time to build the id lists from the tables;
+- their saved size, and the time a new process takes to load them;
+- p50 latency of several filters through DimensionIndex next to the same
+  question asked of SQLite with joins. The answers are checked to match.
+
+    python benchmarks/query.py --rows 1000000 --repeat 20
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import fixture_path
+
+TAGGING = (
+    ('tax-deductible', "category = 'Healthcare' OR (category = 'Shopping' AND id % 10 = 0)"),
+    ('work', "category = 'Transportation'"),
+    ('reimbursable', "id % 97 = 0"),
+)
+
+# (name, query kwargs, equivalent SQL WHERE over t = transactions, m = merchants)
+CASES = (
+    ('tag', {"tags": ['tax-deductible']},
+     "t.id IN (SELECT transaction_id FROM transaction_tags WHERE tag_id = :tax)"),
+    ('tag+merchant', {"tags": ['tax-deductible'], "merchants": ['Amazon.com']},
+     "t.id IN (SELECT transaction_id FROM transaction_tags WHERE tag_id = :tax) AND m.key = 'amazon com'"),
+    ('two tags+year', {"tags": ['tax-deductible', 'reimbursable'], "since": ':year'},
+     "t.id IN (SELECT transaction_id FROM transaction_tags WHERE tag_id = :tax) "
+     "AND t.id IN (SELECT transaction_id FROM transaction_tags WHERE tag_id = :reimbursable) AND t.date >= :year"),
+    ('merchant', {"merchants": ['Uber Trip']}, "m.key = 'uber trip'"),
+    ('tag grouped by merchant', {"tags": ['work'], "group": 'merchant'},
+     "t.id IN (SELECT transaction_id FROM transaction_tags WHERE tag_id = :work)"),
+)
+
+def p50(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    import app
+
+    report = {"rows": args.rows, "cases": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(workdir, 'ledger.db')
+        shutil.copyfile(fixture_path(args.rows), database)
+        app.DATABASE = database
+        app.init_db()
+        conn = sqlite3.connect(database)
+        for tag, where in TAGGING:
+            conn.execute('INSERT OR IGNORE INTO tags (name) VALUES (?)', (tag,))
+            conn.execute(f'''
+                INSERT OR IGNORE INTO transaction_tags (transaction_id, tag_id)
+                SELECT id, (SELECT id FROM tags WHERE name = ?) FROM transactions WHERE {where} ORDER BY id
+            ''', (tag,))
+        conn.commit()
+        tag_ids = dict(conn.execute('SELECT name, id FROM tags').fetchall())
+        report["tagged_rows"] = conn.execute('SELECT COUNT(*) FROM transaction_tags').fetchone()[0]
+
+        started = time.perf_counter()
+        app.dimension_index.refresh()
+        report["build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report["ids_in_memory"] = app.dimension_index.sizes()
+        report["saved"] = app.maintenance.postings()
+        fresh = app.DimensionIndex()
+        started = time.perf_counter()
+        fresh.refresh()
+        report["load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        assert fresh.sizes() == app.dimension_index.sizes()
+
+        year = f"{time.localtime().tm_year}-01-01"
+        params = {"tax": tag_ids['tax-deductible'], "work": tag_ids['work'],
+                  "reimbursable": tag_ids['reimbursable'], "year": year}
+        for name, kwargs, where in CASES:
+            kwargs = {key: (year if value == ':year' else value) for key, value in kwargs.items()}
+            indexed_ms, result = p50(lambda: app.AIFinanceTracker.query(**kwargs), args.repeat)
+            sql_ms, (count, expenses) = p50(lambda: conn.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM(CASE WHEN t.type = 'expense' THEN t.amount END), 0)
+                FROM transactions AS t JOIN merchants AS m ON m.id = t.merchant_id
+                WHERE {where}
+            ''', params).fetchone(), args.repeat)
+            assert result["count"] == count and abs(result["expenses"] - expenses) < 1e-6 * max(1, expenses), name
+            report["cases"][name] = {"matches": count, "indexed_p50_ms": indexed_ms, "sql_join_p50_ms": sql_ms}
+            print(f"  {name}: {report['cases'][name]}", file=sys.stderr)
+        conn.close()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
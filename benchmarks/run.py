@@ -0,0 +1,213 @@
+"""Time every AIFinanceTracker method and /api/* route against synthetic fixtures
+
+Each case runs once to warm up, then `--repeat` timed runs, plus one extra
+run under tracemalloc for peak Python memory. Results are written as JSON
+to benchmarks/results/ and can be compared against an earlier run.
+
+    python -m benchmarks.run --rows 1000 100000 --repeat 20
+    python -m benchmarks.run --rows 100000 --compare benchmarks/results/<earlier>.json
+    python -m benchmarks.run --rows 100000 --storage memory
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.synthetic import ROOT, fixture_path
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Arguments for methods that need them; called with the run index so writes stay distinct
+METHOD_CALLS = {
+    'add_transaction': lambda i: ((12.5, 'Food', f'benchmark purchase {i}', 'expense'), {'on_duplicate': 'allow'}),
+    'add_transactions': lambda i: (([
+        {"amount": 10 + n, "category": 'Shopping', "description": f'benchmark import {i}-{n}', "type": 'expense'}
+        for n in range(100)
+    ],), {'on_duplicate': 'allow'}),
+    'set_budget': lambda i: (('Food', 500 + i), {}),
+    'set_goal': lambda i: (('Emergency fund', 3000 + i), {'categories': ['Savings'], 'income_share': 0.05}),
+    'simulate_savings': lambda i: ((), {'paths': 2000, 'days': 365, 'seed': i}),
+}
+
+# Request bodies for non-GET routes, keyed by (method, rule)
+ROUTE_CALLS = {
+    ('POST', '/api/transactions'): lambda i: {
+        "amount": 12.5, "category": 'Food', "description": f'benchmark route {i}', "type": 'expense', "on_duplicate": 'allow'
+    },
+    ('POST', '/api/budgets'): lambda i: {"category": 'Shopping', "amount": 300 + i},
+    ('POST', '/api/goals'): lambda i: {"name": 'Vacation', "target": 2000 + i, "income_share": 0.1},
+    ('POST', '/api/simulate'): lambda i: {"paths": 2000, "days": 365, "seed": i},
+}
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def measure(call, repeat):
+    """Time `call(i)` `repeat` times after one warm-up; returns summary stats in ms / KiB"""
+    call(0)
+    timings = []
+    for index in range(1, repeat + 1):
+        started = time.perf_counter()
+        call(index)
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    call(repeat + 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "runs": repeat,
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def method_cases(app):
+    """(name, call) for every public AIFinanceTracker method, plus the ones skipped"""
+    cases, skipped = [], []
+    for name, function in inspect.getmembers(app.AIFinanceTracker, predicate=inspect.isfunction):
+        if name.startswith('_'):
+            continue
+        if name in METHOD_CALLS:
+            build = METHOD_CALLS[name]
+            cases.append((f"method:{name}", lambda i, f=function, b=build: f(*b(i)[0], **b(i)[1])))
+            continue
+        required = [
+            parameter for parameter in inspect.signature(function).parameters.values()
+            if parameter.default is inspect.Parameter.empty
+            and parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)
+        ]
+        if required:
+            skipped.append(f"method:{name}")
+        else:
+            cases.append((f"method:{name}", lambda i, f=function: f()))
+    return cases, skipped
+
+def route_cases(app):
+    """(name, call) for every /api/* route through the Flask test client"""
+    client = app.app.test_client()
+    cases, skipped = [], []
+    for rule in sorted(app.app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if not rule.rule.startswith('/api/'):
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            name = f"route:{method} {rule.rule}"
+            if (method, rule.rule) in ROUTE_CALLS:
+                body = ROUTE_CALLS[(method, rule.rule)]
+                cases.append((name, lambda i, m=method, r=rule.rule, b=body: client.open(r, method=m, json=b(i))))
+            elif method == 'GET' and not rule.arguments:
+                cases.append((name, lambda i, r=rule.rule: client.get(r)))
+            else:
+                skipped.append(name)
+    return cases, skipped
+
+def run(rows, repeat, users, years, seed, only=None, backend='sqlite'):
+    import app
+
+    source = fixture_path(rows, users, years, seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        # Work on a copy: write benchmarks must not change the cached fixture
+        database = os.path.join(workdir, 'ledger.db')
+        shutil.copyfile(source, database)
+        app.DATABASE = database
+        app.init_db()
+        # The memory engine starts from the same rows; SQLite-only analytics still read the copy
+        app.storage = app.MemoryStorage.from_sqlite(database) if backend == 'memory' else app.create_storage(backend)
+
+        methods, skipped_methods = method_cases(app)
+        routes, skipped_routes = route_cases(app)
+        results = {}
+        for name, call in methods + routes:
+            if only and only not in name:
+                continue
+            results[name] = measure(call, repeat)
+            print(f"  {name:<45} p50 {results[name]['p50_ms']:>9.3f} ms  p99 {results[name]['p99_ms']:>9.3f} ms")
+    return results, skipped_methods + skipped_routes
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline, threshold):
+    """Print p50 changes against a baseline; returns the regressed case names"""
+    regressions = []
+    for size, cases in current["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size, {})
+        for name, stats in cases.items():
+            if name not in previous or not previous[name]["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / previous[name]["p50_ms"]
+            marker = ''
+            if ratio > 1 + threshold:
+                marker = '  REGRESSION'
+                regressions.append(f"{size}:{name}")
+            print(f"  [{size}] {name:<45} {previous[name]['p50_ms']:>9.3f} -> {stats['p50_ms']:>9.3f} ms ({ratio:.2f}x){marker}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AIFinanceTracker methods and API routes")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100_000])
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--only', help="run only cases whose name contains this text")
+    parser.add_argument('--storage', default='sqlite', choices=['sqlite', 'memory'], help="ledger storage backend")
+    parser.add_argument('--output', help="results path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', help="earlier results JSON to compare p50 timings against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="p50 slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "users": args.users,
+            "years": args.years,
+            "seed": args.seed,
+            "storage": args.storage,
+        },
+        "sizes": {},
+        "skipped": [],
+    }
+    for rows in args.rows:
+        print(f"rows={rows}")
+        results, skipped = run(rows, args.repeat, args.users, args.years, args.seed, args.only, args.storage)
+        report["sizes"][str(rows)] = results
+        report["skipped"] = sorted(set(report["skipped"]) | set(skipped))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+        handle.write('\n')
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compare JSON encoding of transaction lists: dicts + jsonify vs row encoders
+
+For each size, the same rows are encoded three ways and timed end to end
+(query + encode) and encode-only, with payload sizes raw and gzipped:
+
+- dicts:    dict(row) per sqlite3.Row, then Flask's JSON provider (the old path)
+- objects:  RowEncoder.objects from row tuples (byte-identical to dicts)
+- columnar: RowEncoder.columnar, {"columns": [...], "rows": [[...]]}
+
+    python benchmarks/serialization.py --rows 1000 100000 --repeat 10
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import fixture_path
+
+QUERY = 'SELECT * FROM transactions ORDER BY date DESC, id DESC'
+
+def pipelines(app):
+    dumps = app.app.json.dumps
+
+    def dicts(conn):
+        conn.row_factory = sqlite3.Row
+        return dumps([dict(row) for row in conn.execute(QUERY).fetchall()], separators=(',', ':'))
+
+    def encoder(shape):
+        def encode(conn):
+            conn.row_factory = None
+            cursor = conn.execute(QUERY)
+            rows = cursor.fetchall()
+            columns = tuple(column[0] for column in cursor.description)
+            return app.row_encoder(columns).encode(rows, shape)
+        return encode
+
+    return {'dicts': dicts, 'objects': encoder('objects'), 'columnar': encoder('columnar')}
+
+def best_of(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000, 2)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100_000])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    import app
+
+    results = {}
+    for rows in args.rows:
+        conn = sqlite3.connect(fixture_path(rows))
+        columns = tuple(column[0] for column in conn.execute(QUERY + ' LIMIT 0').description)
+        conn.row_factory = sqlite3.Row
+        as_dicts = [dict(row) for row in conn.execute(QUERY).fetchall()]
+        conn.row_factory = None
+        as_tuples = conn.execute(QUERY).fetchall()
+        encode_only = {
+            'dicts': lambda: app.app.json.dumps(as_dicts, separators=(',', ':')),
+            'objects': lambda: app.row_encoder(columns).objects(as_tuples),
+            'columnar': lambda: app.row_encoder(columns).columnar(as_tuples),
+        }
+
+        sizes, payloads = {}, {}
+        for name, pipeline in pipelines(app).items():
+            payloads[name] = pipeline(conn)
+            sizes[name] = {
+                "total_ms": best_of(lambda: pipeline(conn), args.repeat),
+                "encode_ms": best_of(encode_only[name], args.repeat),
+                "bytes": len(payloads[name]),
+                "gzip_bytes": len(gzip.compress(payloads[name].encode('utf-8'), 6)),
+            }
+        conn.close()
+        if payloads['objects'] != payloads['dicts']:
+            raise SystemExit(f"rows={rows}: row encoder output differs from jsonify output")
+        results[str(rows)] = sizes
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""Deterministic synthetic ledger generator
+
+Each simulated user gets an income profile (monthly or biweekly salary), fixed
+monthly bills, a few subscriptions and day-to-day spending drawn from
+per-category log-normal sizes. The same (rows, users, years, seed, end date)
+always produces the same file, so benchmark runs are comparable. Users'
+histories are interleaved in one file, each row tagged with its user_id;
+each user contributes its own salary, bill and subscription series.
+
+    python -m benchmarks.synthetic --rows 1000000 --years 5 --users 100
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# (category, description choices, median amount, log-normal sigma, mean visits per week)
+DAILY_SPENDING = (
+    ('Food', ('Whole Foods Market', 'Trader Joes', 'Safeway', 'Chipotle', 'Starbucks', 'Local Deli'), 28.0, 0.7, 5.0),
+    ('Transportation', ('Shell Gas', 'Uber Trip', 'Metro Card', 'Parking'), 22.0, 0.6, 1.5),
+    ('Entertainment', ('AMC Theatres', 'Steam Games', 'Concert Tickets', 'Bowling'), 35.0, 0.8, 0.6),
+    ('Shopping', ('Amazon.com', 'Target', 'Best Buy', 'Uniqlo', 'IKEA'), 45.0, 1.0, 1.2),
+    ('Healthcare', ('CVS Pharmacy', 'Dental Care', 'Urgent Care'), 40.0, 0.9, 0.2),
+    ('Other', ('Gift', 'Donation', 'Post Office'), 25.0, 0.9, 0.3),
+)
+
+SUBSCRIPTIONS = (
+    ('Entertainment', 'Netflix.com', 15.49),
+    ('Entertainment', 'Spotify USA', 10.99),
+    ('Entertainment', 'Disney Plus', 7.99),
+    ('Healthcare', 'Gym Membership', 39.99),
+    ('Utilities', 'iCloud Storage', 2.99),
+    ('Shopping', 'Amazon Prime', 14.99),
+)
+
+BILLS = (
+    ('Utilities', 'Electric Company', 95.0),
+    ('Utilities', 'Water Utility', 40.0),
+    ('Utilities', 'Internet Provider', 65.0),
+    ('Utilities', 'Mobile Phone', 55.0),
+)
+
+ROWS_PER_USER_DAY = 1.6  # average of the mix above, used to size the user population
+
+def _profile(rng):
+    """Draw one user's income, bills and subscriptions"""
+    salary = rng.choice((2200, 2600, 3100, 3800, 4500, 6000))
+    subscriptions = rng.sample(SUBSCRIPTIONS, rng.randint(1, len(SUBSCRIPTIONS)))
+    return {
+        "rng": rng,
+        "salary": salary,
+        "biweekly": rng.random() < 0.5,
+        "payday": rng.randint(1, 14),
+        "rent": round(salary * rng.uniform(0.45, 0.7), 2),
+        "subscriptions": subscriptions,
+        "billing_day": {name: rng.randint(1, 28) for _, name, _ in subscriptions + list(BILLS)},
+        "price_bump": {name: 1.15 if rng.random() < 0.33 else 1.0 for _, name, _ in subscriptions},
+        "appetite": rng.uniform(0.6, 1.5),
+    }
+
+def _day_rows(profile, day, offset):
+    """Rows (amount, category, description, type, date) for one user on one day"""
+    rng = profile["rng"]
+    stamp = day.isoformat()
+    salary = profile["salary"]
+    rows = []
+    if profile["biweekly"] and offset % 14 == profile["payday"]:
+        rows.append((salary / 2, 'Salary', 'Employer Payroll', 'income', stamp + ' 09:00:00'))
+    elif not profile["biweekly"] and day.day == profile["payday"]:
+        rows.append((float(salary), 'Salary', 'Employer Payroll', 'income', stamp + ' 09:00:00'))
+    if day.day == 1:
+        rows.append((profile["rent"], 'Other', 'Rent Payment', 'expense', stamp + ' 08:00:00'))
+    billing_day = profile["billing_day"]
+    for category, name, price in profile["subscriptions"]:
+        if day.day == billing_day[name]:
+            # Some subscriptions get a price increase after the first year
+            bumped = price * (profile["price_bump"][name] if offset > 365 else 1.0)
+            rows.append((round(bumped, 2), category, name, 'expense', stamp + ' 07:00:00'))
+    for category, name, average in BILLS:
+        if day.day == billing_day[name]:
+            rows.append((round(average * rng.uniform(0.8, 1.25), 2), category, name, 'expense', stamp + ' 07:30:00'))
+    for category, merchants, median, sigma, weekly in DAILY_SPENDING:
+        visits = weekly * profile["appetite"] / 7
+        while visits > 0:
+            if rng.random() < min(visits, 1.0):
+                amount = round(median * math.exp(rng.gauss(0, sigma)), 2)
+                rows.append((amount, category, rng.choice(merchants), 'expense',
+                             f"{stamp} {rng.randint(8, 21):02d}:{rng.randint(0, 59):02d}:00"))
+            visits -= 1
+    return rows
+
+def generate_rows(rows, users=None, years=3, seed=1234, end=None):
+    """Yield exactly `rows` rows as (id, user_id, amount, category, description, type, date), newest day first
+
+    Days are generated from `end` backwards across all users, so trimming to
+    the requested row count drops the oldest history rather than recent
+    activity. Ids count down from `rows`, which keeps id order equal to date
+    order once the rows are in the table.
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    days = int(years * 365)
+    needed = math.ceil(rows / (days * ROWS_PER_USER_DAY) * 1.1)
+    profiles = [_profile(random.Random(rng.random())) for _ in range(max(users or 0, needed, 1))]
+    next_id = rows
+    first_user = 1
+    while True:
+        for offset in reversed(range(days)):
+            day = end - timedelta(days=days - 1 - offset)
+            for user_id, profile in enumerate(profiles, first_user):
+                for row in _day_rows(profile, day, offset):
+                    yield (next_id, user_id) + row
+                    next_id -= 1
+                    if next_id == 0:
+                        return
+        # The estimate fell short: add another cohort and keep going back over the same window
+        first_user += len(profiles)
+        profiles = [_profile(random.Random(rng.random())) for _ in range(len(profiles))]
+
+def build_fixture(path, rows, users=None, years=3, seed=1234, derived=True):
+    """Write a ledger fixture to `path` through the app's schema; returns the path
+
+    Raw rows are bulk-loaded, then `init_db(force=True)` backfills the derived
+    tables (fingerprints, balance series, sketches) exactly as it would for an
+    existing database.
+    """
+    import app
+
+    if os.path.exists(path):
+        os.remove(path)
+    previous = app.DATABASE
+    app.DATABASE = path
+    try:
+        app.init_db()
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA synchronous=OFF')
+        # Empty the derived tables so init_db() rebuilds them from the raw rows
+        conn.execute('DELETE FROM balance_daily')
+        conn.execute('DELETE FROM spending_sketches')
+        conn.execute('DELETE FROM currency_daily')
+        generator = generate_rows(rows, users, years, seed)
+        while True:
+            chunk = [row for _, row in zip(range(50_000), generator)]
+            if not chunk:
+                break
+            conn.executemany(
+                'INSERT INTO transactions (id, user_id, amount, category, description, type, date) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                chunk
+            )
+        conn.commit()
+        conn.close()
+        if derived:
+            app.init_db(force=True)
+    finally:
+        app.DATABASE = previous
+    return path
+
+def fixture_path(rows, users=None, years=3, seed=1234):
+    """Cached fixture location for a parameter set, built on first use
+
+    History always ends today so the app's "last 30 days" queries see data;
+    the date is part of the name so a cached fixture never goes stale.
+    """
+    name = f"ledger-r{rows}-u{users or 'auto'}-y{years:g}-s{seed}-{date.today():%Y%m%d}.db"
+    path = os.path.join(FIXTURE_DIR, name)
+    if not os.path.exists(path):
+        os.makedirs(FIXTURE_DIR, exist_ok=True)
+        build_fixture(path + '.tmp', rows, users, years, seed)
+        os.replace(path + '.tmp', path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a synthetic ledger fixture")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--out', help="output path (default: cached under benchmarks/fixtures/)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.out:
+        path = build_fixture(args.out, args.rows, args.users, args.years, args.seed)
+    else:
+        path = fixture_path(args.rows, args.users, args.years, args.seed)
+    print(f"{path}: {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()